@@ -1,15 +1,30 @@
 # Flask framework import kar rahe hain web application banane ke liye
-from flask import Flask, request, jsonify, render_template, send_file
-import os, shutil, json, base64
+from flask import Flask, request, jsonify, render_template, Response, g
+import os, re, io, shutil, unicodedata, json, base64, uuid, threading, time, hashlib, sqlite3, zlib, random
+import multiprocessing, copy, logging, bisect, contextvars, gzip, subprocess, urllib.parse, zipfile
+from contextlib import contextmanager
+from collections import OrderedDict, deque, namedtuple
+from functools import lru_cache, cached_property
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, Future
+from concurrent.futures.process import BrokenProcessPool
 from werkzeug.utils import secure_filename
-from PIL import Image
+from werkzeug.wsgi import wrap_file
+from werkzeug.exceptions import RequestEntityTooLarge, RequestedRangeNotSatisfiable
+from werkzeug.sansio.multipart import MultipartDecoder, Field, File, Data, Epilogue, NeedData
+from PIL import Image, ImageOps, ImageFile
+import numpy as np
+import cv2
+import httpx
+import openai
 from openai import OpenAI
 from datetime import datetime
+from array import array
+from pydantic import BaseModel, ConfigDict, ValidationError, field_validator
 
 # PDF (ReportLab) + Urdu shaping/bidi
 from reportlab.lib.pagesizes import A4
 from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer,Flowable
+from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer,Flowable, PageBreak
 from reportlab.lib.colors import HexColor, Color
 from reportlab.pdfgen import canvas
 from reportlab.lib.enums import TA_CENTER, TA_RIGHT, TA_LEFT
@@ -19,15 +34,273 @@ import arabic_reshaper
 from bidi.algorithm import get_display
 
 app = Flask(__name__)
-client = OpenAI()
 
 CHAPTERS_DIR = 'chapters'
 FONTS_DIR = 'fonts'
 URDU_FONT_FILE = os.path.join(FONTS_DIR, 'NotoNaskhArabic-Regular.ttf')
 URDU_FONT_NAME = 'NotoNaskhArabic'
 
-if not os.path.exists(CHAPTERS_DIR):
-    os.makedirs(CHAPTERS_DIR)
+# Runtime state (jobs, caches, indexes) — chapters/ mein nahi, warna get-chapters unhe chapter samjhega
+DATA_DIR = os.environ.get('NOTES_DATA_DIR', 'data')
+JOBS_DIR = os.path.join(DATA_DIR, 'jobs')
+DERIVATIVES_DIR = os.path.join(DATA_DIR, 'derivatives')
+
+for _d in (CHAPTERS_DIR, JOBS_DIR, DERIVATIVES_DIR):
+    if not os.path.exists(_d):
+        os.makedirs(_d)
+
+# ------------ Observability: metrics (/metrics), structured logs, sampled traces ------------
+# Metrics har process ke apne hain (gunicorn worker => /metrics us worker ka hissa dikhata hai),
+# is liye har sample par worker="<pid>" label hota hai: har worker ki series alag rehti hai aur
+# scrape kisi aur worker par jaye to counters "reset" nahi lagte. Dashboards mein sum without (worker).
+# Render processes ke numbers Future result ke zariye parent mein record hote hain.
+
+LOG_LEVEL = os.environ.get('LOG_LEVEL', 'INFO').upper()
+LOG_FORMAT = os.environ.get('LOG_FORMAT', 'json')                          # json | text
+TRACE_SAMPLE_RATE = float(os.environ.get('TRACE_SAMPLE_RATE', '0'))        # 0..1, ?trace=1 hamesha trace karta hai
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+BYTES_BUCKETS = tuple(64 * 1024 * 4 ** i for i in range(8))               # 64KB .. 1GB
+TOKEN_BUCKETS = (16, 64, 128, 256, 512, 1024, 2048, 4096, 8192, 16384)
+PAGE_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500)
+
+_METRICS = []
+
+def _format_metric_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+def _escape_label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+class Metric:
+    type = 'untyped'
+
+    def __init__(self, name, help_text, labelnames=()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+        _METRICS.append(self)
+
+    def _key(self, labels):
+        return tuple(str(labels.get(name, '')) for name in self.labelnames)
+
+class Counter(Metric):
+    type = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            items = list(self._values.items())
+        for key, value in items:
+            yield self.name, key, (), value
+
+class Histogram(Metric):
+    type = 'histogram'
+
+    def __init__(self, name, help_text, labelnames=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, help_text, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [[0] * len(self.buckets), 0.0, 0]
+            index = bisect.bisect_left(self.buckets, value)   # le => value == bound usi bucket mein
+            if index < len(self.buckets):
+                state[0][index] += 1
+            state[1] += value
+            state[2] += 1
+
+    def samples(self):
+        with self._lock:
+            items = [(key, (list(counts), total, count)) for key, (counts, total, count) in self._values.items()]
+        for key, (counts, total, count) in items:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                yield f"{self.name}_bucket", key, (('le', _format_metric_value(bound)),), cumulative
+            yield f"{self.name}_bucket", key, (('le', '+Inf'),), count
+            yield f"{self.name}_sum", key, (), total
+            yield f"{self.name}_count", key, (), count
+
+class GaugeFunction(Metric):
+    """Scrape ke waqt fn() se value (queue depth waghera)."""
+    type = 'gauge'
+
+    def __init__(self, name, help_text, fn):
+        super().__init__(name, help_text)
+        self.fn = fn
+
+    def samples(self):
+        yield self.name, (), (), self.fn()
+
+def render_prometheus():
+    """Prometheus text exposition format (0.0.4)."""
+    lines = []
+    worker = (('worker', str(os.getpid())),)
+    for metric in _METRICS:
+        lines.append(f"# HELP {metric.name} {metric.help}")
+        lines.append(f"# TYPE {metric.name} {metric.type}")
+        for sample_name, key, extra, value in metric.samples():
+            labels = list(worker) + list(zip(metric.labelnames, key)) + list(extra)
+            label_text = '{' + ','.join(f'{k}="{_escape_label(v)}"' for k, v in labels) + '}' if labels else ''
+            lines.append(f"{sample_name}{label_text} {_format_metric_value(value)}")
+    return "\n".join(lines) + "\n"
+
+HTTP_REQUEST_SECONDS = Histogram('notes_http_request_seconds', 'HTTP request time until response headers.',
+                                 ('method', 'endpoint', 'status'))
+STAGE_SECONDS = Histogram('notes_stage_seconds', 'Time spent per pipeline stage (every span).', ('stage',))
+UPLOAD_BYTES = Histogram('notes_upload_bytes', 'Bytes received per chapter upload request.', buckets=BYTES_BUCKETS)
+UPLOAD_FILES = Counter('notes_upload_files_total', 'Image files stored from uploads.')
+ENCODE_SECONDS = Histogram('notes_base64_encode_seconds', 'Time to read and base64-encode one image.')
+MODEL_SECONDS = Histogram('notes_model_request_seconds', 'Model request latency including retries.', ('outcome',))
+MODEL_FIRST_TOKEN_SECONDS = Histogram('notes_model_first_token_seconds', 'Time to first streamed token.')
+MODEL_TOKENS = Histogram('notes_model_tokens', 'Tokens per model response.', ('direction',), buckets=TOKEN_BUCKETS)
+MODEL_RETRIES = Counter('notes_model_retries_total', 'Model request retries by error type.', ('error',))
+MODEL_TRUNCATED = Counter('notes_model_truncated_total', 'Model responses cut off at max_tokens (finish_reason=length).')
+MODEL_COALESCED = Counter('notes_model_coalesced_total', 'Model requests served by an identical in-flight call.')
+JSON_PARSE_FAILURES = Counter('notes_json_parse_failures_total', 'Model output that could not be parsed.', ('kind',))
+PDF_RENDER_SECONDS = Histogram('notes_pdf_render_seconds', 'PDF render time inside the render process.')
+PDF_PAGES = Histogram('notes_pdf_pages', 'Pages per rendered PDF.', buckets=PAGE_BUCKETS)
+PDF_DOWNLOADS = Counter('notes_pdf_downloads_total', 'PDF download responses by kind.', ('kind',))
+EXPORTS_TOTAL = Counter('notes_exports_total', 'Bulk exports by format and status.', ('format', 'status'))
+EXPORT_BYTES = Histogram('notes_export_bytes', 'Bytes streamed per bulk export.', ('format',), buckets=BYTES_BUCKETS)
+JOB_SECONDS = Histogram('notes_job_seconds', 'End-to-end job time.', ('kind', 'status'))
+JOBS_TOTAL = Counter('notes_jobs_total', 'Finished jobs.', ('kind', 'status'))
+
+class JsonLogFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            'ts': datetime.fromtimestamp(record.created).isoformat(timespec='milliseconds'),
+            'level': record.levelname.lower(),
+            'event': record.getMessage(),
+            'pid': record.process,
+            'thread': record.threadName,
+        }
+        trace = _current_trace.get()
+        if trace is not None:
+            entry['trace_id'] = trace.id
+        entry.update(getattr(record, 'fields', {}))
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+class TextLogFormatter(logging.Formatter):
+    def format(self, record):
+        fields = ' '.join(f"{k}={v}" for k, v in getattr(record, 'fields', {}).items())
+        return f"{datetime.fromtimestamp(record.created):%Y-%m-%d %H:%M:%S} {record.levelname:<7} {record.getMessage()} {fields}".rstrip()
+
+logger = logging.getLogger('notes')
+if not logger.handlers:
+    _log_handler = logging.StreamHandler()
+    _log_handler.setFormatter(JsonLogFormatter() if LOG_FORMAT == 'json' else TextLogFormatter())
+    logger.addHandler(_log_handler)
+    logger.setLevel(LOG_LEVEL)
+    logger.propagate = False
+
+def log_event(level, event, **fields):
+    """Structured log: event naam + key/value fields (json ya text format)."""
+    logger.log(getattr(logging, level.upper()), event, extra={'fields': fields})
+
+# ---- Tracing: request/job ke andar spans; sirf sampled traces store hote hain ----
+_current_trace = contextvars.ContextVar('notes_trace', default=None)
+_current_span = contextvars.ContextVar('notes_span', default=None)
+
+class Trace:
+    def __init__(self, trace_id=None):
+        self.id = trace_id or uuid.uuid4().hex[:16]
+        self.start = time.perf_counter()
+        self.spans = []
+        self._lock = threading.Lock()
+
+    def add(self, record):
+        with self._lock:
+            self.spans.append(record)
+
+    def export(self):
+        with self._lock:
+            return sorted(self.spans, key=lambda s: s['start_ms'])
+
+def should_trace(flag=None):
+    if flag is not None and str(flag).lower() in ('1', 'true', 'yes'):
+        return True
+    return TRACE_SAMPLE_RATE > 0 and random.random() < TRACE_SAMPLE_RATE
+
+@contextmanager
+def start_trace(trace_id=None):
+    trace = Trace(trace_id)
+    token = _current_trace.set(trace)
+    try:
+        yield trace
+    finally:
+        _current_trace.reset(token)
+
+@contextmanager
+def span(name, **attrs):
+    """Stage timing: notes_stage_seconds hamesha; trace active ho to span bhi record hota hai.
+
+    Yielded dict mein attributes baad mein bhi daal sakte hain (e.g. token count).
+    """
+    trace = _current_trace.get()
+    parent = _current_span.get()
+    span_id = uuid.uuid4().hex[:8] if trace is not None else None
+    token = _current_span.set(span_id) if trace is not None else None
+    start = time.perf_counter()
+    try:
+        yield attrs
+    except BaseException as e:
+        attrs['error'] = f"{e.__class__.__name__}: {e}"
+        raise
+    finally:
+        duration = time.perf_counter() - start
+        STAGE_SECONDS.observe(duration, stage=name)
+        if trace is not None:
+            _current_span.reset(token)
+            trace.add({'id': span_id, 'parent': parent, 'name': name,
+                       'start_ms': round((start - trace.start) * 1000, 2),
+                       'duration_ms': round(duration * 1000, 2), **({'attrs': attrs} if attrs else {})})
+
+def submit_in_context(executor, fn, *args):
+    """Executor threads tak trace/span context le jao."""
+    return executor.submit(contextvars.copy_context().run, fn, *args)
+
+@app.before_request
+def _start_request_instrumentation():
+    g.request_start = time.perf_counter()
+    if should_trace(request.args.get('trace') or request.headers.get('X-Trace')):
+        g.trace = Trace()
+        g.trace_token = _current_trace.set(g.trace)
+
+@app.after_request
+def _finish_request_instrumentation(response):
+    elapsed = time.perf_counter() - g.get('request_start', time.perf_counter())
+    endpoint = request.url_rule.rule if request.url_rule else 'unmatched'
+    HTTP_REQUEST_SECONDS.observe(elapsed, method=request.method, endpoint=endpoint, status=response.status_code)
+    trace = g.get('trace')
+    if trace is not None:
+        spans = trace.export()
+        response.headers['X-Trace-Id'] = trace.id
+        response.headers['Server-Timing'] = ', '.join(
+            [f"total;dur={elapsed * 1000:.1f}"] + [f"{s['name']};dur={s['duration_ms']}" for s in spans if s['parent'] is None])
+        log_event('info', 'request_trace', method=request.method, path=request.path, status=response.status_code,
+                  duration_ms=round(elapsed * 1000, 2), spans=spans)
+    return response
+
+@app.teardown_request
+def _reset_request_trace(_error):
+    token = g.pop('trace_token', None)
+    if token is not None:
+        _current_trace.reset(token)
 
 ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif', 'bmp', 'webp'}
 
@@ -36,48 +309,969 @@ def allowed_file(filename):
 
 def encode_image_to_base64(image_path):
     try:
+        start = time.perf_counter()
         with open(image_path, "rb") as image_file:
-            return base64.b64encode(image_file.read()).decode('utf-8')
+            encoded = base64.b64encode(image_file.read()).decode('utf-8')
+        ENCODE_SECONDS.observe(time.perf_counter() - start)
+        return encoded
     except Exception as e:
-        print(f"Error encoding image: {e}")
+        log_event('error', 'image_encode_failed', path=image_path, error=str(e))
         return None
 
-def process_folder_images_batch(chapter_path):
+# ------------ Image preprocessing (payload chhota karo, encoding se pehle) ------------
+
+PREPROCESS_ENABLED = os.environ.get('PREPROCESS_ENABLED', '1') == '1'
+PREPROCESS_MAX_EDGE = int(os.environ.get('PREPROCESS_MAX_EDGE', '1600'))
+PREPROCESS_FORMAT = os.environ.get('PREPROCESS_FORMAT', 'JPEG').upper()   # JPEG ya WEBP
+PREPROCESS_QUALITY = int(os.environ.get('PREPROCESS_QUALITY', '80'))
+PREPROCESS_GRAYSCALE = os.environ.get('PREPROCESS_GRAYSCALE', '1') == '1'
+PREPROCESS_DESKEW = os.environ.get('PREPROCESS_DESKEW', '1') == '1'
+PREPROCESS_WORKERS = int(os.environ.get('PREPROCESS_WORKERS', str(min(4, os.cpu_count() or 1))))
+PREPROCESS_VERSION = 1
+# Derivatives ki safai: itne din istemal na hon to hatao, aur kul size is had se upar ho to sab se purane
+DERIVATIVES_MAX_AGE_DAYS = float(os.environ.get('DERIVATIVES_MAX_AGE_DAYS', '30'))
+DERIVATIVES_MAX_BYTES = int(os.environ.get('DERIVATIVES_MAX_BYTES', str(2 * 1024 ** 3)))
+DERIVATIVES_PRUNE_INTERVAL = 3600   # seconds, prepare_images se zyada se zyada itni dafa
+DERIVATIVES_MIN_AGE = 3600          # itne naye derivatives kabhi nahi hatte (abhi kisi job mein istemal ho sakte hain)
+
+IMAGE_MIME_TYPES = {'jpg': 'image/jpeg', 'jpeg': 'image/jpeg', 'png': 'image/png', 'gif': 'image/gif',
+                    'bmp': 'image/bmp', 'webp': 'image/webp'}
+
+def image_mime_type(path):
+    return IMAGE_MIME_TYPES.get(path.rsplit('.', 1)[-1].lower(), 'image/jpeg')
+
+def _preprocess_settings():
+    return (PREPROCESS_VERSION, PREPROCESS_MAX_EDGE, PREPROCESS_FORMAT, PREPROCESS_QUALITY,
+            PREPROCESS_GRAYSCALE, PREPROCESS_DESKEW)
+
+def preprocess_settings_digest():
+    # Preprocessing band ho to model asal image dekhta hai
+    if not PREPROCESS_ENABLED:
+        return 'raw'
+    return hashlib.sha256(repr(_preprocess_settings()).encode()).hexdigest()[:12]
+
+def derivative_path(image_sha256):
+    settings_digest = preprocess_settings_digest()
+    ext = 'webp' if PREPROCESS_FORMAT == 'WEBP' else 'jpg'
+    return os.path.join(DERIVATIVES_DIR, f"{image_sha256}_{settings_digest}.{ext}")
+
+def _deskew(gray):
+    # Text pixels ka min-area rectangle => page ka jhukav (degrees)
+    _, binary = cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY_INV | cv2.THRESH_OTSU)
+    coords = cv2.findNonZero(binary)
+    if coords is None:
+        return gray
+    angle = cv2.minAreaRect(coords)[-1]
+    if angle > 45:
+        angle -= 90
+    elif angle < -45:
+        angle += 90
+    if abs(angle) < 0.3 or abs(angle) > 15:   # seedha hai, ya andaza ghalat lagta hai
+        return gray
+    h, w = gray.shape[:2]
+    matrix = cv2.getRotationMatrix2D((w / 2, h / 2), angle, 1.0)
+    return cv2.warpAffine(gray, matrix, (w, h), flags=cv2.INTER_CUBIC, borderMode=cv2.BORDER_REPLICATE)
+
+def _crop_border(gray, pad_ratio=0.02):
+    _, binary = cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY_INV | cv2.THRESH_OTSU)
+    coords = cv2.findNonZero(binary)
+    if coords is None:
+        return gray
+    x, y, w, h = cv2.boundingRect(coords)
+    img_h, img_w = gray.shape[:2]
+    if w * h < 0.2 * img_w * img_h:   # itna kam content => crop par bharosa nahi
+        return gray
+    pad_x, pad_y = int(img_w * pad_ratio), int(img_h * pad_ratio)
+    return gray[max(0, y - pad_y):min(img_h, y + h + pad_y), max(0, x - pad_x):min(img_w, x + w + pad_x)]
+
+def preprocess_image(image_path, dest_path):
+    """EXIF rotate -> downscale -> grayscale/contrast -> deskew -> border crop -> re-encode.
+
+    Process pool mein chalta hai; (original_bytes, processed_bytes) return karta hai.
+    """
+    with Image.open(image_path) as img:
+        img = ImageOps.exif_transpose(img)
+        img.thumbnail((PREPROCESS_MAX_EDGE, PREPROCESS_MAX_EDGE), Image.LANCZOS)
+        if PREPROCESS_GRAYSCALE:
+            pixels = np.asarray(img.convert('L'))
+            if PREPROCESS_DESKEW:
+                pixels = _deskew(pixels)
+            pixels = _crop_border(pixels)
+            pixels = cv2.createCLAHE(clipLimit=2.0, tileGridSize=(8, 8)).apply(pixels)
+            out = Image.fromarray(pixels)
+        else:
+            out = ImageOps.autocontrast(img.convert('RGB'), cutoff=1)
+
+    buffer = io.BytesIO()
+    out.save(buffer, format=PREPROCESS_FORMAT, quality=PREPROCESS_QUALITY, optimize=True)
+    tmp_path = f"{dest_path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(buffer.getvalue())
+    os.replace(tmp_path, dest_path)
+    return os.path.getsize(image_path), len(buffer.getvalue())
+
+_process_pools = {}
+_process_pools_lock = threading.Lock()
+
+def get_process_pool(name, max_workers, initializer=None):
+    """Naam se shared, lazily bana hua ProcessPoolExecutor."""
+    with _process_pools_lock:
+        pool = _process_pools.get(name)
+        if pool is None:
+            # spawn: threads wale parent process ko fork karna deadlock kar sakta hai
+            pool = _process_pools[name] = ProcessPoolExecutor(max_workers=max_workers,
+                                                              mp_context=multiprocessing.get_context('spawn'),
+                                                              initializer=initializer)
+        return pool
+
+def prepare_images(image_paths, image_hashes, stats=None):
+    """Har image ke liye (path, mime) jo model ko bhejna hai; derivatives data/derivatives mein cache hote hain."""
+    prepared = [(path, image_mime_type(path)) for path in image_paths]
+    if not PREPROCESS_ENABLED or not image_paths:
+        return prepared
+
+    bytes_original = bytes_sent = 0
+    pending = {}
+    for i, (path, sha) in enumerate(zip(image_paths, image_hashes)):
+        dest = derivative_path(sha)
+        try:
+            os.utime(dest)   # mtime = aakhri istemal, prune_derivatives isi se umar dekhta hai
+            exists = True
+        except FileNotFoundError:
+            exists = False
+        if exists:
+            bytes_original += os.path.getsize(path)
+            bytes_sent += os.path.getsize(dest)
+            prepared[i] = (dest, image_mime_type(dest))
+        else:
+            pending[i] = dest
+    if pending:
+        pool = get_process_pool('preprocess', PREPROCESS_WORKERS)
+        futures = {i: pool.submit(preprocess_image, image_paths[i], dest) for i, dest in pending.items()}
+        for i, future in futures.items():
+            try:
+                original_size, processed_size = future.result()
+            except Exception as e:
+                log_event('warning', 'preprocess_failed', path=image_paths[i], error=str(e))
+                continue
+            bytes_original += original_size
+            bytes_sent += processed_size
+            prepared[i] = (pending[i], image_mime_type(pending[i]))
+
+    if stats is not None:
+        stats['bytes_original'] = stats.get('bytes_original', 0) + bytes_original
+        stats['bytes_sent'] = stats.get('bytes_sent', 0) + bytes_sent
+        stats['bytes_saved'] = stats['bytes_original'] - stats['bytes_sent']
+    if pending:
+        maybe_prune_derivatives()
+    return prepared
+
+def prune_derivatives(max_age_days=None, max_bytes=None):
+    """Purane derivatives hatao (age, phir kul size par LRU); (removed, bytes_freed) return karta hai."""
+    max_age_days = DERIVATIVES_MAX_AGE_DAYS if max_age_days is None else max_age_days
+    max_bytes = DERIVATIVES_MAX_BYTES if max_bytes is None else max_bytes
+    now = time.time()
+    entries = []
+    with os.scandir(DERIVATIVES_DIR) as it:
+        for entry in it:
+            if entry.is_file() and not entry.name.endswith('.tmp'):
+                stat = entry.stat()
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+    entries.sort()   # sab se purana pehle
+    total = sum(size for _, size, _ in entries)
+    removed = freed = 0
+    for mtime, size, path in entries:
+        too_old = now - mtime > max_age_days * 86400
+        if not too_old and total <= max_bytes:
+            break
+        try:
+            if now - os.path.getmtime(path) < DERIVATIVES_MIN_AGE:
+                continue   # beech mein kisi job ne istemal kiya
+            os.remove(path)
+        except OSError:
+            continue
+        total -= size
+        removed += 1
+        freed += size
+    if removed:
+        log_event('info', 'derivatives_pruned', removed=removed, bytes_freed=freed, bytes_kept=total)
+    return removed, freed
+
+_derivatives_pruned_at = None
+_derivatives_prune_lock = threading.Lock()
+
+def maybe_prune_derivatives():
+    global _derivatives_pruned_at
+    with _derivatives_prune_lock:
+        now = time.monotonic()
+        if _derivatives_pruned_at is not None and now - _derivatives_pruned_at < DERIVATIVES_PRUNE_INTERVAL:
+            return
+        _derivatives_pruned_at = now
     try:
-        image_files = [f for f in os.listdir(chapter_path)
-                       if os.path.isfile(os.path.join(chapter_path, f))
-                       and allowed_file(f)]
-        if not image_files:
-            return None
+        prune_derivatives()
+    except OSError as e:
+        log_event('warning', 'derivatives_prune_failed', error=str(e))
+
+# ------------ Streaming upload ingest + chapter manifest ------------
+
+UPLOAD_MAX_FILE_BYTES = int(os.environ.get('UPLOAD_MAX_FILE_BYTES', str(25 * 1024 * 1024)))
+UPLOAD_MAX_REQUEST_BYTES = int(os.environ.get('UPLOAD_MAX_REQUEST_BYTES', str(200 * 1024 * 1024)))
+UPLOAD_CHUNK_SIZE = 64 * 1024
+UPLOAD_HEADER_PROBE_BYTES = 256 * 1024   # dimensions ke liye sirf shuru ke bytes PIL parser ko do
+MANIFEST_FILE = 'manifest.json'
+
+def manifest_path(chapter_folder):
+    return os.path.join(chapter_folder, MANIFEST_FILE)
+
+def load_chapter_manifest(chapter_folder):
+    try:
+        with open(manifest_path(chapter_folder), 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return None
+
+def update_chapter_manifest(chapter_folder, entries):
+    manifest = load_chapter_manifest(chapter_folder) or {'images': {}}
+    manifest['images'].update(entries)
+    write_json_atomic(manifest_path(chapter_folder), manifest)
+    return manifest
+
+def build_chapter_manifest(chapter_folder):
+    """Purane (manifest ke baghair) chapters ke liye disk se manifest banao."""
+    entries = {}
+    for file_name in os.listdir(chapter_folder):
+        file_path = os.path.join(chapter_folder, file_name)
+        if not (os.path.isfile(file_path) and allowed_file(file_name)):
+            continue
+        try:
+            with Image.open(file_path) as img:
+                width, height = img.size
+        except Exception:
+            width = height = None
+        entries[file_name] = {
+            'sha256': file_sha256(file_path),
+            'size': os.path.getsize(file_path),
+            'width': width,
+            'height': height,
+            'uploaded_at': datetime.fromtimestamp(os.path.getmtime(file_path)).strftime('%Y-%m-%d %H:%M:%S'),
+        }
+    return update_chapter_manifest(chapter_folder, entries)
+
+def chapter_image_entries(chapter_folder):
+    """[(filename, sha256)] page order mein — folder dobara scan/read kiye baghair."""
+    manifest = load_chapter_manifest(chapter_folder) or build_chapter_manifest(chapter_folder)
+    return [(name, manifest['images'][name]['sha256'])
+            for name in sorted(manifest['images'], key=_page_sort_key)]
+
+class _UploadSink:
+    """Ek file part ko chunks mein disk par likhta hai, saath saath hash + dimensions."""
+    def __init__(self, chapter_folder, filename):
+        self.chapter_folder = chapter_folder
+        self.filename = filename
+        self.tmp_path = os.path.join(chapter_folder, f".upload-{uuid.uuid4().hex}.part")
+        self.file = open(self.tmp_path, 'wb')
+        self.digest = hashlib.sha256()
+        self.parser = ImageFile.Parser()
+        self.size = 0
+        self.dimensions = None
+
+    def write(self, data):
+        self.size += len(data)
+        if self.size > UPLOAD_MAX_FILE_BYTES:
+            raise RequestEntityTooLarge(f"{self.filename} is larger than {UPLOAD_MAX_FILE_BYTES} bytes")
+        self.file.write(data)
+        self.digest.update(data)
+        if self.dimensions is None and self.size - len(data) < UPLOAD_HEADER_PROBE_BYTES:
+            try:
+                self.parser.feed(bytes(data))
+                if self.parser.image is not None:
+                    self.dimensions = self.parser.image.size
+            except Exception:
+                self.dimensions = (None, None)
+
+    def finish(self):
+        """Part poora mila: file band karo aur manifest entry do. Rename commit() mein hota hai."""
+        self.file.close()
+        width, height = self.dimensions or (None, None)
+        return {
+            'sha256': self.digest.hexdigest(),
+            'size': self.size,
+            'width': width,
+            'height': height,
+            'uploaded_at': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+        }
+
+    def commit(self):
+        os.replace(self.tmp_path, os.path.join(self.chapter_folder, self.filename))
+
+    def abort(self):
+        self.file.close()
+        try:
+            os.remove(self.tmp_path)
+        except FileNotFoundError:
+            pass
+
+def ingest_chapter_upload(req):
+    """multipart body ko stream karke parse karta hai (Werkzeug poori body buffer nahi karta).
+
+    chaptersData field file parts se pehle aani chahiye (frontend pehle hi append karta hai).
+    Return: chapters_info — har chapter ke andar 'folder' aur 'manifest_entries' add kiye hue.
+    All-or-nothing: files .part ki shakal mein rehti hain aur sirf poori request kamyab hone par
+    apne naam se rakhi jaati hain (phir manifest). Koi bhi error — 413, toota hua body, ghalat
+    JSON — ho to saari .part files aur is request ke banaye hue folders hata diye jaate hain.
+    """
+    if req.content_length and req.content_length > UPLOAD_MAX_REQUEST_BYTES:
+        raise RequestEntityTooLarge(f"Upload is larger than {UPLOAD_MAX_REQUEST_BYTES} bytes")
+    boundary = req.mimetype_params.get('boundary')
+    if req.mimetype != 'multipart/form-data' or not boundary:
+        raise ValueError('Expected multipart/form-data upload')
+
+    decoder = MultipartDecoder(boundary.encode('latin-1'), max_form_memory_size=1024 * 1024)
+    chapters_info = None
+    image_targets = {}     # "image_<id>" -> chapter dict
+    part = None            # ('field', name, bytearray) | ('file', chapter, sink) | ('skip',)
+    total = 0
+    open_sinks = []
+    finished_sinks = []    # mukammal parts, commit ka intezar
+    created_folders = []
+    complete = False
+    try:
+        while True:
+            chunk = req.stream.read(UPLOAD_CHUNK_SIZE)
+            total += len(chunk)
+            if total > UPLOAD_MAX_REQUEST_BYTES:
+                raise RequestEntityTooLarge(f"Upload is larger than {UPLOAD_MAX_REQUEST_BYTES} bytes")
+            decoder.receive_data(chunk or None)
+            event = decoder.next_event()
+            while not isinstance(event, (NeedData, Epilogue)):
+                if isinstance(event, Field):
+                    part = ('field', event.name, bytearray())
+                elif isinstance(event, File):
+                    chapter = image_targets.get(event.name)
+                    if event.name.startswith('image_') and chapters_info is None:
+                        raise ValueError('Chapter data not found')
+                    if chapter and event.filename and allowed_file(event.filename):
+                        sink = _UploadSink(chapter['folder'], secure_filename(event.filename))
+                        open_sinks.append(sink)
+                        part = ('file', chapter, sink)
+                    else:
+                        part = ('skip',)
+                elif isinstance(event, Data):
+                    if part[0] == 'field':
+                        part[2].extend(event.data)
+                    elif part[0] == 'file':
+                        part[2].write(event.data)
+                    if not event.more_data:
+                        if part[0] == 'field' and part[1] == 'chaptersData':
+                            chapters_info = json.loads(part[2].decode('utf-8'))
+                            for chapter in chapters_info['chapters']:
+                                chapter['folder'] = os.path.join(CHAPTERS_DIR, secure_filename(chapter['name']))
+                                chapter['manifest_entries'] = {}
+                                if not os.path.isdir(chapter['folder']):
+                                    os.makedirs(chapter['folder'])
+                                    created_folders.append(chapter['folder'])
+                                for image_info in chapter['images']:
+                                    image_targets[f"image_{image_info['id']}"] = chapter
+                        elif part[0] == 'file':
+                            sink = part[2]
+                            part[1]['manifest_entries'][sink.filename] = sink.finish()
+                            open_sinks.remove(sink)
+                            finished_sinks.append(sink)
+                        part = None
+                event = decoder.next_event()
+            if isinstance(event, Epilogue):
+                complete = True
+                break
+            if not chunk:
+                break
+        if not complete:
+            raise ValueError('Upload ended before the multipart body was complete')
+        if chapters_info is None:
+            raise ValueError('Chapter data not found')
+        for sink in finished_sinks:
+            sink.commit()
+    except BaseException:
+        for sink in open_sinks + finished_sinks:
+            sink.abort()
+        for folder in created_folders:
+            try:
+                os.rmdir(folder)   # sirf agar khali ho (koi aur upload us mein na likh raha ho)
+            except OSError:
+                pass
+        raise
+
+    UPLOAD_BYTES.observe(total)
+    UPLOAD_FILES.inc(len(finished_sinks))
+    for chapter in chapters_info['chapters']:
+        update_chapter_manifest(chapter['folder'], chapter['manifest_entries'])
+    return chapters_info
+
+# ------------ Model gateway (pooled client, retries, coalescing, metrics) ------------
+# Saari model calls isi se guzarti hain. Backend koi bhi OpenAI-compatible object ho sakta hai;
+# MODEL_BASE_URL se local fake server par bhi chala sakte hain (tests / load tests).
+
+MODEL_BASE_URL = os.environ.get('MODEL_BASE_URL') or None
+MODEL_TIMEOUT = float(os.environ.get('MODEL_TIMEOUT', '90'))               # seconds, poori request
+MODEL_CONNECT_TIMEOUT = float(os.environ.get('MODEL_CONNECT_TIMEOUT', '10'))
+MODEL_MAX_RETRIES = int(os.environ.get('MODEL_MAX_RETRIES', '4'))
+MODEL_BACKOFF_BASE = float(os.environ.get('MODEL_BACKOFF_BASE', '1.0'))    # seconds
+MODEL_BACKOFF_MAX = float(os.environ.get('MODEL_BACKOFF_MAX', '30'))
+MODEL_POOL_SIZE = int(os.environ.get('MODEL_POOL_SIZE', '0'))              # 0 => VISION_MAX_CONCURRENCY
+
+class ModelGatewayError(RuntimeError):
+    """Model call retries ke baad bhi fail — message job ke error mein jata hai."""
+
+def _retryable_model_error(error):
+    if isinstance(error, openai.APIConnectionError):   # timeouts bhi isi mein
+        return True
+    # Stream chalte hue (for chunk in response) read timeout / connection drop seedha httpx se aata hai
+    if isinstance(error, (httpx.TimeoutException, httpx.TransportError)):
+        return True
+    if isinstance(error, openai.APIStatusError):
+        return error.status_code in (408, 409, 429) or error.status_code >= 500
+    return False
+
+def _retry_after_seconds(error):
+    response = getattr(error, 'response', None)
+    try:
+        return float(response.headers.get('retry-after'))
+    except (AttributeError, TypeError, ValueError):
+        return None
+
+# complete() ka result: text + finish_reason ('stop', 'length' = max_tokens par kata hua, None = backend ne nahi bataya)
+ModelReply = namedtuple('ModelReply', 'text finish_reason')
+
+class ModelGateway:
+    def __init__(self, backend=None, base_url=MODEL_BASE_URL, pool_size=None):
+        self._backend = backend
+        self.base_url = base_url
+        self.pool_size = pool_size
+        self._inflight = {}
+        self._lock = threading.Lock()
+        self._metrics = {'requests': 0, 'attempts': 0, 'retries': 0, 'failures': 0, 'coalesced': 0, 'truncated': 0,
+                         'prompt_tokens': 0, 'completion_tokens': 0,
+                         'last_ms': None, 'max_ms': 0.0, 'total_ms': 0.0, 'first_token_ms': None}
+
+    @cached_property
+    def backend(self):
+        if self._backend is not None:
+            return self._backend
+        # Ek process = ek pool; connections VISION_MAX_CONCURRENCY threads ke liye kaafi.
+        # Retries hum khud karte hain (jitter + coalescing ke saath), SDK ke retries band.
+        pool_size = self.pool_size or MODEL_POOL_SIZE or VISION_MAX_CONCURRENCY
+        http_client = httpx.Client(
+            limits=httpx.Limits(max_connections=pool_size + 2, max_keepalive_connections=pool_size,
+                                keepalive_expiry=60),
+            timeout=httpx.Timeout(MODEL_TIMEOUT, connect=MODEL_CONNECT_TIMEOUT),
+        )
+        return OpenAI(base_url=self.base_url, http_client=http_client, max_retries=0,
+                      timeout=httpx.Timeout(MODEL_TIMEOUT, connect=MODEL_CONNECT_TIMEOUT))
+
+    def _record(self, **counts):
+        with self._lock:
+            for key, value in counts.items():
+                self._metrics[key] += value
+
+    def metrics(self):
+        with self._lock:
+            metrics = dict(self._metrics)
+        completed = metrics['requests'] - metrics['failures']
+        metrics['avg_ms'] = round(metrics['total_ms'] / completed, 1) if completed > 0 else None
+        metrics['total_ms'] = round(metrics['total_ms'], 1)
+        metrics['in_flight'] = len(self._inflight)
+        return metrics
+
+    def complete(self, on_delta=None, **request_args):
+        """Chat completion -> ModelReply(text, finish_reason). on_delta diya ho to response stream hota hai.
+
+        Bilkul same request pehle se chal rahi ho to naya call nahi hota — usi ka jawab milta hai.
+        Retry se pehle, agar kuch deltas ja chuke hon, on_delta(None) call hota hai (reset).
+        """
+        key = hashlib.sha256(json.dumps(request_args, sort_keys=True, ensure_ascii=False).encode('utf-8')).hexdigest()
+        with self._lock:
+            leader = self._inflight.get(key)
+            if leader is None:
+                future = self._inflight[key] = Future()
+        if leader is not None:
+            self._record(coalesced=1)
+            MODEL_COALESCED.inc()
+            reply = leader.result()
+            if on_delta and reply.text:
+                on_delta(reply.text)
+            return reply
+        try:
+            reply = self._complete_with_retries(on_delta, request_args)
+            future.set_result(reply)
+            return reply
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+
+    def _complete_with_retries(self, on_delta, request_args):
+        self._record(requests=1)
+        start = time.perf_counter()
+        for attempt in range(MODEL_MAX_RETRIES + 1):
+            self._record(attempts=1)
+            delivered = []
+            try:
+                reply = self._attempt(on_delta, request_args, delivered, start)
+                break
+            except Exception as e:
+                if not _retryable_model_error(e) or attempt == MODEL_MAX_RETRIES:
+                    self._record(failures=1)
+                    MODEL_SECONDS.observe(time.perf_counter() - start, outcome='error')
+                    raise ModelGatewayError(f"Model request failed after {attempt + 1} attempt(s): {e}") from e
+                # Full jitter backoff; server Retry-After bheje to kam az kam utna
+                delay = random.uniform(0, min(MODEL_BACKOFF_MAX, MODEL_BACKOFF_BASE * 2 ** attempt))
+                delay = max(delay, min(_retry_after_seconds(e) or 0, MODEL_BACKOFF_MAX))
+                log_event('warning', 'model_retry', error=e.__class__.__name__, attempt=attempt + 1,
+                          delay_s=round(delay, 2), detail=str(e)[:200])
+                self._record(retries=1)
+                MODEL_RETRIES.inc(error=e.__class__.__name__)
+                if delivered and on_delta:
+                    on_delta(None)
+                time.sleep(delay)
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        MODEL_SECONDS.observe(elapsed_ms / 1000, outcome='ok')
+        with self._lock:
+            self._metrics['last_ms'] = round(elapsed_ms, 1)
+            self._metrics['max_ms'] = round(max(self._metrics['max_ms'], elapsed_ms), 1)
+            self._metrics['total_ms'] += elapsed_ms
+        if reply.finish_reason == 'length':
+            self._record(truncated=1)
+            MODEL_TRUNCATED.inc()
+        return reply
+
+    def _attempt(self, on_delta, request_args, delivered, start):
+        completions = self.backend.chat.completions
+        if on_delta is None:
+            response = completions.create(**request_args)
+            self._record_usage(getattr(response, 'usage', None))
+            choice = response.choices[0]
+            return ModelReply(choice.message.content or "", getattr(choice, 'finish_reason', None))
+
+        response = completions.create(stream=True, stream_options={"include_usage": True}, **request_args)
+        if hasattr(response, 'choices'):
+            # Backend ne stream ignore kar diya (e.g. fake client) — poora jawab ek delta
+            self._record_usage(getattr(response, 'usage', None))
+            choice = response.choices[0]
+            text = choice.message.content or ""
+            on_delta(text)
+            return ModelReply(text, getattr(choice, 'finish_reason', None))
+        parts = []
+        finish_reason = None
+        for chunk in response:
+            self._record_usage(getattr(chunk, 'usage', None))   # include_usage: aakhri chunk
+            if chunk.choices and getattr(chunk.choices[0], 'finish_reason', None):
+                finish_reason = chunk.choices[0].finish_reason
+            delta = chunk.choices[0].delta.content if chunk.choices else None
+            if not delta:
+                continue
+            if not parts:
+                first_token = time.perf_counter() - start
+                MODEL_FIRST_TOKEN_SECONDS.observe(first_token)
+                with self._lock:
+                    self._metrics['first_token_ms'] = round(first_token * 1000, 1)
+                delivered.append(True)
+            parts.append(delta)
+            on_delta(delta)
+        return ModelReply("".join(parts), finish_reason)
+
+    def _record_usage(self, usage):
+        if usage is not None:
+            prompt_tokens = getattr(usage, 'prompt_tokens', 0) or 0
+            completion_tokens = getattr(usage, 'completion_tokens', 0) or 0
+            self._record(prompt_tokens=prompt_tokens, completion_tokens=completion_tokens)
+            MODEL_TOKENS.observe(prompt_tokens, direction='in')
+            MODEL_TOKENS.observe(completion_tokens, direction='out')
 
-        content_array = [{"type": "text", "text": "Process all images. JSON only."}]
-        for image_file in image_files:
-            image_path = os.path.join(chapter_path, image_file)
+model_gateway = ModelGateway()
+
+# ------------ Vision fan-out (chunks + bounded parallelism) ------------
+
+VISION_MODEL = "gpt-4o-mini"
+VISION_SYSTEM_PROMPT = "You are an exam notes generator. Detect ALL questions in EACH image and return JSON only: [{image, question, answer_en, answer_ur}], where image is the 1-based position of the image the question came from. Keep answers concise and exam-accurate; add symbols/formulas/examples only when needed for marks. No explanations, no markdown—JSON array only."
+VISION_PROMPT_VERSION = 2  # prompt/model badle to isay barhao — purana cache khud invalid ho jayega
+VISION_CHUNK_SIZE = int(os.environ.get('VISION_CHUNK_SIZE', '4'))            # images per model call
+VISION_MAX_TOKENS = int(os.environ.get('VISION_MAX_TOKENS', '900'))          # per chunk, not per chapter
+VISION_MAX_CONCURRENCY = int(os.environ.get('VISION_MAX_CONCURRENCY', '4'))  # saare chapters/jobs/workers mila kar
+VISION_RATE_PER_MIN = float(os.environ.get('VISION_RATE_PER_MIN', '60'))     # token bucket refill
+# global: limits data/ ki SQLite file se saare gunicorn workers share karte hain; process: har process ki apni
+VISION_LIMIT_SCOPE = os.environ.get('VISION_LIMIT_SCOPE', 'global')
+VISION_LIMITS_DB = os.path.join(DATA_DIR, 'vision_limits.sqlite3')
+VISION_LIMIT_POLL_SECONDS = 0.05
+VISION_STREAM = os.environ.get('VISION_STREAM', '1') == '1'                   # progress events ke saath stream=True
+VISION_TOKEN_EVENT_INTERVAL = 0.5                                             # seconds, 'tokens' events ke beech
+
+class TokenBucket:
+    """Simple thread-safe token bucket: acquire() block karta hai jab tak token na mile."""
+    def __init__(self, rate_per_sec, capacity):
+        self.rate = rate_per_sec
+        self.capacity = max(1.0, capacity)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+class ProcessVisionLimits:
+    """Sirf is process ki limits: executor ka size concurrency hai, TokenBucket rate."""
+    def __init__(self, max_concurrency, rate_per_sec):
+        self.bucket = TokenBucket(rate_per_sec, max_concurrency)
+
+    @contextmanager
+    def slot(self):
+        yield
+
+    def acquire_token(self):
+        self.bucket.acquire()
+
+class SharedVisionLimits:
+    """Concurrency slots + token bucket ek SQLite file mein, taake har gunicorn worker ek hi
+    (configured) limit share kare — warna 2 workers = do guna limit.
+
+    Slot row mein owner pid hota hai; process mar jaye to uske slots agle acquire par saaf ho jate hain.
+    """
+    def __init__(self, path, max_concurrency, rate_per_sec):
+        self.path = path
+        self.max_concurrency = max(1, max_concurrency)
+        self.rate = rate_per_sec
+        self.capacity = max(1.0, max_concurrency)
+
+    def _conn(self):
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("CREATE TABLE IF NOT EXISTS slots (id INTEGER PRIMARY KEY, pid INTEGER NOT NULL, acquired REAL NOT NULL)")
+        conn.execute("CREATE TABLE IF NOT EXISTS bucket (id INTEGER PRIMARY KEY CHECK (id = 1), tokens REAL NOT NULL, updated REAL NOT NULL)")
+        return conn
+
+    @contextmanager
+    def slot(self):
+        conn = self._conn()
+        try:
+            while True:
+                conn.execute("BEGIN IMMEDIATE")
+                holders = conn.execute("SELECT id, pid FROM slots").fetchall()
+                dead = [(slot_id,) for slot_id, pid in holders if pid != os.getpid() and not _pid_alive(pid)]
+                conn.executemany("DELETE FROM slots WHERE id = ?", dead)
+                if len(holders) - len(dead) < self.max_concurrency:
+                    slot_id = conn.execute("INSERT INTO slots (pid, acquired) VALUES (?, ?)",
+                                           (os.getpid(), time.time())).lastrowid
+                    conn.execute("COMMIT")
+                    break
+                conn.execute("COMMIT")
+                time.sleep(random.uniform(0.5, 1.5) * VISION_LIMIT_POLL_SECONDS)
+            try:
+                yield
+            finally:
+                conn.execute("DELETE FROM slots WHERE id = ?", (slot_id,))
+        finally:
+            conn.close()
+
+    def acquire_token(self):
+        conn = self._conn()
+        try:
+            while True:
+                conn.execute("BEGIN IMMEDIATE")
+                now = time.time()
+                row = conn.execute("SELECT tokens, updated FROM bucket WHERE id = 1").fetchone()
+                tokens = self.capacity if row is None else min(self.capacity, row[0] + max(0.0, now - row[1]) * self.rate)
+                taken = tokens >= 1
+                if taken:
+                    tokens -= 1
+                conn.execute("INSERT OR REPLACE INTO bucket (id, tokens, updated) VALUES (1, ?, ?)", (tokens, now))
+                conn.execute("COMMIT")
+                if taken:
+                    return
+                time.sleep((1 - tokens) / self.rate)
+        finally:
+            conn.close()
+
+# Har process mein ek executor chunk calls chalata hai; limits (concurrency + rate) sab processes par
+_vision_executor = ThreadPoolExecutor(max_workers=VISION_MAX_CONCURRENCY, thread_name_prefix='vision')
+if VISION_LIMIT_SCOPE == 'process':
+    _vision_limits = ProcessVisionLimits(VISION_MAX_CONCURRENCY, VISION_RATE_PER_MIN / 60.0)
+else:
+    _vision_limits = SharedVisionLimits(VISION_LIMITS_DB, VISION_MAX_CONCURRENCY, VISION_RATE_PER_MIN / 60.0)
+
+def _page_sort_key(filename):
+    # "page10.jpg" "page2.jpg" ke baad aaye (natural order)
+    return [int(part) if part.isdigit() else part.lower() for part in re.split(r'(\d+)', filename)]
+
+def _question_event(qa, pages):
+    """Model ka question dict -> 'question' event data (chunk-relative image -> chapter page)."""
+    try:
+        index = int(qa.get("image")) - 1
+    except (TypeError, ValueError):
+        index = -1
+    if not 0 <= index < len(pages):
+        index = 0 if len(pages) == 1 else None   # ek hi page ho to wahi
+    return {'page': pages[index] if index is not None else None,
+            'question': str(qa.get("question") or ""), 'answer_en': str(qa.get("answer_en") or ""),
+            'answer_ur': str(qa.get("answer_ur") or "")}
+
+def _vision_call_chunk(prepared_images, gateway, emit=None, pages=()):
+    """Ek chunk ki model call -> (questions, finish_reason). emit diya ho to response stream hota hai
+    aur har mukammal question foran 'question' event ban jata hai (pages: is chunk ke chapter page numbers)."""
+    content_array = [{"type": "text", "text": "Process all images. JSON only."}]
+    with span('vision.encode', images=len(prepared_images)):
+        for image_path, mime_type in prepared_images:
             base64_image = encode_image_to_base64(image_path)
             if base64_image:
                 content_array.append({
                     "type": "image_url",
-                    "image_url": {"url": f"data:image/jpeg;base64,{base64_image}"}
+                    "image_url": {"url": f"data:{mime_type};base64,{base64_image}"}
                 })
+    if emit:
+        emit('encoded', pages=list(pages))
 
-        response = client.chat.completions.create(
-            model="gpt-4o-mini",
-            temperature=0,
-            max_tokens=900,
-            response_format={"type": "json_object"},
-            messages=[
-                {
-                    "role": "system",
-                    "content": "You are an exam notes generator. Detect ALL questions in EACH image and return JSON only: [{question, answer_en, answer_ur}]. Keep answers concise and exam-accurate; add symbols/formulas/examples only when needed for marks. No explanations, no markdown—JSON array only."
-                },
-                {"role": "user", "content": content_array}
-            ]
-        )
-        return response.choices[0].message.content
-    except Exception as e:
-        print(f"Error processing folder images: {e}")
+    # Slot poori model call (stream samet) tak rehta hai
+    with _vision_limits.slot():
+        _vision_limits.acquire_token()
+        return _vision_model_call(content_array, gateway, emit, pages)
+
+def _vision_model_call(content_array, gateway, emit, pages):
+    request_args = dict(
+        model=VISION_MODEL,
+        temperature=0,
+        max_tokens=VISION_MAX_TOKENS,
+        response_format={"type": "json_object"},
+        messages=[
+            {"role": "system", "content": VISION_SYSTEM_PROMPT},
+            {"role": "user", "content": content_array}
+        ]
+    )
+    if emit is None or not VISION_STREAM:
+        with span('vision.model', pages=list(pages)):
+            reply = gateway.complete(**request_args)
+            # Tolerant parser: max_tokens par kata hua output bhi mukammal questions de deta hai
+            return parse_question_dicts(reply.text), reply.finish_reason
+
+    parser = QuestionStreamParser()
+    questions, emitted, tokens, last_report = [], 0, 0, time.monotonic()
+
+    def publish(found):
+        nonlocal emitted
+        questions.extend(found)
+        # Retry ke baad stream shuru se aata hai — jo questions dikha chuke, dobara nahi
+        for qa in questions[emitted:]:
+            emit('question', **_question_event(qa, pages))
+        emitted = max(emitted, len(questions))
+
+    def on_delta(delta):
+        nonlocal parser, tokens, last_report
+        if delta is None:   # gateway retry kar raha hai
+            parser = QuestionStreamParser()
+            questions.clear()
+            return
+        tokens += 1   # har delta taqreeban ek token
+        publish(parser.feed(delta))
+        if time.monotonic() - last_report >= VISION_TOKEN_EVENT_INTERVAL:
+            last_report = time.monotonic()
+            emit('tokens', pages=list(pages), tokens=tokens)
+
+    with span('vision.model', pages=list(pages), stream=True) as attrs:
+        reply = gateway.complete(on_delta=on_delta, **request_args)
+        publish(parser.close())
+        attrs.update(deltas=tokens, questions=len(questions), finish_reason=reply.finish_reason)
+    emit('tokens', pages=list(pages), tokens=tokens, done=True)
+    return questions, reply.finish_reason
+
+# ---- Vision result cache: sha256(image bytes) + model + prompt version => questions ----
+VISION_CACHE_DB = os.path.join(DATA_DIR, 'vision_cache.sqlite3')
+VISION_CACHE_MAX_BYTES = int(os.environ.get('VISION_CACHE_MAX_BYTES', str(64 * 1024 * 1024)))
+
+def _vision_cache_conn():
+    conn = sqlite3.connect(VISION_CACHE_DB, timeout=30)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("""CREATE TABLE IF NOT EXISTS vision_cache (
+                        key TEXT PRIMARY KEY,
+                        questions TEXT NOT NULL,
+                        size INTEGER NOT NULL,
+                        created REAL NOT NULL,
+                        last_used REAL NOT NULL)""")
+    conn.execute("CREATE INDEX IF NOT EXISTS vision_cache_lru ON vision_cache(last_used)")
+    return conn
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+def vision_cache_key(image_sha256):
+    # Preprocessing settings badlein to model ne kuch aur dekha tha — purane answers na milein
+    return f"{image_sha256}:{preprocess_settings_digest()}:{VISION_MODEL}:v{VISION_PROMPT_VERSION}"
+
+def vision_cache_get(keys):
+    """{key: questions} for keys present in cache; hits ka last_used update hota hai."""
+    if not keys:
+        return {}
+    found = {}
+    with _vision_cache_conn() as conn:
+        for key in keys:
+            row = conn.execute("SELECT questions FROM vision_cache WHERE key = ?", (key,)).fetchone()
+            if row:
+                found[key] = json.loads(row[0])
+        if found:
+            now = time.time()
+            conn.executemany("UPDATE vision_cache SET last_used = ? WHERE key = ?", [(now, k) for k in found])
+    return found
+
+def vision_cache_put(entries):
+    if not entries:
+        return
+    now = time.time()
+    rows = []
+    for key, questions in entries.items():
+        payload = json.dumps(questions, ensure_ascii=False)
+        rows.append((key, payload, len(payload.encode('utf-8')), now, now))
+    with _vision_cache_conn() as conn:
+        conn.executemany("INSERT OR REPLACE INTO vision_cache VALUES (?, ?, ?, ?, ?)", rows)
+        # Size-based eviction: sab se purane (least recently used) entries nikaalo
+        total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM vision_cache").fetchone()[0]
+        if total > VISION_CACHE_MAX_BYTES:
+            for key, size in conn.execute("SELECT key, size FROM vision_cache ORDER BY last_used").fetchall():
+                conn.execute("DELETE FROM vision_cache WHERE key = ?", (key,))
+                total -= size
+                if total <= VISION_CACHE_MAX_BYTES:
+                    break
+
+def split_questions_by_image(questions, image_count):
+    """Chunk response ko har image ke hisaab se baanto ("image" field, 1-based).
+
+    (per_image, attributed) — attributed False ho to kisi question ka "image" gum/ghalat tha,
+    yani baant par bharosa nahi (sirf merge ke liye theek hai, per-page cache ke liye nahi).
+    """
+    per_image = [[] for _ in range(image_count)]
+    current = 0
+    attributed = True
+    for qa in questions:
+        qa = dict(qa)
+        index = qa.pop("image", None)
+        try:
+            index = int(index) - 1
+        except (TypeError, ValueError):
+            index = None
+        # index na ho to pichli image ke saath rakho (page order barqaraar rehta hai)
+        if index is not None and 0 <= index < image_count:
+            current = index
+        elif image_count > 1:
+            attributed = False
+        per_image[current].append(qa)
+    return per_image, attributed
+
+def process_folder_images_batch(chapter_path, vision_client=None, stats=None, use_cache=True, emit=None):
+    """Chapter ki images ko chunks mein bhej kar questions ko page order mein merge karta hai.
+
+    vision_client: ModelGateway, ya koi OpenAI-compatible object (tests mein local fake client).
+    stats: optional dict — cache_hits / cache_misses / bytes_saved yahan bhar diye jaate hain.
+    use_cache=False cache parhta nahi (fresh answers), lekin naya result phir bhi save hota hai.
+    emit: optional emit(kind, **data) — progress events (images_ready, encoded, tokens, question,
+    pages_reset, chunk_done).
+    Images na hon to None; model errors (ModelGatewayError) upar jaate hain taake job
+    asal wajah ke saath fail ho. max_tokens par kata hua chunk (finish_reason='length') kabhi
+    cache nahi hota: do hisson mein dobara bheja jata hai, aur akeli image phir bhi kate to error.
+    """
+    if isinstance(vision_client, ModelGateway):
+        gateway = vision_client
+    else:
+        gateway = ModelGateway(backend=vision_client) if vision_client else model_gateway
+    entries = chapter_image_entries(chapter_path)
+    if not entries:
         return None
 
+    image_paths = [os.path.join(chapter_path, name) for name, _ in entries]
+    hashes = [sha for _, sha in entries]
+    keys = [vision_cache_key(h) for h in hashes]
+    with span('vision.cache_lookup', images=len(keys)):
+        cached = vision_cache_get(set(keys)) if use_cache else {}
+    missing = [i for i, key in enumerate(keys) if key not in cached]
+    if stats is not None:
+        stats['cache_hits'] = len(image_paths) - len(missing)
+        stats['cache_misses'] = len(missing)
+
+    if emit:
+        # Cache wale pages ke questions foran dikha do
+        for page, key in enumerate(keys, 1):
+            for qa in cached.get(key, ()):
+                emit('question', cached=True, **_question_event(qa, [page]))
+
+    with span('vision.prepare_images', images=len(missing)):
+        prepared = dict(zip(missing, prepare_images([image_paths[i] for i in missing],
+                                                    [hashes[i] for i in missing], stats)))
+    if emit:
+        emit('images_ready', total=len(keys), cached=len(keys) - len(missing), prepared=len(prepared))
+    chunk_size = max(1, VISION_CHUNK_SIZE)
+    chunks = [missing[i:i + chunk_size] for i in range(0, len(missing), chunk_size)]
+
+    def submit(chunk):
+        return chunk, submit_in_context(_vision_executor, _vision_call_chunk, [prepared[i] for i in chunk], gateway,
+                                        emit, [i + 1 for i in chunk])
+
+    pending = deque(submit(chunk) for chunk in chunks)
+    results = {key: questions for key, questions in cached.items()}
+    fresh, errors = {}, []
+    done, total = 0, len(chunks)
+    while pending:
+        chunk, future = pending.popleft()
+        try:
+            chunk_questions, finish_reason = future.result()
+        except Exception as e:
+            errors.append(e)
+            continue
+        if finish_reason == 'length':
+            # Jawab max_tokens par kata — aakhri questions gum hain, is liye na cache na merge
+            pages = [i + 1 for i in chunk]
+            log_event('warning', 'vision_chunk_truncated', chapter=os.path.basename(chapter_path), pages=pages,
+                      max_tokens=VISION_MAX_TOKENS, questions=len(chunk_questions))
+            if len(chunk) == 1:
+                errors.append(ModelGatewayError(f"Model output for page {pages[0]} was cut off at "
+                                                f"{VISION_MAX_TOKENS} tokens (increase VISION_MAX_TOKENS)"))
+                continue
+            if emit:
+                emit('pages_reset', pages=pages)   # in pages ke live questions dobara aayenge
+            half = (len(chunk) + 1) // 2
+            pending.extend((submit(chunk[:half]), submit(chunk[half:])))
+            total += 1
+            continue
+        per_image, attributed = split_questions_by_image(chunk_questions, len(chunk))
+        if not attributed:
+            log_event('warning', 'vision_chunk_unattributed', chapter=os.path.basename(chapter_path),
+                      pages=[i + 1 for i in chunk], questions=len(chunk_questions))
+        for i, questions in zip(chunk, per_image):
+            results[keys[i]] = questions
+            # Multi-image chunk: sirf tab cache jab har question ka page pata ho, aur khali page
+            # kabhi nahi (model ne us page ke questions kisi aur page par daal diye ho sakte hain)
+            if len(chunk) == 1 or (attributed and questions):
+                fresh[keys[i]] = questions
+        done += 1
+        if emit:
+            emit('chunk_done', chunk=done, chunks=total)
+    # Kamyab chunks cache mein — job dobara chale to sirf fail hue pages model ko jayenge
+    vision_cache_put(fresh)
+    if errors:
+        raise errors[0]
+
+    questions = []
+    for key in keys:  # page order
+        questions.extend(results[key])
+    return json.dumps({"questions": questions}, ensure_ascii=False)
+
 # ------------ Urdu PDF utilities (FIXED BASELINE) ------------
 
 def register_urdu_font_once():
@@ -85,38 +1279,97 @@ def register_urdu_font_once():
         if URDU_FONT_NAME not in pdfmetrics.getRegisteredFontNames():
             if os.path.exists(URDU_FONT_FILE):
                 pdfmetrics.registerFont(TTFont(URDU_FONT_NAME, URDU_FONT_FILE))
-                print(f"✅ Registered Urdu font: {URDU_FONT_NAME}")
+                log_event('info', 'urdu_font_registered', font=URDU_FONT_NAME)
             else:
-                print(f"⚠️ Urdu font not found at {URDU_FONT_FILE}")
+                log_event('warning', 'urdu_font_missing', path=URDU_FONT_FILE)
     except Exception as e:
-        print(f"⚠️ Urdu font register failed: {e}")
+        log_event('warning', 'urdu_font_register_failed', error=str(e))
+
+class _UrduReshaper(arabic_reshaper.ArabicReshaper):
+    # Upstream har reshape() par ligature regex dobara banata hai (hasattr name-mangling bug);
+    # yahan wo sirf ek dafa compile hota hai.
+    @cached_property
+    def _ligatures_re(self):
+        return arabic_reshaper.ArabicReshaper._ligatures_re.fget(self)
+
+URDU_RESHAPER = _UrduReshaper()
+URDU_ANSWER_LABEL = "جواب (اردو):"
+URDU_SHAPE_POOL_THRESHOLD = int(os.environ.get('URDU_SHAPE_POOL_THRESHOLD', '2000'))  # unique texts
+URDU_SHAPE_WORKERS = int(os.environ.get('URDU_SHAPE_WORKERS', str(min(4, os.cpu_count() or 1))))
 
+@lru_cache(maxsize=4096)
 def urdu_shape(text: str) -> str:
     if not text:
         return ""
-    return get_display(arabic_reshaper.reshape(text))
+    return get_display(URDU_RESHAPER.reshape(text))
+
+def _urdu_shape_chunk(texts):
+    return [urdu_shape(t) for t in texts]
+
+def urdu_shape_batch(texts, use_pool=None):
+    """Poore chapter ke texts ek pass mein shape karo: {text: shaped}.
+
+    Duplicates ek hi dafa shape hote hain; bohat bare chapters (URDU_SHAPE_POOL_THRESHOLD
+    se zyada unique texts) process pool mein chunks ki shakal mein jaate hain. Khud pool worker
+    (e.g. PDF render process) ho to hamesha inline — pool ke andar pool exit par atak jata hai.
+    """
+    unique = [t for t in dict.fromkeys(texts) if t]
+    if use_pool is None:
+        use_pool = len(unique) >= URDU_SHAPE_POOL_THRESHOLD and URDU_SHAPE_WORKERS > 1
+    if is_pool_worker():
+        use_pool = False
+    shaped = {"": ""}
+    if use_pool and unique:
+        size = max(1, len(unique) // (URDU_SHAPE_WORKERS * 4))
+        chunks = [unique[i:i + size] for i in range(0, len(unique), size)]
+        pool = get_process_pool('urdu-shape', URDU_SHAPE_WORKERS)
+        for chunk, result in zip(chunks, pool.map(_urdu_shape_chunk, chunks)):
+            shaped.update(zip(chunk, result))
+    else:
+        shaped.update((t, urdu_shape(t)) for t in unique)
+    return shaped
 
 
 def esc(s: str) -> str:
     return s.replace("&","&amp;").replace("<","&lt;").replace(">","&gt;")
 
 # ------- NEW: RTL Flowable with manual wrapping -------
+# Har shaped word (font, size ke saath) sirf ek dafa measure hota hai; bounded taake lambi
+# chalne wali process mein har naye word ke saath yaad barhti na rahe.
+@lru_cache(maxsize=65536)
+def word_width(word, font_name, font_size):
+    return pdfmetrics.stringWidth(word, font_name, font_size)
+
+def rtl_line_width(line, font_name, font_size):
+    # stringWidth jaisa hi result, lekin memoized word widths se
+    words = line.split(' ')
+    return (sum(word_width(w, font_name, font_size) for w in words)
+            + (len(words) - 1) * word_width(" ", font_name, font_size))
+
+@lru_cache(maxsize=8192)
 def split_rtl_lines(text, font_name, font_size, max_width):
     # text must be already shaped with urdu_shape()
-    words = text.split(' ')
-    lines, current = [], ""
-    for w in words:
-        test = (w if not current else current + " " + w)
-        width = pdfmetrics.stringWidth(test, font_name, font_size)
-        if width <= max_width:
-            current = test
+    # Line width = words ki widths + spaces (TTF widths additive hain), is liye poori
+    # growing line ko dobara measure nahi karna parta — linear time.
+    space = word_width(" ", font_name, font_size)
+    lines, current, current_width = [], [], 0.0
+    for w in text.split(' '):
+        w_width = word_width(w, font_name, font_size)
+        current_empty = not current or current == [""]
+        test_width = w_width if current_empty else current_width + space + w_width
+        if test_width <= max_width:
+            if current_empty:
+                current = [w]
+            else:
+                current.append(w)
+            current_width = test_width
         else:
-            if current:
-                lines.append(current)
-            current = w
-    if current:
-        lines.append(current)
-    return lines
+            if not current_empty:
+                lines.append(" ".join(current))
+            current, current_width = [w], w_width
+    if current and current != [""]:
+        lines.append(" ".join(current))
+    return tuple(lines)
 
 class RTLParagraph(Flowable):
     def __init__(self, text, font_name, font_size=14, color=HexColor("#1976D2"), leading=None, padding_y=2):
@@ -136,6 +1389,19 @@ class RTLParagraph(Flowable):
         height = len(self._lines) * self.leading + self.padding_y*2
         return availWidth, height
 
+    def split(self, availWidth, availHeight):
+        # Lamba jawab page ke end par toot kar agle page par chala jaye
+        lines = split_rtl_lines(self.text, self.font_name, self.font_size, availWidth)
+        fit = int((availHeight - self.padding_y*2) // self.leading)
+        if fit <= 0:
+            return []
+        if fit >= len(lines):
+            return [self]
+        return [self._with_text(" ".join(lines[:fit])), self._with_text(" ".join(lines[fit:]))]
+
+    def _with_text(self, text):
+        return RTLParagraph(text, self.font_name, self.font_size, self.color, self.leading, self.padding_y)
+
     def draw(self):
         c = self.canv
         c.saveState()
@@ -145,11 +1411,14 @@ class RTLParagraph(Flowable):
         y = self.leading * (len(self._lines)-1)  # top line position
         for i, line in enumerate(self._lines):
             # right align each line to the flowable width
-            c.drawRightString(self._width, y - i*self.leading, line)
+            c.drawString(self._width - rtl_line_width(line, self.font_name, self.font_size), y - i*self.leading, line)
         c.restoreState()
 
 # ------- Watermark canvas (aapka hi) -------
 class WatermarkCanvas(canvas.Canvas):
+    # Watermark ek dafa form XObject ban kar har page par sirf reference hota hai
+    WATERMARK_FORM = "GoodWillWatermark"
+
     def showPage(self):
         self._draw_watermark()
         super().showPage()
@@ -157,6 +1426,13 @@ class WatermarkCanvas(canvas.Canvas):
         self._draw_watermark()
         super().save()
     def _draw_watermark(self):
+        if not getattr(self, '_watermark_ready', False):
+            self.beginForm(self.WATERMARK_FORM)
+            self._watermark_body()
+            self.endForm()
+            self._watermark_ready = True
+        self.doForm(self.WATERMARK_FORM)
+    def _watermark_body(self):
         try:
             self.saveState()
             self.setFont("Helvetica-Bold", 50)
@@ -171,162 +1447,1820 @@ class WatermarkCanvas(canvas.Canvas):
         finally:
             self.restoreState()
 
-# ------- REPLACE this function with the one below -------
-def create_beautiful_pdf(chapter_name, questions_data):
+# ------- Styles + per-question block cache (incremental rebuilds) -------
+PDF_LAYOUT_VERSION = 2   # block ka layout/style badle to barhao
+PDF_BLOCK_CACHE_SIZE = int(os.environ.get('PDF_BLOCK_CACHE_SIZE', '5000'))
+_question_blocks = OrderedDict()
+_question_blocks_lock = threading.Lock()
+
+@lru_cache(maxsize=1)
+def pdf_styles():
+    """Saare ParagraphStyles ek dafa banao; har PDF inhi ko reuse karta hai."""
+    styles = getSampleStyleSheet()
+    return {
+        'normal': styles['Normal'],
+        'title': ParagraphStyle('TitleX', parent=styles['Heading1'],
+                                fontSize=26, leading=32, alignment=TA_CENTER,
+                                spaceAfter=18, textColor=HexColor("#2C3E50"),
+                                fontName='Helvetica-Bold'),
+        'question': ParagraphStyle('Q', parent=styles['Normal'],
+                                   fontSize=14, leading=20, spaceAfter=6,
+                                   textColor=HexColor("#34495E"),
+                                   fontName='Helvetica-Bold'),
+        'answer_en': ParagraphStyle('AEN', parent=styles['Normal'],
+                                    fontSize=12, leading=18, spaceAfter=4,
+                                    textColor=HexColor("#2E7D32"),
+                                    fontName='Helvetica'),
+        'duplicate': ParagraphStyle('Dup', parent=styles['Normal'],
+                                    fontSize=9, leading=12, spaceAfter=4,
+                                    textColor=HexColor("#8E44AD"),
+                                    fontName='Helvetica-Oblique'),
+        'header': ParagraphStyle('Header', parent=styles['Normal'], fontSize=10,
+                                 alignment=TA_RIGHT, textColor=HexColor('#7F8C8D')),
+        'footer': ParagraphStyle('Footer', parent=styles['Normal'],
+                                 fontSize=10, alignment=TA_CENTER, textColor=HexColor('#95A5A6')),
+        'contents': ParagraphStyle('Contents', parent=styles['Normal'],
+                                   fontSize=12, leading=18, textColor=HexColor("#34495E"),
+                                   fontName='Helvetica'),
+    }
+
+class CachedParagraph(Paragraph):
+    """Paragraph jiski line-breaking width ke hisaab se yaad rehti hai (copies ke beech shared)."""
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._break_cache = {}   # copy.copy ke baad bhi wahi dict
+
+    # breakLines() ye attributes bhi set karta hai; cache hit par inhe bhi wapas lagao
+    _BREAK_STATE = ('frags', '_width_max', '_splitLongWordCount', '_hyphenations')
+
+    def breakLines(self, width):
+        key = tuple(width) if isinstance(width, (list, tuple)) else width
+        hit = self._break_cache.get(key)
+        if hit is None:
+            blPara = super().breakLines(width)
+            state = {k: self.__dict__[k] for k in self._BREAK_STATE if k in self.__dict__}
+            self._break_cache[key] = (blPara, state)
+            return blPara
+        blPara, state = hit
+        self.__dict__.update(state)
+        return blPara
+
+def question_block_key(index, qa, font_name):
+    payload = [PDF_LAYOUT_VERSION, index, font_name,
+               qa.get("question", ""), qa.get("answer_en", ""), qa.get("answer_ur", ""), qa.get("duplicate_of")]
+    return hashlib.sha256(json.dumps(payload, ensure_ascii=False).encode('utf-8')).hexdigest()
+
+def _build_question_block(index, qa, font_name, a_ur_shaped, label_ur):
+    styles = pdf_styles()
+    block = []
+    # Question
+    q = esc(qa.get("question", ""))
+    block.append(CachedParagraph(f"<b>Q{index}. {q}</b>", styles['question']))
+    dup = qa.get("duplicate_of")
+    if dup:
+        note = "answer reused" if dup.get("answer_reused") else "answered again"
+        block.append(CachedParagraph(f"Repeated question: also {esc(dup['chapter_name'])} Q{dup['number']} "
+                                     f"({round(dup['similarity'] * 100)}% match, {note})", styles['duplicate']))
+    block.append(Spacer(1, 2))
+
+    # English
+    a_en = esc(qa.get("answer_en", ""))
+    block.append(CachedParagraph(f"<b>Answer (English):</b> {a_en}", styles['answer_en']))
+
+    # Urdu label + answer (RTLParagraph)
+    if a_ur_shaped:
+        # label (separate line)
+        block.append(RTLParagraph(label_ur, font_name=font_name, font_size=13,
+                                  color=HexColor("#1976D2"), leading=20))
+        # answer
+        block.append(RTLParagraph(a_ur_shaped, font_name=font_name, font_size=14,
+                                  color=HexColor("#1976D2"), leading=22))
+    else:
+        block.append(CachedParagraph(f"<b>Jawab (Urdu):</b> Urdu text not available", styles['answer_en']))
+
+    block.append(Spacer(1, 8))
+    block.append(CachedParagraph("<hr color='#BDC3C7' width='85%'/>", styles['normal']))
+    block.append(Spacer(1, 10))
+    return block
+
+def question_blocks(questions, font_name, stats=None):
+    """Har question ka flowable block — content hash se cache; sirf badle hue blocks dobara bante hain."""
+    keys = [question_block_key(i, qa, font_name) for i, qa in enumerate(questions, 1)]
+    with _question_blocks_lock:
+        cached = {k: _question_blocks[k] for k in keys if k in _question_blocks}
+        for k in cached:
+            _question_blocks.move_to_end(k)
+    missing = [i for i, k in enumerate(keys) if k not in cached]
+    if stats is not None:
+        stats['blocks_cached'] = len(keys) - len(missing)
+        stats['blocks_rendered'] = len(missing)
+
+    if missing:
+        shaped_ur = urdu_shape_batch([questions[i].get("answer_ur", "").strip() for i in missing])
+        label_ur = urdu_shape(URDU_ANSWER_LABEL)
+        fresh = {keys[i]: _build_question_block(i + 1, questions[i], font_name,
+                                                shaped_ur[questions[i].get("answer_ur", "").strip()], label_ur)
+                 for i in missing}
+        cached.update(fresh)
+        with _question_blocks_lock:
+            _question_blocks.update(fresh)
+            while len(_question_blocks) > PDF_BLOCK_CACHE_SIZE:
+                _question_blocks.popitem(last=False)
+
+    story = []
+    for k in keys:
+        # Shallow copy: wrap/draw state har document ka apna, parsed text aur line breaks shared
+        story.extend(copy.copy(flowable) for flowable in cached[k])
+    return story
+
+def create_beautiful_pdf(chapter_name, questions_data, emit=None, stats=None):
+    """emit: optional emit(kind, **data) — har page shuru hone par 'pdf_page' event.
+    stats: optional dict — pages / blocks_cached / blocks_rendered."""
+    tmp_path = None
     try:
         register_urdu_font_once()
         font_available = (URDU_FONT_NAME in pdfmetrics.getRegisteredFontNames())
 
-        # Parse tolerantly
-        if isinstance(questions_data, str):
-            try:
-                data = json.loads(questions_data)
-            except Exception:
-                js = questions_data[questions_data.find('{'):questions_data.rfind('}')+1]
-                data = json.loads(js) if js.strip().startswith('{') else {"questions": []}
-        else:
-            data = questions_data or {"questions": []}
-        questions = data.get("questions", [])
+        # Parse tolerantly (raw model text, {"questions": [...]} ya QAItem list)
+        questions = [item.model_dump() for item in parse_model_output(questions_data)]
 
         pdf_path = os.path.join(CHAPTERS_DIR, secure_filename(chapter_name), f"{chapter_name}_notes.pdf")
+        # Pehle tmp file, phir atomic replace — download karne wale ko kabhi adhoori PDF na mile
+        tmp_path = f"{pdf_path}.{uuid.uuid4().hex}.tmp"
         doc = SimpleDocTemplate(
-            pdf_path, pagesize=A4,
+            tmp_path, pagesize=A4,
             rightMargin=60, leftMargin=60, topMargin=80, bottomMargin=60,
             canvasmaker=WatermarkCanvas
         )
-
-        styles = getSampleStyleSheet()
-        title_style = ParagraphStyle('TitleX', parent=styles['Heading1'],
-                                     fontSize=26, leading=32, alignment=TA_CENTER,
-                                     spaceAfter=18, textColor=HexColor("#2C3E50"),
-                                     fontName='Helvetica-Bold')
-        question_style = ParagraphStyle('Q', parent=styles['Normal'],
-                                        fontSize=14, leading=20, spaceAfter=6,
-                                        textColor=HexColor("#34495E"),
-                                        fontName='Helvetica-Bold')
-        answer_en_style = ParagraphStyle('AEN', parent=styles['Normal'],
-                                         fontSize=12, leading=18, spaceAfter=4,
-                                         textColor=HexColor("#2E7D32"),
-                                         fontName='Helvetica')
+        styles = pdf_styles()
 
         story = []
         # Header
-        header_style = ParagraphStyle('Header', parent=styles['Normal'], fontSize=10,
-                                      alignment=TA_RIGHT, textColor=HexColor('#7F8C8D'))
-        story.append(Paragraph(f"<b>GoodWill Educational Content</b> | Chapter: {esc(chapter_name)}", header_style))
+        story.append(Paragraph(f"<b>GoodWill Educational Content</b> | Chapter: {esc(chapter_name)}", styles['header']))
         story.append(Spacer(1, 16))
 
         # Title
-        story.append(Paragraph(esc(f"{chapter_name}"), title_style))
-        story.append(Paragraph(esc("Questions & Answers"), title_style))
+        story.append(Paragraph(esc(f"{chapter_name}"), styles['title']))
+        story.append(Paragraph(esc("Questions & Answers"), styles['title']))
         story.append(Spacer(1, 24))
 
+        block_stats = {}
         if not questions:
-            story.append(Paragraph("No questions found in the processed data.", styles['Normal']))
+            story.append(Paragraph("No questions found in the processed data.", styles['normal']))
         else:
-            for i, qa in enumerate(questions, 1):
-                # Question
-                q = esc(qa.get("question", ""))
-                story.append(Paragraph(f"<b>Q{i}. {q}</b>", question_style))
-                story.append(Spacer(1, 2))
-
-                # English
-                a_en = esc(qa.get("answer_en", ""))
-                story.append(Paragraph(f"<b>Answer (English):</b> {a_en}", answer_en_style))
-
-                # Urdu label + answer (RTLParagraph)
-                a_ur_raw = qa.get("answer_ur", "").strip()
-                if a_ur_raw:
-                    label_ur = urdu_shape("جواب (اردو):")
-                    # label (separate line)
-                    story.append(RTLParagraph(label_ur,
-                                              font_name=(URDU_FONT_NAME if font_available else "Helvetica"),
-                                              font_size=13,
-                                              color=HexColor("#1976D2"),
-                                              leading=20))
-                    # answer
-                    a_ur_shaped = urdu_shape(a_ur_raw)
-                    story.append(RTLParagraph(a_ur_shaped,
-                                              font_name=(URDU_FONT_NAME if font_available else "Helvetica"),
-                                              font_size=14,
-                                              color=HexColor("#1976D2"),
-                                              leading=22))
-                else:
-                    story.append(Paragraph(f"<b>Jawab (Urdu):</b> Urdu text not available", answer_en_style))
-
-                story.append(Spacer(1, 8))
-                story.append(Paragraph("<hr color='#BDC3C7' width='85%'/>", styles['Normal']))
-                story.append(Spacer(1, 10))
+            story.extend(question_blocks(questions, URDU_FONT_NAME if font_available else "Helvetica", block_stats))
 
         # Footer
-        footer_style = ParagraphStyle('Footer', parent=styles['Normal'],
-                                      fontSize=10, alignment=TA_CENTER, textColor=HexColor('#95A5A6'))
         story.append(Spacer(1, 30))
-        story.append(Paragraph("<b>Generated by GoodWill Notes Maker</b><br/>Educational content for exam preparation<br/><i>Study well, succeed better!</i>", footer_style))
+        story.append(Paragraph("<b>Generated by GoodWill Notes Maker</b><br/>Educational content for exam preparation<br/><i>Study well, succeed better!</i>", styles['footer']))
 
-        doc.build(story)
-        print(f"✅ Beautiful Urdu PDF created (RTL-wrapped): {pdf_path}")
+        if emit:
+            on_page = lambda canv, _doc: emit('pdf_page', page=canv.getPageNumber())
+            doc.build(story, onFirstPage=on_page, onLaterPages=on_page)
+        else:
+            doc.build(story)
+        publish_pdf(tmp_path, pdf_path)
+        if stats is not None:
+            stats.update(block_stats, pages=doc.page)
+        log_event('info', 'pdf_created', path=pdf_path, pages=doc.page,
+                  blocks_cached=block_stats.get('blocks_cached', 0), blocks_rendered=block_stats.get('blocks_rendered', 0))
         return pdf_path
     except Exception as e:
-        print(f"❌ Error creating PDF: {e}")
+        log_event('error', 'pdf_failed', chapter=chapter_name, error=str(e))
+        if tmp_path and os.path.exists(tmp_path):
+            os.remove(tmp_path)
         return None
 # ------------ End Urdu PDF utilities ------------
 
+# ------------ PDF render service (process pool, request threads se alag) ------------
+# ReportLab pure-Python hai aur GIL pakar kar rakhta hai; render alag processes mein hota hai
+# taake isi gunicorn worker ke baqi request threads na rukein.
+PDF_RENDER_PROCESSES = int(os.environ.get('PDF_RENDER_PROCESSES', str(min(2, os.cpu_count() or 1))))  # 0 => inline
+
+_render_metrics = {'submitted': 0, 'completed': 0, 'failed': 0, 'queue_depth': 0,
+                   'last_ms': None, 'max_ms': 0.0, 'total_ms': 0.0}
+_render_metrics_lock = threading.Lock()
+
+def _init_render_worker():
+    # Har render process start par ek dafa: font register + styles tayyar
+    register_urdu_font_once()
+    pdf_styles()
+
+def _render_pdf_task(chapter_name, questions_data, emit=None):
+    start = time.perf_counter()
+    stats = {}
+    pdf_path = create_beautiful_pdf(chapter_name, questions_data, emit, stats)
+    return {'pdf_path': pdf_path, 'render_ms': (time.perf_counter() - start) * 1000, 'pages': stats.get('pages', 0)}
+
+def _record_render(future):
+    with _render_metrics_lock:
+        _render_metrics['queue_depth'] -= 1
+        if future.cancelled() or future.exception() is not None or not future.result()['pdf_path']:
+            _render_metrics['failed'] += 1
+            return
+        render_ms = future.result()['render_ms']
+        PDF_RENDER_SECONDS.observe(render_ms / 1000)
+        PDF_PAGES.observe(future.result()['pages'])
+        _render_metrics['completed'] += 1
+        _render_metrics['last_ms'] = round(render_ms, 1)
+        _render_metrics['max_ms'] = round(max(_render_metrics['max_ms'], render_ms), 1)
+        _render_metrics['total_ms'] += render_ms
+
+def submit_pdf_render(chapter_name, questions_data, emit=None):
+    """PDF render queue karo; Future milta hai jiska result {'pdf_path', 'render_ms'} hai.
+
+    emit render process tak pickle hota hai (JobEventLog sirf file path hai), is liye
+    page events seedha wahin se job ki events file mein likhe jaate hain.
+    """
+    return _submit_render(_render_pdf_task, chapter_name, questions_data, emit)
+
+def _reset_broken_render_pool(pool):
+    # Koi render process crash hua — agla submit naya pool banayega (sirf wohi pool hatao jo toota)
+    with _process_pools_lock:
+        if _process_pools.get('pdf-render') is pool:
+            _process_pools.pop('pdf-render')
+            log_event('warning', 'pdf_render_pool_broken')
+
+def _submit_render(task, *args):
+    # task ka result {'pdf_path', 'render_ms', 'pages'} hona chahiye (_record_render ke liye)
+    with _render_metrics_lock:
+        _render_metrics['submitted'] += 1
+        _render_metrics['queue_depth'] += 1
+    if PDF_RENDER_PROCESSES <= 0:
+        future = Future()
+        try:
+            future.set_result(task(*args))
+        except Exception as e:
+            future.set_exception(e)
+        future.add_done_callback(_record_render)
+        return future
+    submitted = False
+    try:
+        for attempt in range(2):
+            pool = get_process_pool('pdf-render', PDF_RENDER_PROCESSES, initializer=_init_render_worker)
+            try:
+                future = pool.submit(task, *args)
+                break
+            except BrokenProcessPool:
+                _reset_broken_render_pool(pool)
+                if attempt:
+                    raise
+        def reset_if_broken(done, pool=pool):
+            if not done.cancelled() and isinstance(done.exception(), BrokenProcessPool):
+                _reset_broken_render_pool(pool)
+        future.add_done_callback(reset_if_broken)
+        future.add_done_callback(_record_render)
+        submitted = True
+        return future
+    finally:
+        if not submitted:
+            with _render_metrics_lock:
+                _render_metrics['queue_depth'] -= 1
+                _render_metrics['failed'] += 1
+
+def render_pdf(chapter_name, questions_data, emit=None):
+    """Blocking helper (job threads ke liye): render process ka intezar karke pdf_path."""
+    try:
+        return submit_pdf_render(chapter_name, questions_data, emit).result()['pdf_path']
+    except BrokenProcessPool:
+        # Pool _submit_render ne reset kar diya — yeh PDF yahin bana lo
+        log_event('warning', 'pdf_render_inline_fallback', chapter=chapter_name)
+        return create_beautiful_pdf(chapter_name, questions_data, emit)
+
+def warm_pdf_render_pool():
+    if PDF_RENDER_PROCESSES <= 0:
+        return
+    pool = get_process_pool('pdf-render', PDF_RENDER_PROCESSES, initializer=_init_render_worker)
+    for _ in range(PDF_RENDER_PROCESSES):
+        pool.submit(pdf_styles)   # processes abhi spawn ho jayein, pehli request par nahi
+
+def render_metrics():
+    with _render_metrics_lock:
+        metrics = dict(_render_metrics)
+    metrics['processes'] = PDF_RENDER_PROCESSES
+    metrics['avg_ms'] = round(metrics['total_ms'] / metrics['completed'], 1) if metrics['completed'] else None
+    metrics['total_ms'] = round(metrics['total_ms'], 1)
+    return metrics
+
+# ------------ PDF delivery (strong ETag, 304, Range, precompressed / linearized, proxy offload) ------------
+
+PDF_LINEARIZE = os.environ.get('PDF_LINEARIZE', '0') == '1'      # qpdf --linearize ("fast web view")
+PDF_PRECOMPRESS = os.environ.get('PDF_PRECOMPRESS', '0') == '1'  # <pdf>.gz bhi likho, gzip clients ko wahi do
+PDF_SENDFILE = os.environ.get('PDF_SENDFILE', 'off')             # off | x-sendfile | x-accel
+PDF_ACCEL_PREFIX = os.environ.get('PDF_ACCEL_PREFIX', '/protected-chapters/')  # nginx internal location -> chapters/
+PDF_ETAG_CACHE_SIZE = 2048
+QPDF_BIN = shutil.which('qpdf')
+
+if PDF_LINEARIZE and not QPDF_BIN:
+    log_event('warning', 'pdf_linearize_unavailable', reason='qpdf not found on PATH')
+
+_pdf_etags = OrderedDict()   # (path, mtime_ns, size, inode) -> sha256 prefix
+_pdf_etags_lock = threading.Lock()
+
+def _linearize_pdf(src_path, dest_path):
+    if not QPDF_BIN:
+        return False
+    try:
+        result = subprocess.run([QPDF_BIN, '--linearize', src_path, dest_path], capture_output=True, timeout=120)
+    except (OSError, subprocess.TimeoutExpired) as e:
+        log_event('warning', 'pdf_linearize_failed', path=src_path, error=str(e))
+        return False
+    # qpdf exit code 3 = sirf warnings, output theek hai
+    if result.returncode not in (0, 3):
+        log_event('warning', 'pdf_linearize_failed', path=src_path, error=result.stderr.decode('utf-8', 'replace')[:200])
+        return False
+    return True
+
+def publish_pdf(tmp_path, pdf_path):
+    """Bani hui tmp PDF ko (optional linearize ke baad) atomically pdf_path par rakho, phir optional .gz."""
+    if PDF_LINEARIZE:
+        linear_path = f"{tmp_path}.linear"
+        if _linearize_pdf(tmp_path, linear_path):
+            os.replace(linear_path, tmp_path)
+        elif os.path.exists(linear_path):
+            os.remove(linear_path)
+    gz_path = f"{pdf_path}.gz"
+    if os.path.exists(gz_path):
+        os.remove(gz_path)   # purani PDF ka .gz nayi PDF ke saath kabhi serve na ho
+    os.replace(tmp_path, pdf_path)
+    if PDF_PRECOMPRESS:
+        gz_tmp = f"{gz_path}.{uuid.uuid4().hex}.tmp"
+        with open(pdf_path, 'rb') as src, open(gz_tmp, 'wb') as raw, \
+                gzip.GzipFile(filename='', mode='wb', compresslevel=9, fileobj=raw, mtime=0) as dest:
+            shutil.copyfileobj(src, dest, 1024 * 1024)
+        os.replace(gz_tmp, gz_path)
+
+def pdf_etag(path, f, stat):
+    """Content hash (sha256) se strong ETag; (path, mtime, size, inode) par cache, is liye hash ek hi dafa."""
+    key = (path, stat.st_mtime_ns, stat.st_size, stat.st_ino)
+    with _pdf_etags_lock:
+        etag = _pdf_etags.get(key)
+        if etag is not None:
+            _pdf_etags.move_to_end(key)
+            return etag
+    digest = hashlib.sha256()
+    for block in iter(lambda: f.read(1024 * 1024), b''):
+        digest.update(block)
+    f.seek(0)
+    etag = digest.hexdigest()[:32]
+    with _pdf_etags_lock:
+        _pdf_etags[key] = etag
+        while len(_pdf_etags) > PDF_ETAG_CACHE_SIZE:
+            _pdf_etags.popitem(last=False)
+    return etag
+
+def send_pdf(pdf_path, download_name):
+    """Conditional (If-None-Match / If-Modified-Since => 304) aur Range (206) ke saath PDF response.
+
+    Jo file khuli hai usi ka stat, hash aur bytes — beech mein re-render ho jaye to bhi ETag aur
+    content hamesha match karte hain. FileNotFoundError caller sambhalta hai.
+    """
+    f = open(pdf_path, 'rb')
+    try:
+        stat = os.fstat(f.fileno())
+        etag = pdf_etag(pdf_path, f, stat)
+        kind = 'full'
+        if PDF_SENDFILE in ('x-sendfile', 'x-accel'):
+            # Bytes (aur Range) front proxy bhejta hai; hum sirf headers aur 304 dete hain
+            f.close()
+            response = app.response_class(mimetype='application/pdf')
+            if PDF_SENDFILE == 'x-sendfile':
+                response.headers['X-Sendfile'] = os.path.abspath(pdf_path)
+            else:
+                relative = os.path.relpath(pdf_path, CHAPTERS_DIR).replace(os.sep, '/')
+                response.headers['X-Accel-Redirect'] = PDF_ACCEL_PREFIX + urllib.parse.quote(relative)
+            kind = 'proxy'
+        else:
+            encoded = None
+            if PDF_PRECOMPRESS and not request.range and 'gzip' in request.accept_encodings:
+                try:
+                    encoded = open(f"{pdf_path}.gz", 'rb')
+                    # .gz PDF ke baad likha jata hai; purana ho to ignore
+                    if os.fstat(encoded.fileno()).st_mtime_ns < stat.st_mtime_ns:
+                        encoded.close()
+                        encoded = None
+                except FileNotFoundError:
+                    encoded = None
+            if encoded is not None:
+                f.close()
+                f = encoded
+                size = os.fstat(f.fileno()).st_size
+                etag = f"{etag}-gz"   # alag representation => alag strong ETag
+                kind = 'gzip'
+            else:
+                size = stat.st_size
+            response = app.response_class(wrap_file(request.environ, f), mimetype='application/pdf',
+                                          direct_passthrough=True)
+            response.content_length = size
+            if encoded is not None:
+                response.content_encoding = 'gzip'
+            if PDF_PRECOMPRESS:
+                response.vary.add('Accept-Encoding')
+            response.accept_ranges = 'bytes'
+    except BaseException:
+        f.close()
+        raise
+
+    response.headers.set('Content-Disposition', 'attachment', filename=download_name)
+    response.last_modified = stat.st_mtime
+    response.set_etag(etag)
+    # Har dafa revalidate (If-None-Match) — badli na ho to 304, browser apni cached copy use kare
+    response.cache_control.no_cache = True
+    response.cache_control.private = True
+    try:
+        response = response.make_conditional(request.environ, accept_ranges=kind != 'proxy',
+                                             complete_length=response.content_length if kind != 'proxy' else None)
+    except RequestedRangeNotSatisfiable:
+        response.close()
+        raise
+    if response.status_code == 304:
+        kind = 'not_modified'
+    elif response.status_code == 206:
+        kind = 'partial'
+    PDF_DOWNLOADS.inc(kind=kind)
+    return response
+
+# ------------ Bulk export (streamed ZIP / merged PDF with contents) ------------
+# ZIP kabhi memory ya disk par poora nahi banta: zipfile ek non-seekable sink mein likhta hai
+# aur har file ke chunks wahin se response mein chale jaate hain (data descriptors + zip64).
+
+EXPORT_DIR = os.path.join(DATA_DIR, 'exports')
+EXPORT_CHUNK_SIZE = 256 * 1024
+EXPORT_RENDER_AHEAD = int(os.environ.get('EXPORT_RENDER_AHEAD', str(max(2, PDF_RENDER_PROCESSES * 2))))
+EXPORT_LOOKAHEAD = 256                                                           # chapters, render queue ke aage
+EXPORT_PDF_MAX_CHAPTERS = int(os.environ.get('EXPORT_PDF_MAX_CHAPTERS', '500'))  # merged PDF ek hi file hai
+
+class _ZipChunkSink:
+    """zipfile ke liye write-only sink: tell/seek nahi, is liye zipfile streaming mode mein likhta hai."""
+    def __init__(self):
+        self._chunks = []
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b''.join(self._chunks)
+        self._chunks.clear()
+        return data
+
+def _export_entries(chapter_names, include_txt=True):
+    """(chapter_name, [(arcname, path)], rendered, error) order mein.
+
+    Jin chapters ki PDF nahi (lekin Q&A store hai) unki PDF render pool par banti hai — zyada se
+    zyada EXPORT_RENDER_AHEAD renders aage chalte hain, baqi chapters tab tak stream hote rehte hain.
+    """
+    names = iter(chapter_names)
+    pending = deque()   # (name, pdf_path, future | None)
+    in_flight = 0
+    while True:
+        while in_flight < EXPORT_RENDER_AHEAD and len(pending) < EXPORT_LOOKAHEAD:
+            name = next(names, None)
+            if name is None:
+                break
+            pdf_path = os.path.join(CHAPTERS_DIR, name, f"{name}_notes.pdf")
+            future = None
+            if not os.path.exists(pdf_path) and count_chapter_questions(name):
+                questions_data = {"questions": [item.model_dump() for _, item in iter_chapter_questions(name)]}
+                future = submit_pdf_render(name, questions_data)
+                in_flight += 1
+            pending.append((name, pdf_path, future))
+        if not pending:
+            return
+        name, pdf_path, future = pending.popleft()
+        rendered, error = False, None
+        if future is not None:
+            in_flight -= 1
+            try:
+                rendered = bool(future.result()['pdf_path'])
+                if not rendered:
+                    error = 'PDF render failed'
+            except Exception as e:
+                error = f"PDF render failed: {e}"
+            catalog_refresh_chapter(name)
+        files = []
+        for suffix, wanted in (('pdf', True), ('txt', include_txt)):
+            path = os.path.join(CHAPTERS_DIR, name, f"{name}_notes.{suffix}")
+            if wanted and os.path.exists(path):
+                files.append((f"{name}/{name}_notes.{suffix}", path))
+        if not files and error is None:
+            error = 'No notes found'
+        yield name, files, rendered, error
+
+def stream_export_zip(chapter_names, include_txt=True):
+    """ZIP bytes ka generator; memory mein ek waqt par sirf ek chunk (+ zip headers)."""
+    start = time.perf_counter()
+    sink = _ZipChunkSink()
+    sent = rendered_count = 0
+    errors = []
+    status = 'failed'
+    try:
+        with zipfile.ZipFile(sink, 'w', allowZip64=True) as archive:
+            for name, files, rendered, error in _export_entries(chapter_names, include_txt):
+                rendered_count += rendered
+                if error:
+                    errors.append(f"{name}: {error}")
+                for arcname, path in files:
+                    try:
+                        src = open(path, 'rb')
+                    except FileNotFoundError:   # beech mein delete ho gaya
+                        errors.append(f"{name}: {os.path.basename(path)} disappeared during export")
+                        continue
+                    with src:
+                        info = zipfile.ZipInfo.from_file(path, arcname)
+                        # PDF pehle se compressed hai — dobara deflate karna sirf CPU zaya karta hai
+                        info.compress_type = zipfile.ZIP_STORED if path.endswith('.pdf') else zipfile.ZIP_DEFLATED
+                        with archive.open(info, 'w') as dest:
+                            for block in iter(lambda: src.read(EXPORT_CHUNK_SIZE), b''):
+                                dest.write(block)
+                                data = sink.drain()
+                                if data:
+                                    sent += len(data)
+                                    yield data
+            if errors:
+                archive.writestr('export_errors.txt', "\n".join(errors) + "\n")
+        data = sink.drain()
+        sent += len(data)
+        yield data
+        status = 'ok'
+    finally:
+        EXPORTS_TOTAL.inc(format='zip', status=status)
+        EXPORT_BYTES.observe(sent, format='zip')
+        log_event('info' if status == 'ok' else 'warning', 'export_finished', format='zip', status=status,
+                  chapters=len(chapter_names), rendered=rendered_count, errors=len(errors), bytes=sent,
+                  duration_ms=round((time.perf_counter() - start) * 1000, 1))
+
+class _ChapterAnchor(Flowable):
+    """Zero-size flowable: is page par bookmark + outline entry (contents links yahin aate hain)."""
+    def __init__(self, key, title):
+        super().__init__()
+        self.key = key
+        self.title = title
+
+    def wrap(self, availWidth, availHeight):
+        return 0, 0
+
+    def draw(self):
+        self.canv.bookmarkPage(self.key)
+        self.canv.addOutlineEntry(self.title, self.key, level=0)
+
+class _LazyStory(list):
+    """ReportLab build() ke liye story jo chapter-by-chapter bharti hai — poori story kabhi memory mein nahi.
+
+    build() har flowable se pehle len() poochta hai; wahin agla chapter add ho jata hai.
+    """
+    def __init__(self, parts):
+        super().__init__()
+        self._parts = iter(parts)
+
+    def __len__(self):
+        while self._parts is not None and list.__len__(self) < 2:
+            part = next(self._parts, None)
+            if part is None:
+                self._parts = None
+            else:
+                self.extend(part)
+        return list.__len__(self)
+
+def create_merged_pdf(chapter_names, out_path):
+    """Kai chapters ki ek PDF: contents page (clickable) + har chapter ka outline bookmark.
+
+    Q&A store se chapter-by-chapter render hoti hai; question blocks wahi hain jo chapter PDF mein.
+    """
+    register_urdu_font_once()
+    font_name = URDU_FONT_NAME if URDU_FONT_NAME in pdfmetrics.getRegisteredFontNames() else "Helvetica"
+    styles = pdf_styles()
+    counts = [(name, count_chapter_questions(name) or 0) for name in chapter_names]
+
+    def parts():
+        contents = [Paragraph("<b>GoodWill Educational Content</b> | Notes export", styles['header']),
+                    Spacer(1, 16),
+                    Paragraph(esc("Contents"), styles['title'])]
+        for i, (name, count) in enumerate(counts):
+            contents.append(Paragraph(f'<a href="#chapter{i}" color="#2C3E50">{esc(name)}</a> — {count} questions',
+                                      styles['contents']))
+        yield contents
+        for i, (name, count) in enumerate(counts):
+            part = [PageBreak(), _ChapterAnchor(f"chapter{i}", name), Paragraph(esc(name), styles['title'])]
+            questions = [item.model_dump() for _, item in iter_chapter_questions(name)]
+            if questions:
+                part.extend(question_blocks(questions, font_name))
+            else:
+                part.append(Paragraph("No questions found in the processed data.", styles['normal']))
+            yield part
+
+    doc = SimpleDocTemplate(out_path, pagesize=A4, rightMargin=60, leftMargin=60, topMargin=80, bottomMargin=60,
+                            canvasmaker=WatermarkCanvas, title="GoodWill Notes export")
+    doc.build(_LazyStory(parts()), onFirstPage=lambda canv, _doc: canv.showOutline())
+    return doc.page
+
+def _render_merged_task(chapter_names, out_path):
+    start = time.perf_counter()
+    try:
+        pages = create_merged_pdf(chapter_names, out_path)
+    except Exception:
+        if os.path.exists(out_path):
+            os.remove(out_path)
+        raise
+    return {'pdf_path': out_path, 'render_ms': (time.perf_counter() - start) * 1000, 'pages': pages}
+
+def stream_export_file(path, fmt):
+    """Bani hui export file chunks mein (delete route ka call_on_close karta hai)."""
+    sent = 0
+    status = 'failed'
+    try:
+        with open(path, 'rb') as f:
+            for block in iter(lambda: f.read(EXPORT_CHUNK_SIZE), b''):
+                sent += len(block)
+                yield block
+        status = 'ok'
+    finally:
+        EXPORTS_TOTAL.inc(format=fmt, status=status)
+        EXPORT_BYTES.observe(sent, format=fmt)
+
 @app.route('/')
 def index():
     return render_template('index.html')
 
+# ------------ Structured Q&A store (validated JSON-lines per chapter) ------------
+
+class DuplicateRef(BaseModel):
+    """Kisi doosre chapter ka near-duplicate question (dedup index se)."""
+    chapter_name: str
+    number: int
+    similarity: float
+    answer_reused: bool = False
+
+class QAItem(BaseModel):
+    model_config = ConfigDict(extra='ignore', str_strip_whitespace=True)
+
+    question: str
+    answer_en: str = ""
+    answer_ur: str = ""
+    duplicate_of: DuplicateRef | None = None
+
+    @field_validator('question', 'answer_en', 'answer_ur', mode='before')
+    @classmethod
+    def _coerce_text(cls, value):
+        # Model kabhi null / number / list bhej deta hai
+        if value is None:
+            return ""
+        if isinstance(value, list):
+            return "\n".join(str(v) for v in value)
+        return str(value)
+
+_json_decoder = json.JSONDecoder()
+_OBJECT_START_RE = re.compile(r'\s*\{')
+
+class QuestionStreamParser:
+    """Model output se question objects nikalta hai jaise jaise mukammal hote hain.
+
+    feed() naye mukammal objects return karta hai (streaming ke liye); close() baqi
+    text mein se jo bhi mukammal objects bachein unhe recover karta hai — kata hua
+    (truncated) aakhri object chhor diya jata hai.
+    """
+    def __init__(self):
+        self.buf = ""
+        self.pos = 0
+        self.in_array = False
+        self.fallback_used = False
+        self.streamed = 0
+
+    def _find_array(self, final):
+        if self.pos == 0 and self.buf.lstrip().startswith('['):
+            return self.buf.index('[')
+        key = self.buf.find('"questions"', self.pos)
+        if key != -1:
+            return self.buf.find('[', key)
+        # "questions" key na mile to stream khatam hone par (sirf ek dafa) pehla top-level array le lo
+        if not final or self.fallback_used:
+            return -1
+        self.fallback_used = True
+        return self._top_level_array()
+
+    def _top_level_array(self):
+        """Pehla '[' jo kisi string ke andar na ho: ya to top-level array, ya top-level object ki
+        objects wali list (model kabhi "questions" ki jagah {"items": [...]} bhej deta hai).
+        Akele {question, ...} object ke answer mein "[1]" jaisa text array na samjha jaye."""
+        stack, in_string, escaped = [], False, False
+        for i in range(self.pos, len(self.buf)):
+            ch = self.buf[i]
+            if in_string:
+                if escaped:
+                    escaped = False
+                elif ch == '\\':
+                    escaped = True
+                elif ch == '"':
+                    in_string = False
+            elif ch == '"':
+                in_string = True
+            elif ch == '[':
+                if not stack or (stack == ['{'] and _OBJECT_START_RE.match(self.buf, i + 1)):
+                    return i
+                stack.append(ch)
+            elif ch == '{':
+                stack.append(ch)
+            elif ch in '}]' and stack:
+                stack.pop()
+        return -1
+
+    def _drain(self, final=False):
+        found = []
+        while True:
+            if not self.in_array:
+                start = self._find_array(final)
+                if start == -1:
+                    return found
+                self.pos, self.in_array = start + 1, True
+            while self.pos < len(self.buf) and self.buf[self.pos] in ' \t\r\n,':
+                self.pos += 1
+            if self.pos >= len(self.buf):
+                return found
+            if self.buf[self.pos] == ']':
+                self.pos += 1
+                self.in_array = False
+                continue
+            try:
+                value, end = _json_decoder.raw_decode(self.buf, self.pos)
+            except ValueError:
+                if not final:
+                    return found   # object abhi adhoora hai — mazeed text ka intezar
+                # Kharab/kata hua object: agle '{' se dobara koshish
+                JSON_PARSE_FAILURES.inc(kind='malformed_object')
+                next_obj = self.buf.find('{', self.pos + 1)
+                if next_obj == -1:
+                    return found
+                self.pos = next_obj
+                continue
+            self.pos = end
+            if isinstance(value, dict):
+                found.append(value)
+
+    def feed(self, text):
+        self.buf += text
+        found = self._drain()
+        self.streamed += len(found)
+        return found
+
+    def close(self):
+        found = self._drain(final=True)
+        if not self.streamed and not any("question" in qa for qa in found):
+            # Questions ka array nahi mila: shayad akela {question, ...} object hai
+            try:
+                data = json.loads(self.buf)
+            except ValueError:
+                if not found and self.buf.strip():
+                    JSON_PARSE_FAILURES.inc(kind='no_json')
+                return found
+            if isinstance(data, dict) and "question" in data:
+                return [data]
+        return found
+
+def parse_question_dicts(raw):
+    parser = QuestionStreamParser()
+    return parser.feed(raw or "") + parser.close()
+
+def parse_model_output(raw):
+    """Raw model text (ya questions dict/list) -> validated [QAItem]."""
+    if isinstance(raw, str):
+        candidates = parse_question_dicts(raw)
+    elif isinstance(raw, dict):
+        candidates = raw.get("questions", [])
+    else:
+        candidates = raw or []
+    items = []
+    for candidate in candidates:
+        if isinstance(candidate, QAItem):
+            items.append(candidate)
+            continue
+        try:
+            items.append(QAItem.model_validate(candidate))
+        except ValidationError as e:
+            JSON_PARSE_FAILURES.inc(kind='invalid_question')
+            log_event('warning', 'invalid_question_skipped', reason=e.errors()[0].get('msg'))
+    return items
+
+QUESTION_STORE_OPEN_ATTEMPTS = 3
+
+def _questions_pointer_path(chapter_name):
+    return os.path.join(CHAPTERS_DIR, chapter_name, f"{chapter_name}_questions.current")
+
+def _questions_version_paths(chapter_name, version):
+    base = os.path.join(CHAPTERS_DIR, chapter_name, f"{chapter_name}_questions")
+    return f"{base}.{version}.jsonl", f"{base}.{version}.idx"
+
+def _current_questions_version(chapter_name):
+    try:
+        with open(_questions_pointer_path(chapter_name), 'r', encoding='utf-8') as f:
+            return f.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+def _write_questions_index(idx_path, offsets):
+    tmp_index = f"{idx_path}.{uuid.uuid4().hex}.tmp"
+    with open(tmp_index, 'wb') as f:
+        offsets.tofile(f)
+    os.replace(tmp_index, idx_path)
+
+def _remove_old_question_versions(chapter_name, keep):
+    """Pichle versions hatao; Windows par khuli file na hate to agli save par hat jayegi."""
+    folder = os.path.join(CHAPTERS_DIR, chapter_name)
+    prefix = f"{chapter_name}_questions."
+    for file_name in os.listdir(folder):
+        # .tmp = kisi aur save/rebuild ki adhoori files
+        if not file_name.startswith(prefix) or file_name.endswith('.tmp'):
+            continue
+        version = file_name[len(prefix):].split('.', 1)[0]
+        if version not in (keep, 'current'):
+            try:
+                os.remove(os.path.join(folder, file_name))
+            except OSError:
+                pass
+
+def save_chapter_questions(chapter_name, items):
+    """JSON-lines store + byte-offset index (.idx) taake kisi bhi question tak seek ho sake.
+
+    Dono files ek naye version naam se likhi jati hain; phir `_questions.current` pointer ek
+    os.replace se badalta hai — reader ko hamesha ek hi version ka store aur idx milta hai.
+    """
+    version = uuid.uuid4().hex[:16]
+    store_path, idx_path = _questions_version_paths(chapter_name, version)
+    offsets = array('Q')
+    with open(f"{store_path}.tmp", 'wb') as f:
+        for item in items:
+            offsets.append(f.tell())
+            f.write(item.model_dump_json(exclude_none=True).encode('utf-8') + b"\n")
+    with open(f"{idx_path}.tmp", 'wb') as f:
+        offsets.tofile(f)
+    os.replace(f"{store_path}.tmp", store_path)
+    os.replace(f"{idx_path}.tmp", idx_path)
+    pointer_path = _questions_pointer_path(chapter_name)
+    tmp_pointer = f"{pointer_path}.{uuid.uuid4().hex}.tmp"
+    with open(tmp_pointer, 'w', encoding='utf-8') as f:
+        f.write(version)
+    os.replace(tmp_pointer, pointer_path)
+    _remove_old_question_versions(chapter_name, version)
+    return store_path
+
+def _ensure_questions_store(chapter_name):
+    """Purane chapters (sirf _notes.txt, ya pehle wala `_questions.jsonl`) ka store pehli dafa
+    parhne par bana do."""
+    if _current_questions_version(chapter_name):
+        return True
+    legacy_path = os.path.join(CHAPTERS_DIR, chapter_name, f"{chapter_name}_questions.jsonl")
+    if os.path.exists(legacy_path):
+        with open(legacy_path, 'rb') as f:
+            items = [QAItem.model_validate_json(line) for line in f if line.strip()]
+        save_chapter_questions(chapter_name, items)
+        return True
+    txt_path = os.path.join(CHAPTERS_DIR, chapter_name, f"{chapter_name}_notes.txt")
+    if not os.path.exists(txt_path):
+        return False
+    with open(txt_path, 'r', encoding='utf-8') as f:
+        content = f.read()
+    marker = "Questions and Answers (JSON Format):\n"
+    save_chapter_questions(chapter_name, parse_model_output(content.split(marker, 1)[-1]))
+    return True
+
+def _questions_index_valid(store_f, idx_f):
+    store_size = os.fstat(store_f.fileno()).st_size
+    idx_size = os.fstat(idx_f.fileno()).st_size
+    if idx_size % 8 or (idx_size == 0) != (store_size == 0):
+        return False
+    if not idx_size:
+        return True
+    # Aakhri offset store ki aakhri line ke shuru par hona chahiye
+    last = array('Q')
+    idx_f.seek(idx_size - 8)
+    last.fromfile(idx_f, 1)
+    idx_f.seek(0)
+    if last[0] >= store_size:
+        return False
+    store_f.seek(last[0] - 1 if last[0] else 0)
+    tail = store_f.read()
+    store_f.seek(0)
+    if last[0]:
+        if tail[:1] != b"\n":
+            return False
+        tail = tail[1:]
+    return tail.count(b"\n") == 1 and tail.endswith(b"\n")
+
+def _rebuild_questions_index(store_f, idx_path):
+    offsets = array('Q')
+    store_f.seek(0)
+    position = 0
+    for line in store_f:
+        offsets.append(position)
+        position += len(line)
+    store_f.seek(0)
+    _write_questions_index(idx_path, offsets)
+    log_event('warning', 'questions_index_rebuilt', path=idx_path, questions=len(offsets))
+
+@contextmanager
+def _open_questions(chapter_name):
+    """Current version ke (store, idx) file objects; store na ho to None.
+
+    idx gum ya store se mismatch ho to store se dobara bana liya jata hai. Beech mein naya
+    version publish ho kar purana hat jaye to pointer dobara parha jata hai.
+    """
+    for attempt in range(QUESTION_STORE_OPEN_ATTEMPTS):
+        if not _ensure_questions_store(chapter_name):
+            yield None
+            return
+        version = _current_questions_version(chapter_name)
+        store_path, idx_path = _questions_version_paths(chapter_name, version)
+        try:
+            store_f = open(store_path, 'rb')
+        except FileNotFoundError:
+            if attempt + 1 < QUESTION_STORE_OPEN_ATTEMPTS:
+                continue
+            raise
+        with store_f:
+            try:
+                idx_f = open(idx_path, 'rb')
+            except FileNotFoundError:
+                idx_f = None
+                if (version != _current_questions_version(chapter_name)
+                        and attempt + 1 < QUESTION_STORE_OPEN_ATTEMPTS):
+                    continue   # purana version hat raha hai — naya parho
+            if idx_f is None or not _questions_index_valid(store_f, idx_f):
+                if idx_f is not None:
+                    idx_f.close()
+                _rebuild_questions_index(store_f, idx_path)
+                idx_f = open(idx_path, 'rb')
+            with idx_f:
+                yield store_f, idx_f
+        return
+
+def count_chapter_questions(chapter_name):
+    with _open_questions(chapter_name) as files:
+        if files is None:
+            return None
+        return os.fstat(files[1].fileno()).st_size // 8
+
+def get_chapter_question(chapter_name, number):
+    """number 1-based; sirf wohi ek line parhi jati hai."""
+    with _open_questions(chapter_name) as files:
+        if files is None:
+            return None
+        store_f, idx_f = files
+        if not 1 <= number <= os.fstat(idx_f.fileno()).st_size // 8:
+            return None
+        offsets = array('Q')
+        idx_f.seek((number - 1) * 8)
+        offsets.fromfile(idx_f, 1)
+        store_f.seek(offsets[0])
+        return QAItem.model_validate_json(store_f.readline())
+
+def iter_chapter_questions(chapter_name, start=0):
+    """(number, QAItem) stream karta hai, poori file memory mein load kiye baghair."""
+    with _open_questions(chapter_name) as files:
+        if files is None:
+            return
+        store_f, idx_f = files
+        if start:
+            offsets = array('Q')
+            idx_f.seek(start * 8)
+            try:
+                offsets.fromfile(idx_f, 1)
+            except EOFError:
+                return
+            store_f.seek(offsets[0])
+        for number, line in enumerate(store_f, start + 1):
+            yield number, QAItem.model_validate_json(line)
+
+def page_chapter_questions(chapter_name, offset=0, limit=20, query=None):
+    """(items, total) — query ho to question/answers mein case-insensitive substring search."""
+    total = count_chapter_questions(chapter_name)
+    if total is None:
+        return None, 0
+    results = []
+    if not query:
+        for number, item in iter_chapter_questions(chapter_name, start=offset):
+            if len(results) >= limit:
+                break
+            results.append({'number': number, **item.model_dump()})
+        return results, total
+
+    needle = query.casefold()
+    matched = 0
+    for number, item in iter_chapter_questions(chapter_name):
+        if needle in item.question.casefold() or needle in item.answer_en.casefold() or needle in item.answer_ur.casefold():
+            if offset <= matched < offset + limit:
+                results.append({'number': number, **item.model_dump()})
+            matched += 1
+    return results, matched
+
+# ------------ Full-text search (SQLite FTS5 across all chapters) ------------
+
+SEARCH_DB = os.path.join(DATA_DIR, 'search.sqlite3')
+
+# Urdu/Arabic normalisation: zer/zabar/pesh waghera hatao, alef/yeh/kaf/heh ki shaklein ek karo
+_URDU_DIACRITICS_RE = re.compile('[\u0610-\u061A\u064B-\u065F\u0670\u06D6-\u06ED\u0640]')
+_URDU_CHAR_MAP = str.maketrans({
+    'أ': 'ا', 'إ': 'ا', 'آ': 'ا', 'ٱ': 'ا', 'ٲ': 'ا', 'ٳ': 'ا',
+    'ي': 'ی', 'ى': 'ی', 'ئ': 'ی', 'ۍ': 'ی', 'ې': 'ی',
+    'ك': 'ک', 'ه': 'ہ', 'ۀ': 'ہ', 'ة': 'ہ',
+})
+_SEARCH_TERM_RE = re.compile(r'\w+', re.UNICODE)
+
+def normalize_search_text(text):
+    text = unicodedata.normalize('NFKC', text or '')   # presentation forms -> asal huroof
+    text = _URDU_DIACRITICS_RE.sub('', text)
+    return text.translate(_URDU_CHAR_MAP).casefold()
+
+def _search_conn():
+    conn = sqlite3.connect(SEARCH_DB, timeout=30)
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("""CREATE TABLE IF NOT EXISTS qa_docs (
+                        id INTEGER PRIMARY KEY,
+                        chapter TEXT NOT NULL,
+                        number INTEGER NOT NULL,
+                        question TEXT NOT NULL,
+                        answer_en TEXT NOT NULL,
+                        answer_ur TEXT NOT NULL)""")
+    conn.execute("CREATE INDEX IF NOT EXISTS qa_docs_chapter ON qa_docs(chapter)")
+    # FTS table mein normalised text; rowid == qa_docs.id. chapter UNINDEXED taake filter/count
+    # ke liye qa_docs se join na karna pare.
+    conn.execute("""CREATE VIRTUAL TABLE IF NOT EXISTS qa_fts USING fts5(
+                        question, answer_en, answer_ur, chapter UNINDEXED,
+                        tokenize = 'unicode61 remove_diacritics 2')""")
+    conn.execute("CREATE TABLE IF NOT EXISTS search_meta (key TEXT PRIMARY KEY, value INTEGER NOT NULL)")
+    return conn
+
+def _search_delete_chapter(conn, chapter_name):
+    ids = [row[0] for row in conn.execute("SELECT id FROM qa_docs WHERE chapter = ?", (chapter_name,))]
+    conn.executemany("DELETE FROM qa_fts WHERE rowid = ?", [(i,) for i in ids])
+    conn.execute("DELETE FROM qa_docs WHERE chapter = ?", (chapter_name,))
+
+def _search_insert_chapter(conn, chapter_name, items):
+    for number, item in enumerate(items, 1):
+        cur = conn.execute("INSERT INTO qa_docs (chapter, number, question, answer_en, answer_ur) VALUES (?, ?, ?, ?, ?)",
+                           (chapter_name, number, item.question, item.answer_en, item.answer_ur))
+        conn.execute("INSERT INTO qa_fts (rowid, question, answer_en, answer_ur, chapter) VALUES (?, ?, ?, ?, ?)",
+                     (cur.lastrowid, normalize_search_text(item.question),
+                      normalize_search_text(item.answer_en), normalize_search_text(item.answer_ur), chapter_name))
+
+def search_index_chapter(chapter_name, items):
+    """Notes bante hi sirf isi chapter ke rows badlo (incremental)."""
+    with _search_conn() as conn:
+        _search_delete_chapter(conn, chapter_name)
+        _search_insert_chapter(conn, chapter_name, items)
+
+def search_remove_chapter(chapter_name):
+    with _search_conn() as conn:
+        _search_delete_chapter(conn, chapter_name)
+
+def rebuild_search_index():
+    """Saare chapters ke Q&A stores se index dobara banao."""
+    count = 0
+    with _search_conn() as conn:
+        conn.execute("DELETE FROM qa_docs")
+        conn.execute("DELETE FROM qa_fts")
+        for chapter_name in sorted(os.listdir(CHAPTERS_DIR)):
+            if not os.path.isdir(os.path.join(CHAPTERS_DIR, chapter_name)):
+                continue
+            items = [item for _, item in iter_chapter_questions(chapter_name)]
+            _search_insert_chapter(conn, chapter_name, items)
+            count += len(items)
+        conn.execute("INSERT OR REPLACE INTO search_meta (key, value) VALUES ('built', 1)")
+    return count
+
+def _ensure_search_index():
+    with _search_conn() as conn:
+        built = conn.execute("SELECT value FROM search_meta WHERE key = 'built'").fetchone()
+    if built is None:
+        rebuild_search_index()
+
+def build_fts_query(query):
+    """User text -> FTS5 MATCH expression (har term AND, aakhri term prefix)."""
+    terms = _SEARCH_TERM_RE.findall(normalize_search_text(query))
+    if not terms:
+        return None
+    quoted = [f'"{term}"' for term in terms]
+    quoted[-1] += '*'
+    return ' '.join(quoted)
+
+def search_questions(query, page=1, per_page=20, chapter=None):
+    match = build_fts_query(query)
+    if match is None:
+        return [], 0
+    _ensure_search_index()
+    where = "qa_fts MATCH ?"
+    params = [match]
+    if chapter:
+        where += " AND qa_fts.chapter = ?"
+        params.append(chapter)
+    with _search_conn() as conn:
+        total = conn.execute(f"SELECT COUNT(*) FROM qa_fts WHERE {where}", params).fetchone()[0]
+        # Pehle sirf is page ke rowids rank karo, phir unhi ke original texts join karo.
+        # bm25: question column ka wazan zyada
+        rows = conn.execute(f"""SELECT d.chapter, d.number, d.question, d.answer_en, d.answer_ur, hits.rank
+                               FROM (SELECT rowid, bm25(qa_fts, 4.0, 1.0, 1.0, 0.0) AS rank FROM qa_fts
+                                     WHERE {where} ORDER BY rank LIMIT ? OFFSET ?) AS hits
+                               JOIN qa_docs d ON d.id = hits.rowid ORDER BY hits.rank""",
+                            params + [per_page, (max(page, 1) - 1) * per_page]).fetchall()
+    return [{
+        'chapter_name': row['chapter'],
+        'number': row['number'],
+        'question': row['question'],
+        'answer_en': row['answer_en'],
+        'answer_ur': row['answer_ur'],
+        'score': round(-row['rank'], 6),
+    } for row in rows], total
+
+@app.cli.command('rebuild-search-index')
+def rebuild_search_index_command():
+    """flask rebuild-search-index — saare chapters ke questions dobara index karo."""
+    print(f"Search index rebuilt: {rebuild_search_index()} questions")
+
+# ------------ Near-duplicate questions (MinHash + LSH across chapters) ------------
+# Har question ke normalised character shingles ka MinHash signature banta hai; signature ko
+# bands mein kaat kar har band ka bucket SQLite index mein rakha jata hai. Lookup sirf unhi
+# docs ko dekhta hai jo kisi bucket mein takrayein — poore corpus se compare nahi hota.
+
+DEDUP_DB = os.path.join(DATA_DIR, 'dedup.sqlite3')
+DEDUP_SHINGLE_SIZE = 4
+DEDUP_BANDS = 32
+DEDUP_ROWS = 4                                    # 32 x 4 = 128 permutations, ~0.42 par candidate
+DEDUP_THRESHOLD = float(os.environ.get('DEDUP_THRESHOLD', '0.8'))              # duplicate mark karne ke liye
+DEDUP_REUSE_THRESHOLD = float(os.environ.get('DEDUP_REUSE_THRESHOLD', '0.9'))  # purana answer lagane ke liye
+DEDUP_REUSE_DEFAULT = os.environ.get('DEDUP_REUSE_ANSWERS', '0') == '1'
+DEDUP_VERSION = 2   # shingles/hashing badle to barhao — index khud dobara banega
+
+_MINHASH_PRIME = np.uint64((1 << 61) - 1)
+_minhash_rng = np.random.RandomState(0x5EED)   # fixed seed: signatures restarts ke baad bhi same
+_MINHASH_A = _minhash_rng.randint(1, 1 << 31, size=(DEDUP_BANDS * DEDUP_ROWS, 1)).astype(np.uint64)
+_MINHASH_B = _minhash_rng.randint(0, 1 << 31, size=(DEDUP_BANDS * DEDUP_ROWS, 1)).astype(np.uint64)
+# Sirf numbering jiske baad delimiter ho ("1." "(2)" "3)" "Q4:" "Question 5") — "1905 mein..." ya
+# "2 + 2" jaise questions ka number nahi hatna chahiye. "1.5" decimal hai, numbering nahi.
+_QUESTION_NUMBER_RE = re.compile(r'\s*(?:q(?:uestion)?\s*\.?\s*(?:no\.?\s*)?#?\s*\d+[a-z]?(?!\w|\.\d)\s*[.):]?'
+                                 r'|\(?\d+[a-z]?\s*[.):](?!\d))')
+_APOSTROPHE_RE = re.compile("['\u2019`]")
+
+def question_shingles(text):
+    """Numbering/punctuation/diacritics hata kar character shingles (32-bit hashes)."""
+    norm = normalize_search_text(text)
+    numbering = _QUESTION_NUMBER_RE.match(norm)
+    if numbering:
+        norm = norm[numbering.end():]   # "Q3." / "12)" jaisi numbering har paper mein alag hoti hai
+    terms = _SEARCH_TERM_RE.findall(_APOSTROPHE_RE.sub('', norm))   # Newton's == Newtons
+    norm = ' '.join(terms)
+    if not norm:
+        return set()
+    if len(norm) <= DEDUP_SHINGLE_SIZE:
+        return {zlib.crc32(norm.encode('utf-8'))}
+    return {zlib.crc32(norm[i:i + DEDUP_SHINGLE_SIZE].encode('utf-8'))
+            for i in range(len(norm) - DEDUP_SHINGLE_SIZE + 1)}
+
+def minhash_signatures(texts):
+    """texts -> [uint32 signature ya None]; saare texts ek hi numpy pass mein."""
+    shingle_sets = [question_shingles(text) for text in texts]
+    present = [i for i, s in enumerate(shingle_sets) if s]
+    signatures = [None] * len(texts)
+    if not present:
+        return signatures
+    hashes = np.fromiter((h for i in present for h in shingle_sets[i]), dtype=np.uint64)
+    starts = np.cumsum([0] + [len(shingle_sets[i]) for i in present[:-1]])
+    # (a*x + b) mod p — a, b < 2^31 aur x < 2^32, is liye uint64 overflow nahi hota
+    permuted = (_MINHASH_A * hashes + _MINHASH_B) % _MINHASH_PRIME & np.uint64(0xFFFFFFFF)
+    mins = np.minimum.reduceat(permuted, starts, axis=1).astype(np.uint32)
+    for column, i in enumerate(present):
+        signatures[i] = np.ascontiguousarray(mins[:, column])
+    return signatures
+
+def lsh_buckets(signature):
+    """Har band ka bucket id (band number bhi hash mein, taake ek hi column par index chale)."""
+    return [int.from_bytes(hashlib.blake2b(bytes([band]) + signature[band * DEDUP_ROWS:(band + 1) * DEDUP_ROWS].tobytes(),
+                                           digest_size=8).digest(), 'big', signed=True)
+            for band in range(DEDUP_BANDS)]
+
+def _dedup_conn():
+    conn = sqlite3.connect(DEDUP_DB, timeout=30)
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("""CREATE TABLE IF NOT EXISTS dedup_docs (
+                        id INTEGER PRIMARY KEY,
+                        chapter TEXT NOT NULL,
+                        number INTEGER NOT NULL,
+                        answer_en TEXT NOT NULL,
+                        answer_ur TEXT NOT NULL,
+                        signature BLOB NOT NULL)""")
+    conn.execute("CREATE INDEX IF NOT EXISTS dedup_docs_chapter ON dedup_docs(chapter)")
+    conn.execute("CREATE TABLE IF NOT EXISTS dedup_bands (bucket INTEGER NOT NULL, doc_id INTEGER NOT NULL)")
+    conn.execute("CREATE INDEX IF NOT EXISTS dedup_bands_bucket ON dedup_bands(bucket)")
+    conn.execute("CREATE INDEX IF NOT EXISTS dedup_bands_doc ON dedup_bands(doc_id)")
+    conn.execute("CREATE TABLE IF NOT EXISTS dedup_meta (key TEXT PRIMARY KEY, value INTEGER NOT NULL)")
+    # Kaun sa chapter kis chapter ke question ko duplicate_of mein refer karta hai
+    conn.execute("CREATE TABLE IF NOT EXISTS dedup_refs (chapter TEXT NOT NULL, target TEXT NOT NULL)")
+    conn.execute("CREATE INDEX IF NOT EXISTS dedup_refs_target ON dedup_refs(target)")
+    return conn
+
+def _dedup_delete_chapter(conn, chapter_name):
+    conn.execute("DELETE FROM dedup_bands WHERE doc_id IN (SELECT id FROM dedup_docs WHERE chapter = ?)", (chapter_name,))
+    conn.execute("DELETE FROM dedup_docs WHERE chapter = ?", (chapter_name,))
+    conn.execute("DELETE FROM dedup_refs WHERE chapter = ?", (chapter_name,))
+
+def _dedup_insert_chapter(conn, chapter_name, items, signatures=None):
+    if signatures is None:
+        signatures = minhash_signatures([item.question for item in items])
+    for number, (item, signature) in enumerate(zip(items, signatures), 1):
+        if signature is None:
+            continue
+        cur = conn.execute("INSERT INTO dedup_docs (chapter, number, answer_en, answer_ur, signature) VALUES (?, ?, ?, ?, ?)",
+                           (chapter_name, number, item.answer_en, item.answer_ur, signature.tobytes()))
+        conn.executemany("INSERT INTO dedup_bands (bucket, doc_id) VALUES (?, ?)",
+                         [(bucket, cur.lastrowid) for bucket in lsh_buckets(signature)])
+    targets = {item.duplicate_of.chapter_name for item in items if item.duplicate_of}
+    conn.executemany("INSERT INTO dedup_refs (chapter, target) VALUES (?, ?)",
+                     [(chapter_name, target) for target in sorted(targets)])
+
+def _dedup_best_match(conn, signature, exclude_chapter):
+    """LSH candidates mein se sab se milta julta (similarity, row); barabar ho to purana doc."""
+    buckets = lsh_buckets(signature)
+    rows = conn.execute(f"""SELECT d.id, d.chapter, d.number, d.answer_en, d.answer_ur, d.signature
+                            FROM dedup_docs d
+                            WHERE d.id IN (SELECT doc_id FROM dedup_bands WHERE bucket IN ({','.join('?' * len(buckets))}))
+                              AND d.chapter != ?
+                            ORDER BY d.id""", buckets + [exclude_chapter]).fetchall()
+    if not rows:
+        return None
+    candidates = np.frombuffer(b''.join(row['signature'] for row in rows), dtype=np.uint32).reshape(len(rows), -1)
+    similarity = (candidates == signature).mean(axis=1)
+    best = int(np.argmax(similarity))   # argmax pehla max deta hai => sab se purana doc
+    return float(similarity[best]), rows[best]
+
+def rebuild_dedup_index():
+    count = 0
+    with _dedup_conn() as conn:
+        conn.execute("DELETE FROM dedup_bands")
+        conn.execute("DELETE FROM dedup_docs")
+        conn.execute("DELETE FROM dedup_refs")
+        for chapter_name in sorted(os.listdir(CHAPTERS_DIR)):
+            if not os.path.isdir(os.path.join(CHAPTERS_DIR, chapter_name)):
+                continue
+            items = [item for _, item in iter_chapter_questions(chapter_name)]
+            _dedup_insert_chapter(conn, chapter_name, items)
+            count += len(items)
+        conn.execute("INSERT OR REPLACE INTO dedup_meta (key, value) VALUES ('built', ?)", (DEDUP_VERSION,))
+    return count
+
+def _ensure_dedup_index():
+    with _dedup_conn() as conn:
+        built = conn.execute("SELECT value FROM dedup_meta WHERE key = 'built'").fetchone()
+    if built is None or built[0] != DEDUP_VERSION:
+        rebuild_dedup_index()
+
+def dedup_chapter(chapter_name, items, reuse_answers=False, stats=None):
+    """Doosre chapters mein near-duplicate questions dhoondo, mark karo, opt-in par answer reuse karo.
+
+    Naye items return karta hai aur isi chapter ko index mein update kar deta hai.
+    """
+    _ensure_dedup_index()
+    signatures = minhash_signatures([item.question for item in items])
+    marked, duplicates, reused = [], 0, 0
+    with _dedup_conn() as conn:
+        for item, signature in zip(items, signatures):
+            match = _dedup_best_match(conn, signature, chapter_name) if signature is not None else None
+            if match is None or match[0] < DEDUP_THRESHOLD:
+                marked.append(item)
+                continue
+            similarity, row = match
+            reuse = reuse_answers and similarity >= DEDUP_REUSE_THRESHOLD and bool(row['answer_en'] or row['answer_ur'])
+            update = {'answer_en': row['answer_en'], 'answer_ur': row['answer_ur']} if reuse else {}
+            update['duplicate_of'] = DuplicateRef(chapter_name=row['chapter'], number=row['number'],
+                                                  similarity=round(similarity, 3), answer_reused=reuse)
+            marked.append(item.model_copy(update=update))
+            duplicates += 1
+            reused += reuse
+        _dedup_delete_chapter(conn, chapter_name)
+        _dedup_insert_chapter(conn, chapter_name, marked, signatures)
+    if stats is not None:
+        stats['duplicates'] = duplicates
+        stats['answers_reused'] = reused
+    return marked
+
+def dedup_remove_chapter(chapter_name):
+    """Chapter index se nikalo aur doosre chapters mein iski taraf ishara karne wale duplicate_of
+    saaf karo (store dobara likha jata hai, PDF render queue mein). Saaf kiye chapters return."""
+    _ensure_dedup_index()
+    with _dedup_conn() as conn:
+        _dedup_delete_chapter(conn, chapter_name)
+        referrers = [row['chapter'] for row in conn.execute(
+            "SELECT DISTINCT chapter FROM dedup_refs WHERE target = ? ORDER BY chapter", (chapter_name,))]
+        conn.execute("DELETE FROM dedup_refs WHERE target = ?", (chapter_name,))
+    for referrer in referrers:
+        try:
+            items = [item.model_copy(update={'duplicate_of': None})
+                     if item.duplicate_of and item.duplicate_of.chapter_name == chapter_name else item
+                     for _, item in iter_chapter_questions(referrer)]
+            save_chapter_questions(referrer, items)
+            submit_pdf_render(referrer, {"questions": [item.model_dump() for item in items]})
+        except Exception as e:
+            log_event('warning', 'dedup_reference_clear_failed', chapter=referrer, target=chapter_name, error=str(e))
+    if referrers:
+        log_event('info', 'dedup_references_cleared', target=chapter_name, chapters=len(referrers))
+    return referrers
+
+@app.cli.command('prune-derivatives')
+def prune_derivatives_command():
+    """flask prune-derivatives — purane/zyada preprocessed images data/derivatives se hatao."""
+    removed, freed = prune_derivatives()
+    print(f"Derivatives pruned: {removed} files, {freed // (1024 * 1024)} MiB freed")
+
+@app.cli.command('rebuild-dedup-index')
+def rebuild_dedup_index_command():
+    """flask rebuild-dedup-index — saare chapters ke question fingerprints dobara banao."""
+    print(f"Dedup index rebuilt: {rebuild_dedup_index()} questions")
+
+# ------------ Chapter catalog (SQLite index for /get-chapters) ------------
+
+CATALOG_DB = os.path.join(DATA_DIR, 'catalog.sqlite3')
+CATALOG_SORT_FIELDS = {'name', 'created_date', 'notes_date', 'image_count'}
+
+def _catalog_conn():
+    conn = sqlite3.connect(CATALOG_DB, timeout=30)
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("""CREATE TABLE IF NOT EXISTS chapters (
+                        name TEXT PRIMARY KEY,
+                        image_count INTEGER NOT NULL DEFAULT 0,
+                        has_notes INTEGER NOT NULL DEFAULT 0,
+                        has_pdf INTEGER NOT NULL DEFAULT 0,
+                        notes_date TEXT,
+                        created_date TEXT)""")
+    conn.execute("CREATE TABLE IF NOT EXISTS catalog_meta (key TEXT PRIMARY KEY, value INTEGER NOT NULL)")
+    return conn
+
+def _bump_catalog_version(conn):
+    # Har tabdeeli par version barhta hai => ETag badal jata hai
+    conn.execute("""INSERT INTO catalog_meta (key, value) VALUES ('version', 1)
+                    ON CONFLICT(key) DO UPDATE SET value = value + 1""")
+
+def _scan_chapter_folder(folder_name):
+    """Sirf ek chapter folder ka row banata hai (poore CHAPTERS_DIR ka walk nahi)."""
+    folder_path = os.path.join(CHAPTERS_DIR, folder_name)
+    manifest = load_chapter_manifest(folder_path)
+    notes_path = os.path.join(folder_path, f"{folder_name}_notes.txt")
+    has_notes = os.path.isfile(notes_path)
+    if manifest is not None:
+        image_count = len(manifest['images'])
+    else:
+        image_count = sum(1 for f in os.listdir(folder_path)
+                          if allowed_file(f) and os.path.isfile(os.path.join(folder_path, f)))
+    return {
+        'name': folder_name,
+        'image_count': image_count,
+        'has_notes': has_notes,
+        'has_pdf': os.path.isfile(os.path.join(folder_path, f"{folder_name}_notes.pdf")),
+        'notes_date': datetime.fromtimestamp(os.path.getmtime(notes_path)).strftime('%Y-%m-%d %H:%M:%S') if has_notes else None,
+        'created_date': datetime.fromtimestamp(os.path.getctime(folder_path)).strftime('%Y-%m-%d %H:%M:%S'),
+    }
+
+def catalog_refresh_chapter(chapter_name):
+    if not os.path.isdir(os.path.join(CHAPTERS_DIR, chapter_name)):
+        return catalog_remove_chapter(chapter_name)
+    row = _scan_chapter_folder(chapter_name)
+    with _catalog_conn() as conn:
+        # created_date pehli dafa wala hi rehta hai
+        conn.execute("""INSERT INTO chapters (name, image_count, has_notes, has_pdf, notes_date, created_date)
+                        VALUES (:name, :image_count, :has_notes, :has_pdf, :notes_date, :created_date)
+                        ON CONFLICT(name) DO UPDATE SET image_count = excluded.image_count,
+                            has_notes = excluded.has_notes, has_pdf = excluded.has_pdf,
+                            notes_date = excluded.notes_date""", row)
+        _bump_catalog_version(conn)
+
+def catalog_remove_chapter(chapter_name):
+    with _catalog_conn() as conn:
+        conn.execute("DELETE FROM chapters WHERE name = ?", (chapter_name,))
+        _bump_catalog_version(conn)
+
+def rebuild_catalog():
+    """Disk se poora catalog dobara banao (deploy/manual changes ke baad)."""
+    rows = [_scan_chapter_folder(name) for name in os.listdir(CHAPTERS_DIR)
+            if os.path.isdir(os.path.join(CHAPTERS_DIR, name))]
+    with _catalog_conn() as conn:
+        conn.execute("DELETE FROM chapters")
+        conn.executemany("""INSERT INTO chapters (name, image_count, has_notes, has_pdf, notes_date, created_date)
+                            VALUES (:name, :image_count, :has_notes, :has_pdf, :notes_date, :created_date)""", rows)
+        conn.execute("INSERT OR REPLACE INTO catalog_meta (key, value) VALUES ('built', 1)")
+        _bump_catalog_version(conn)
+    return len(rows)
+
+def catalog_version():
+    with _catalog_conn() as conn:
+        built = conn.execute("SELECT value FROM catalog_meta WHERE key = 'built'").fetchone()
+    if built is None:   # pehli dafa (ya purani deployment): disk se bana lo
+        rebuild_catalog()
+    with _catalog_conn() as conn:
+        return conn.execute("SELECT value FROM catalog_meta WHERE key = 'version'").fetchone()[0]
+
+def catalog_list(page=1, per_page=0, sort='created_date', order='desc'):
+    sort = sort if sort in CATALOG_SORT_FIELDS else 'created_date'
+    order = 'ASC' if str(order).lower() == 'asc' else 'DESC'
+    query = f"SELECT * FROM chapters ORDER BY {sort} {order}, name ASC"
+    params = ()
+    if per_page > 0:
+        query += " LIMIT ? OFFSET ?"
+        params = (per_page, (max(page, 1) - 1) * per_page)
+    with _catalog_conn() as conn:
+        total = conn.execute("SELECT COUNT(*) FROM chapters").fetchone()[0]
+        rows = conn.execute(query, params).fetchall()
+    chapters = [{
+        'name': row['name'],
+        'image_count': row['image_count'],
+        'has_notes': bool(row['has_notes']),
+        'has_pdf': bool(row['has_pdf']),
+        'notes_date': row['notes_date'],
+        'created_date': row['created_date'],
+    } for row in rows]
+    return chapters, total
+
+@app.cli.command('rebuild-catalog')
+def rebuild_catalog_command():
+    """flask rebuild-catalog — chapters/ folder se catalog index dobara banao."""
+    print(f"Catalog rebuilt: {rebuild_catalog()} chapters")
+
+# ------------ Chapter pipeline + background jobs ------------
+
+def save_chapter_notes(chapter_name, chapter_folder, openai_response):
+    txt_file_path = os.path.join(chapter_folder, f"{chapter_name}_notes.txt")
+    with open(txt_file_path, 'w', encoding='utf-8') as txt_file:
+        txt_file.write(f"Chapter: {chapter_name}\n")
+        txt_file.write("=" * 50 + "\n\n")
+        txt_file.write("Questions and Answers (JSON Format):\n")
+        txt_file.write(openai_response)
+    return txt_file_path
+
+def generate_chapter_notes(chapter_name, progress=None, use_cache=True, reuse_answers=DEDUP_REUSE_DEFAULT, emit=None):
+    """Vision call + notes file + PDF for one chapter folder (job worker ke andar chalta hai).
+
+    emit: optional emit(kind, **data) — streaming progress events (dekhein JobEventLog).
+    """
+    report = progress or (lambda percent, stage: None)
+    chapter_folder = os.path.join(CHAPTERS_DIR, chapter_name)
+    if not os.path.exists(chapter_folder):
+        raise FileNotFoundError('Chapter folder not found')
+
+    log_event('info', 'chapter_processing', chapter=chapter_name, use_cache=use_cache)
+
+    report(10, 'analyzing_images')
+    vision_stats = {}
+    with span('vision') as attrs:
+        openai_response = process_folder_images_batch(chapter_folder, stats=vision_stats, use_cache=use_cache, emit=emit)
+        attrs.update(cache_hits=vision_stats.get('cache_hits', 0), cache_misses=vision_stats.get('cache_misses', 0))
+    if not openai_response:
+        raise RuntimeError('No images found for this chapter')
+
+    report(55, 'processing_questions')
+    with span('save_notes'):
+        save_chapter_notes(chapter_name, chapter_folder, openai_response)
+        items = parse_model_output(openai_response)
+    log_event('info', 'model_output_parsed', chapter=chapter_name, questions=len(items),
+              response_bytes=len(openai_response.encode('utf-8')))
+    dedup_stats = {}
+    with span('dedup', questions=len(items)):
+        items = dedup_chapter(chapter_name, items, reuse_answers, dedup_stats)
+    with span('save_questions'):
+        save_chapter_questions(chapter_name, items)
+    with span('search_index'):
+        search_index_chapter(chapter_name, items)
+    questions_data = {"questions": [item.model_dump() for item in items]}
+    if emit:
+        emit('questions_saved', count=len(items), duplicates=dedup_stats.get('duplicates', 0))
+
+    report(75, 'generating_notes')
+    with span('pdf_render', questions=len(items)):
+        pdf_path = render_pdf(chapter_name, questions_data, emit)
+    if not pdf_path:
+        log_event('error', 'pdf_missing', chapter=chapter_name)
+
+    report(95, 'finalizing')
+    with span('catalog'):
+        catalog_refresh_chapter(chapter_name)
+    return {
+        'chapter_name': chapter_name,
+        'question_count': len(items),
+        'has_pdf': bool(pdf_path),
+        'cache': {'hits': vision_stats.get('cache_hits', 0), 'misses': vision_stats.get('cache_misses', 0)},
+        'bytes_saved': vision_stats.get('bytes_saved', 0),
+        'duplicates': dedup_stats.get('duplicates', 0),
+        'answers_reused': dedup_stats.get('answers_reused', 0),
+    }
+
+# Jobs disk par JSON files hain (data/jobs/<id>.json) taake restart ke baad bhi status mile
+# aur har gunicorn worker kisi bhi job ka status parh sake.
+JOB_WORKERS = int(os.environ.get('JOB_WORKERS', '2'))
+JOB_RETENTION_DAYS = int(os.environ.get('JOB_RETENTION_DAYS', '7'))
+JOB_ACTIVE_STATES = ('queued', 'running')
+
+_job_executor = ThreadPoolExecutor(max_workers=JOB_WORKERS, thread_name_prefix='notes-job')
+_jobs_lock = threading.Lock()
+_claimed_jobs = set()
+
+def _job_path(job_id):
+    return os.path.join(JOBS_DIR, f"{secure_filename(job_id)}.json")
+
+def _job_lock_path(job_id):
+    return os.path.join(JOBS_DIR, f"{secure_filename(job_id)}.lock")
+
+def _job_events_path(job_id):
+    return os.path.join(JOBS_DIR, f"{secure_filename(job_id)}.events")
+
+JOB_EVENT_TERMINAL = ('done', 'failed')
+
+class JobEventLog:
+    """Job ke progress events — append-only JSON lines (data/jobs/<id>.events).
+
+    File-based taake render process aur kisi bhi gunicorn worker ka SSE stream same
+    events dekhe. Har event ek chhoti single write hai (O_APPEND), is liye lines aapas mein nahi milti.
+    """
+    def __init__(self, job_id):
+        self.path = _job_events_path(job_id)
+
+    def __call__(self, kind, **data):
+        line = json.dumps({'type': kind, 'ts': round(time.time(), 3), **data}, ensure_ascii=False)
+        with open(self.path, 'ab') as f:
+            f.write(line.encode('utf-8') + b"\n")
+
+def write_json_atomic(path, data):
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False)
+    os.replace(tmp_path, path)
+
+def load_job(job_id):
+    try:
+        with open(_job_path(job_id), 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return None
+
+def update_job(job_id, **fields):
+    with _jobs_lock:
+        job = load_job(job_id)
+        if job is None:
+            return None
+        job.update(fields)
+        job['updated_at'] = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        write_json_atomic(_job_path(job_id), job)
+        return job
+
+def create_job(kind, chapter_name, options=None):
+    now = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    job = {
+        'id': uuid.uuid4().hex,
+        'kind': kind,
+        'chapter_name': chapter_name,
+        'options': options or {},
+        'status': 'queued',
+        'stage': 'queued',
+        'progress': 0,
+        'error': None,
+        'result': None,
+        'created_at': now,
+        'updated_at': now,
+    }
+    with _jobs_lock:
+        write_json_atomic(_job_path(job['id']), job)
+    return job
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+JOB_LOCK_GRACE_SECONDS = 30   # khali/kharab lock file itni purani ho tab hi stale
+
+def _create_lock_file(path):
+    """pid likhi hui lock file atomically banao (temp file + os.link) — koi bhi process lock ko
+    kabhi khali nahi dekhta. Pehle se maujood ho to False.
+
+    Jis filesystem par hard links nahi (kuch bind mounts, SMB/overlay) wahan O_EXCL se banti hai;
+    us chhote waqfe mein khali lock ko _lock_is_stale JOB_LOCK_GRACE_SECONDS tak held maanta hai.
+    """
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp_path, 'w') as f:
+        f.write(str(os.getpid()))
+    try:
+        os.link(tmp_path, path)
+        return True
+    except FileExistsError:
+        return False
+    except OSError:
+        pass
+    finally:
+        os.remove(tmp_path)
+    try:
+        fd = os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+    except FileExistsError:
+        return False
+    with os.fdopen(fd, 'w') as f:
+        f.write(str(os.getpid()))
+        f.flush()
+        os.fsync(f.fileno())
+    return True
+
+def _lock_owner(path):
+    """Owner pid; None = lock file nahi hai; 0 = khali ya parhi na ja saki."""
+    try:
+        with open(path, 'r') as f:
+            return int(f.read().strip())
+    except FileNotFoundError:
+        return None
+    except (OSError, ValueError):
+        return 0
+
+def _lock_is_stale(path, owner, job_id):
+    if owner == 0:
+        try:
+            return time.time() - os.path.getmtime(path) > JOB_LOCK_GRACE_SECONDS
+        except FileNotFoundError:
+            return True
+    if owner == os.getpid():
+        # Isi process mein claimed => held; warna restart ke baad wahi pid mila hai
+        return job_id not in _claimed_jobs
+    return not _pid_alive(owner)
+
+def _claim_job(job_id):
+    """Sirf ek process job chalaye — lock file mein owner ka pid hota hai.
+
+    Stale lock (owner mar chuka) ka takeover bhi ek hi process karta hai: pehle '.takeover'
+    lock atomically banta hai, phir dekha jata hai ke lock ab bhi usi mare hue owner ka hai.
+    """
+    lock_path = _job_lock_path(job_id)
+    if _create_lock_file(lock_path):
+        _claimed_jobs.add(job_id)
+        return True
+    owner = _lock_owner(lock_path)
+    if owner is not None and not _lock_is_stale(lock_path, owner, job_id):
+        return False
+    takeover_path = f"{lock_path}.takeover"
+    if not _create_lock_file(takeover_path):
+        takeover_owner = _lock_owner(takeover_path)
+        if takeover_owner is not None and not _lock_is_stale(takeover_path, takeover_owner, None):
+            return False   # koi aur takeover kar raha hai
+        try:
+            os.remove(takeover_path)   # takeover karne wala khud beech mein mar gaya
+        except FileNotFoundError:
+            pass
+        if not _create_lock_file(takeover_path):
+            return False
+    try:
+        if _lock_owner(lock_path) != owner:
+            return False   # beech mein kisi ne release/claim kar liya
+        try:
+            os.remove(lock_path)
+        except FileNotFoundError:
+            pass
+        if not _create_lock_file(lock_path):
+            return False
+    finally:
+        os.remove(takeover_path)
+    _claimed_jobs.add(job_id)
+    return True
+
+def _release_job(job_id):
+    _claimed_jobs.discard(job_id)
+    try:
+        os.remove(_job_lock_path(job_id))
+    except FileNotFoundError:
+        pass
+
+def _run_job(job_id):
+    job = load_job(job_id)
+    if job is None:
+        _release_job(job_id)
+        return
+    options = dict(job.get('options', {}))
+    trace_id = options.pop('trace', None)   # request sampled thi to job bhi usi trace id se
+    if trace_id or should_trace():
+        with start_trace(trace_id or None) as trace:
+            _execute_job(job_id, options, trace)
+    else:
+        _execute_job(job_id, options)
+
+def _execute_job(job_id, options, trace=None):
+    start = time.perf_counter()
+    kind = 'unknown'
+    status = 'failed'
+    try:
+        job = update_job(job_id, status='running', stage='analyzing_images', progress=5)
+        if job is None:
+            return
+        kind = job['kind']
+        emit = JobEventLog(job_id)
+        emit('stage', stage='analyzing_images', progress=5)
+
+        def report(percent, stage):
+            update_job(job_id, progress=percent, stage=stage)
+            emit('stage', stage=stage, progress=percent)
+
+        with span('job', kind=kind, chapter=job['chapter_name']):
+            result = generate_chapter_notes(job['chapter_name'], progress=report, emit=emit, **options)
+        status = 'done'
+        update_job(job_id, status='done', stage='done', progress=100, result=result,
+                   **({'trace': {'id': trace.id, 'spans': trace.export()}} if trace else {}))
+        emit('done', stage='done', progress=100, result=result)
+    except Exception as e:
+        log_event('error', 'job_failed', job_id=job_id, error=str(e))
+        update_job(job_id, status='failed', stage='failed', error=str(e),
+                   **({'trace': {'id': trace.id, 'spans': trace.export()}} if trace else {}))
+        JobEventLog(job_id)('failed', stage='failed', error=str(e))
+    finally:
+        elapsed = time.perf_counter() - start
+        JOB_SECONDS.observe(elapsed, kind=kind, status=status)
+        JOBS_TOTAL.inc(kind=kind, status=status)
+        log_event('info', 'job_finished', job_id=job_id, kind=kind, status=status, duration_ms=round(elapsed * 1000, 1),
+                  **({'spans': trace.export()} if trace else {}))
+        _release_job(job_id)
+
+def submit_job(job_id):
+    if _claim_job(job_id):
+        _job_executor.submit(_run_job, job_id)
+        return True
+    return False
+
+def resume_pending_jobs():
+    """Startup par queued/running jobs dobara queue karo; purane finished jobs saaf karo."""
+    cutoff = datetime.now().timestamp() - JOB_RETENTION_DAYS * 86400
+    for file_name in sorted(os.listdir(JOBS_DIR)):
+        if not file_name.endswith('.json'):
+            continue
+        job_id = file_name[:-len('.json')]
+        job = load_job(job_id)
+        if job is None:
+            continue
+        if job['status'] in JOB_ACTIVE_STATES:
+            if submit_job(job_id):
+                log_event('info', 'job_resumed', job_id=job_id, chapter=job['chapter_name'])
+        elif os.path.getmtime(_job_path(job_id)) < cutoff:
+            os.remove(_job_path(job_id))
+            if os.path.exists(_job_events_path(job_id)):
+                os.remove(_job_events_path(job_id))
+
+def is_pool_worker():
+    # Spawn children app (ya __main__) import karte hain; wahan pools/jobs start nahi karne.
+    # Naam spawn ke prepare() mein hi set ho jata hai, parent_process() us waqt tak nahi hota.
+    return multiprocessing.current_process().name != 'MainProcess' or multiprocessing.parent_process() is not None
+
+_background_started = False
+_background_lock = threading.Lock()
+
+def start_background_services():
+    """PDF render pool garam karo, adhoore jobs resume karo, purane derivatives saaf karo — har
+    serving process mein ek baar.
+
+    Import par nahi chalta: `python app.py` (reloader ka child) aur gunicorn ka post_worker_init
+    hook (gunicorn.conf.py) isay bulate hain. Flask CLI commands aur benchmarks app import karte
+    hain to koi pool ya job start nahi hota.
+    """
+    global _background_started
+    if is_pool_worker():
+        return
+    with _background_lock:
+        if _background_started:
+            return
+        _background_started = True
+    warm_pdf_render_pool()
+    resume_pending_jobs()
+    maybe_prune_derivatives()
+
+# ------------ End chapter pipeline + background jobs ------------
+
 @app.route('/process-chapter', methods=['POST'])
 def process_chapter():
     try:
-        chapter_data = request.form.get('chaptersData')
-        if not chapter_data:
-            return jsonify({'error': 'Chapter data not found'}), 400
+        try:
+            chapters_info = ingest_chapter_upload(request)
+        except RequestEntityTooLarge as e:
+            return jsonify({'error': e.description}), 413
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
 
-        chapters_info = json.loads(chapter_data)
+        # chaptersData mein "reuse_answers": true => milte julte questions ke purane answers lagao
+        reuse_answers = bool(chapters_info.get('reuse_answers', DEDUP_REUSE_DEFAULT))
+        job_ids = []
         for chapter in chapters_info['chapters']:
             chapter_name = secure_filename(chapter['name'])
-            chapter_folder = os.path.join(CHAPTERS_DIR, chapter_name)
-            if not os.path.exists(chapter_folder):
-                os.makedirs(chapter_folder)
-
-            for image_info in chapter['images']:
-                file_key = f"image_{image_info['id']}"
-                if file_key in request.files:
-                    file = request.files[file_key]
-                    if file.filename != '' and allowed_file(file.filename):
-                        filename = secure_filename(file.filename)
-                        file.save(os.path.join(chapter_folder, filename))
-
-            print(f"Processing chapter: {chapter_name}")
-            print(f"Date: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
-            print(f"User: Waqar-Hassan786")
-            
-            openai_response = process_folder_images_batch(chapter_folder)
-            if openai_response:
-                print(f"\n=== OpenAI Response for Chapter: {chapter_name} ===")
-                print(openai_response)
-                print("=" * 50)
-                
-                txt_file_path = os.path.join(chapter_folder, f"{chapter_name}_notes.txt")
-                with open(txt_file_path, 'w', encoding='utf-8') as txt_file:
-                    txt_file.write(f"Chapter: {chapter_name}\n")
-                    txt_file.write("=" * 50 + "\n\n")
-                    txt_file.write("Questions and Answers (JSON Format):\n")
-                    txt_file.write(openai_response)
+            catalog_refresh_chapter(chapter_name)
+            job = create_job('process', chapter_name, {'reuse_answers': reuse_answers,
+                                                       'trace': g.trace.id if g.get('trace') else None})
+            JobEventLog(job['id'])('uploaded', images=len(chapter['manifest_entries']),
+                                   bytes=sum(entry.get('size', 0) for entry in chapter['manifest_entries'].values()))
+            submit_job(job['id'])
+            job_ids.append(job['id'])
+            log_event('info', 'chapter_queued', chapter=chapter_name, job_id=job['id'])
 
-                try:
-                    questions_data = json.loads(openai_response)
-                except Exception:
-                    questions_data = {"questions": []}
-                
-                pdf_path = create_beautiful_pdf(chapter_name, questions_data)
-                if pdf_path:
-                    print(f"✅ PDF created: {pdf_path}")
-                else:
-                    print(f"❌ PDF creation failed for: {chapter_name}")
-                    
-        return jsonify({'message': 'Chapter processed successfully'}), 200
+        return jsonify({'message': 'Chapter queued for processing', 'job_ids': job_ids}), 202
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -342,54 +3276,137 @@ def regenerate_notes():
         if not os.path.exists(chapter_folder):
             return jsonify({'error': 'Chapter folder not found'}), 404
 
-        print(f"Regenerating notes for chapter: {chapter_name}")
-        print(f"Date: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
-        print(f"User: Waqar-Hassan786")
-        
-        openai_response = process_folder_images_batch(chapter_folder)
-        if openai_response:
-            print(f"\n=== Regenerated OpenAI Response for Chapter: {chapter_name} ===")
-            print(openai_response)
-            print("=" * 50)
-            
-            txt_file_path = os.path.join(chapter_folder, f"{chapter_name}_notes.txt")
-            with open(txt_file_path, 'w', encoding='utf-8') as txt_file:
-                txt_file.write(f"Chapter: {chapter_name}\n")
-                txt_file.write("=" * 50 + "\n\n")
-                txt_file.write("Questions and Answers (JSON Format):\n")
-                txt_file.write(openai_response)
-
-            try:
-                questions_data = json.loads(openai_response)
-            except Exception:
-                questions_data = {"questions": []}
-            
-            pdf_path = create_beautiful_pdf(chapter_name, questions_data)
-            if pdf_path:
-                print(f"✅ PDF regenerated: {pdf_path}")
-            else:
-                print(f"❌ PDF regeneration failed for: {chapter_name}")
-                
-            return jsonify({'message': f'Notes regenerated successfully for {chapter_name}'}), 200
-        else:
-            return jsonify({'error': 'Failed to regenerate notes'}), 500
+        # refresh=true => cache ko bypass karke model se naye answers lo
+        # reuse_answers=true => doosre chapters ke near-duplicate questions ke answers reuse karo
+        job = create_job('regenerate', chapter_name, {'use_cache': not data.get('refresh', False),
+                                                      'reuse_answers': bool(data.get('reuse_answers', DEDUP_REUSE_DEFAULT)),
+                                                      'trace': g.trace.id if g.get('trace') else None})
+        submit_job(job['id'])
+        log_event('info', 'regeneration_queued', chapter=chapter_name, job_id=job['id'])
+        return jsonify({'message': f'Regeneration queued for {chapter_name}', 'job_id': job['id']}), 202
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@app.route('/jobs/<job_id>', methods=['GET'])
+def job_status(job_id):
+    job = load_job(job_id)
+    if job is None:
+        return jsonify({'error': 'Job not found'}), 404
+    return jsonify(job), 200
+
+SSE_POLL_SECONDS = 0.25
+SSE_KEEPALIVE_SECONDS = 15
+SSE_MAX_SECONDS = int(os.environ.get('SSE_MAX_SECONDS', '300'))   # phir browser Last-Event-ID se reconnect karta hai
+
+def _sse_message(event_id, kind, data):
+    return f"id: {event_id}\nevent: {kind}\ndata: {data}\n\n"
+
+@app.route('/jobs/<job_id>/events', methods=['GET'])
+def job_events(job_id):
+    """Server-Sent Events: job ki events file tail karta hai. Event id = file ka byte offset."""
+    job = load_job(job_id)
+    if job is None:
+        return jsonify({'error': 'Job not found'}), 404
+    offset = max(request.headers.get('Last-Event-ID', type=int) or request.args.get('since', 0, type=int), 0)
+    events_path = _job_events_path(job_id)
+
+    def stream():
+        position = offset
+        started = last_sent = time.monotonic()
+        yield "retry: 2000\n\n"
+        while True:
+            chunk = b''
+            if os.path.exists(events_path):
+                with open(events_path, 'rb') as f:
+                    f.seek(position)
+                    chunk = f.read()
+                chunk = chunk[:chunk.rfind(b"\n") + 1]   # adhoori (abhi likhi ja rahi) line chhor do
+            for line in chunk.splitlines(keepends=True):
+                position += len(line)
+                try:
+                    event = json.loads(line)
+                except ValueError:
+                    continue
+                yield _sse_message(position, event.get('type', 'message'), line.decode('utf-8').strip())
+                last_sent = time.monotonic()
+                if event.get('type') in JOB_EVENT_TERMINAL:
+                    return
+            if not chunk:
+                current = load_job(job_id)
+                # Purane jobs (events file se pehle ke) ya file ghaib: status se hi khatam karo
+                if current is None or (current['status'] in JOB_EVENT_TERMINAL and not os.path.exists(events_path)):
+                    status = current['status'] if current else 'failed'
+                    yield _sse_message(position, status, json.dumps({'type': status, **(current or {})}, ensure_ascii=False))
+                    return
+                now = time.monotonic()
+                if now - started > SSE_MAX_SECONDS:
+                    return
+                if now - last_sent > SSE_KEEPALIVE_SECONDS:
+                    yield ": keepalive\n\n"
+                    last_sent = now
+                time.sleep(SSE_POLL_SECONDS)
+
+    return Response(stream(), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
 @app.route('/download-notes/<chapter_name>', methods=['GET'])
 def download_notes(chapter_name):
     try:
         safe = secure_filename(chapter_name)
         pdf_file_path = os.path.join(CHAPTERS_DIR, safe, f"{safe}_notes.pdf")
-        print(f"🔍 Looking for PDF at: {pdf_file_path}")
-        if not os.path.exists(pdf_file_path):
+        try:
+            return send_pdf(pdf_file_path, f"{safe}_notes.pdf")
+        except FileNotFoundError:
             return jsonify({'error': 'PDF file not found'}), 404
-        return send_file(
-            pdf_file_path,
-            as_attachment=True,
-            download_name=f"{safe}_notes.pdf",
-            mimetype='application/pdf'
-        )
+        except RequestedRangeNotSatisfiable as e:
+            return e.get_response()
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/export', methods=['GET', 'POST'])
+def export_chapters():
+    """Bulk export. GET ?format=zip|pdf&chapters=a,b&include_txt=0 ya POST JSON
+    {"chapters": [...], "format": "zip"|"pdf", "include_txt": false}. chapters na hon (ya "all") => saare."""
+    try:
+        data = (request.get_json(silent=True) or {}) if request.method == 'POST' else request.args
+        fmt = data.get('format', 'zip')
+        if fmt not in ('zip', 'pdf'):
+            return jsonify({'error': 'format must be zip or pdf'}), 400
+        include_txt = str(data.get('include_txt', 'true')).lower() not in ('0', 'false', 'no')
+        requested = data.get('chapters') or 'all'
+        if isinstance(requested, str):
+            requested = [] if requested == 'all' else requested.split(',')
+        if requested:
+            names = list(dict.fromkeys(secure_filename(str(name).strip()) for name in requested if str(name).strip()))
+            missing = [name for name in names if not os.path.isdir(os.path.join(CHAPTERS_DIR, name))]
+            if missing:
+                return jsonify({'error': 'Chapters not found', 'chapters': missing[:50]}), 404
+        else:
+            names = [chapter['name'] for chapter in catalog_list(sort='name', order='asc')[0]]
+        if not names:
+            return jsonify({'error': 'No chapters to export'}), 404
+
+        stamp = datetime.now().strftime('%Y%m%d-%H%M%S')
+        if fmt == 'zip':
+            response = Response(stream_export_zip(names, include_txt), mimetype='application/zip')
+            response.headers.set('Content-Disposition', 'attachment', filename=f"notes_export_{stamp}.zip")
+        else:
+            if len(names) > EXPORT_PDF_MAX_CHAPTERS:
+                return jsonify({'error': f'Too many chapters for one PDF (max {EXPORT_PDF_MAX_CHAPTERS}); use format=zip'}), 400
+            os.makedirs(EXPORT_DIR, exist_ok=True)
+            out_path = os.path.join(EXPORT_DIR, f"merged-{uuid.uuid4().hex}.pdf")
+            with span('export_pdf', chapters=len(names)):
+                result = _submit_render(_render_merged_task, names, out_path).result()
+            log_event('info', 'export_pdf_rendered', chapters=len(names), pages=result['pages'],
+                      render_ms=round(result['render_ms'], 1))
+            response = Response(stream_export_file(out_path, 'pdf'), mimetype='application/pdf')
+            response.headers.set('Content-Disposition', 'attachment', filename=f"notes_export_{stamp}.pdf")
+            response.content_length = os.path.getsize(out_path)
+            # Stream khatam ho, toote ya shuru hi na ho — temp file har haal mein hat jaye
+            response.call_on_close(lambda: os.path.exists(out_path) and os.remove(out_path))
+        response.headers['X-Accel-Buffering'] = 'no'   # proxy bhi buffer na kare
+        response.cache_control.no_store = True
+        return response
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -406,6 +3423,46 @@ def view_notes(chapter_name):
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@app.route('/chapters/<chapter_name>/questions', methods=['GET'])
+def chapter_questions(chapter_name):
+    try:
+        safe = secure_filename(chapter_name)
+        offset = max(request.args.get('offset', 0, type=int), 0)
+        limit = min(max(request.args.get('limit', 20, type=int), 1), 200)
+        query = request.args.get('q', '').strip() or None
+        items, total = page_chapter_questions(safe, offset, limit, query)
+        if items is None:
+            return jsonify({'error': 'Notes not found'}), 404
+        return jsonify({'chapter_name': safe, 'questions': items, 'total': total,
+                        'offset': offset, 'limit': limit}), 200
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/chapters/<chapter_name>/questions/<int:number>', methods=['GET'])
+def chapter_question(chapter_name, number):
+    try:
+        safe = secure_filename(chapter_name)
+        item = get_chapter_question(safe, number)
+        if item is None:
+            return jsonify({'error': 'Question not found'}), 404
+        return jsonify({'chapter_name': safe, 'number': number, **item.model_dump()}), 200
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/search', methods=['GET'])
+def search():
+    try:
+        query = request.args.get('q', '').strip()
+        if not query:
+            return jsonify({'error': 'Search query not provided'}), 400
+        page = max(request.args.get('page', 1, type=int), 1)
+        per_page = min(max(request.args.get('per_page', 20, type=int), 1), 100)
+        chapter = request.args.get('chapter')
+        results, total = search_questions(query, page, per_page, secure_filename(chapter) if chapter else None)
+        return jsonify({'query': query, 'results': results, 'total': total, 'page': page, 'per_page': per_page}), 200
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
 @app.route('/delete-chapter', methods=['POST'])
 def delete_chapter():
     try:
@@ -416,6 +3473,9 @@ def delete_chapter():
         folder = os.path.join(CHAPTERS_DIR, safe)
         if os.path.exists(folder):
             shutil.rmtree(folder)
+            catalog_remove_chapter(safe)
+            search_remove_chapter(safe)
+            dedup_remove_chapter(safe)
             return jsonify({'message': f'Chapter {safe} deleted successfully'}), 200
         else:
             return jsonify({'error': 'Chapter folder not found'}), 404
@@ -425,41 +3485,45 @@ def delete_chapter():
 @app.route('/get-chapters', methods=['GET'])
 def get_chapters():
     try:
-        print(f"Fresh API call for chapters list - User: Waqar-Hassan786")
-        print(f"Date: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
-        
-        chapters = []
-        if os.path.exists(CHAPTERS_DIR):
-            for folder_name in os.listdir(CHAPTERS_DIR):
-                folder_path = os.path.join(CHAPTERS_DIR, folder_name)
-                if os.path.isdir(folder_path):
-                    image_count = 0
-                    has_notes = False
-                    has_pdf = False
-                    notes_file_date = None
-                    for file_name in os.listdir(folder_path):
-                        file_path = os.path.join(folder_path, file_name)
-                        if os.path.isfile(file_path) and allowed_file(file_name):
-                            image_count += 1
-                        if file_name.endswith('_notes.txt'):
-                            has_notes = True
-                            notes_file_date = datetime.fromtimestamp(os.path.getmtime(file_path)).strftime('%Y-%m-%d %H:%M:%S')
-                        if file_name.endswith('_notes.pdf'):
-                            has_pdf = True
-                    chapters.append({
-                        'name': folder_name,
-                        'image_count': image_count,
-                        'has_notes': has_notes,
-                        'has_pdf': has_pdf,
-                        'notes_date': notes_file_date,
-                        'created_date': datetime.fromtimestamp(os.path.getctime(folder_path)).strftime('%Y-%m-%d %H:%M:%S')
-                    })
-        
-        print(f"Found {len(chapters)} chapters")
-        return jsonify({'chapters': chapters}), 200
+        # ?page=1&per_page=50&sort=name&order=asc — per_page na ho to saare chapters
+        page = request.args.get('page', 1, type=int)
+        per_page = min(request.args.get('per_page', 0, type=int), 500)
+        sort = request.args.get('sort', 'created_date')
+        order = request.args.get('order', 'desc')
+
+        etag = hashlib.sha256(f"{catalog_version()}:{page}:{per_page}:{sort}:{order}".encode()).hexdigest()[:32]
+        if request.if_none_match.contains(etag):
+            response = app.response_class(status=304)
+            response.set_etag(etag)
+            return response
+
+        chapters, total = catalog_list(page, per_page, sort, order)
+        log_event('debug', 'chapters_listed', count=len(chapters))
+        response = jsonify({'chapters': chapters, 'total': total, 'page': page, 'per_page': per_page})
+        response.set_etag(etag)
+        return response
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@app.route('/debug-render')
+def debug_render():
+    return jsonify(render_metrics()), 200
+
+GaugeFunction('notes_pdf_render_queue_depth', 'PDF renders submitted but not finished.',
+              lambda: render_metrics()['queue_depth'])
+GaugeFunction('notes_model_in_flight', 'Model requests currently in flight.', lambda: model_gateway.metrics()['in_flight'])
+_PROCESS_START_TIME = time.time()
+GaugeFunction('notes_process_start_time_seconds', 'Start time of this worker process (Unix seconds).',
+              lambda: _PROCESS_START_TIME)
+
+@app.route('/metrics')
+def metrics():
+    return Response(render_prometheus(), mimetype='text/plain; version=0.0.4')
+
+@app.route('/debug-model')
+def debug_model():
+    return jsonify(model_gateway.metrics()), 200
+
 @app.route('/debug-fonts')
 def debug_fonts():
     exists = os.path.exists(URDU_FONT_FILE)
@@ -475,4 +3539,7 @@ def debug_fonts():
 if __name__ == '__main__':
     # Register Urdu font once on startup
     register_urdu_font_once()
+    # Debug reloader ka parent sirf file watcher hai; services sirf serving child mein
+    if os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        start_background_services()
     app.run(debug=True, host='0.0.0.0', port=5000)
\ No newline at end of file
@@ -0,0 +1,166 @@
+"""Benchmark suite ke shared helpers: isolated workspace, synthetic data, timing, JSON results.
+
+App yahan import nahi hota — har script enter_workspace() ke baad khud `import app` karti hai,
+taake chapters/ aur data/ temp workspace mein banein (render pool ke spawn children bhi
+wahi cwd inherit karte hain).
+"""
+import json
+import math
+import os
+import platform
+import random
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RESULTS_DIR = os.path.join(ROOT, 'benchmarks', 'results')
+
+URDU_WORDS = ("پانی زمین سورج روشنی توانائی حرارت درجہ دباؤ رفتار قوت کام طاقت مادہ ایٹم "
+              "مالیکیول خلیہ نظام عمل ردعمل نتیجہ مثال تعریف فارمولا قانون اصول").split()
+# Urdu-heavy text mein harakat aur lambe ligatures bhi hon
+URDU_HEAVY_WORDS = URDU_WORDS + "قُوّت حَرَکت مُسْتَقِل تَوانائی اِرتِکاز کیمیائی برقناطیسی ماحولیاتی".split()
+ENGLISH_WORDS = "energy force mass work power velocity pressure density current charge".split()
+
+
+def enter_workspace(prefix='notes-bench-'):
+    """Temp directory mein chdir (fonts/, templates/, static/ symlinks ke saath) aur ROOT ko sys.path par rakho."""
+    if ROOT not in sys.path:
+        sys.path.insert(0, ROOT)
+    os.environ.setdefault('OPENAI_API_KEY', 'benchmark-not-used')
+    os.environ.setdefault('LOG_LEVEL', 'WARNING')   # per-PDF info logs timings ko bigaadte hain
+    os.environ.pop('NOTES_DATA_DIR', None)   # data/ bhi workspace ke andar
+    workspace = tempfile.mkdtemp(prefix=prefix)
+    for name in ('fonts', 'templates', 'static'):
+        os.symlink(os.path.join(ROOT, name), os.path.join(workspace, name))
+    os.chdir(workspace)
+    return workspace
+
+
+def leave_workspace(workspace):
+    os.chdir(ROOT)
+    shutil.rmtree(workspace, ignore_errors=True)
+
+
+def urdu_text(rng, min_words, max_words):
+    return " ".join(rng.choice(URDU_HEAVY_WORDS) for _ in range(rng.randint(min_words, max_words)))
+
+
+def make_chapter(question_count, seed=7):
+    """{"questions": [...]} — lambe Urdu answers, chhote English answers."""
+    rng = random.Random(seed)
+    return {"questions": [{
+        "question": f"Question {i}: explain the {rng.choice(ENGLISH_WORDS)} concept with an example?",
+        "answer_en": " ".join(rng.choice(ENGLISH_WORDS) for _ in range(rng.randint(15, 60))),
+        "answer_ur": urdu_text(rng, 30, 220),
+    } for i in range(question_count)]}
+
+
+def make_page_image(path, width=1240, height=1754, seed=0):
+    """Scan jaisi synthetic page: halka noise + text lines (PNG/JPEG extension se)."""
+    import numpy as np
+    from PIL import Image, ImageDraw
+
+    rng = np.random.default_rng(seed)
+    page = rng.normal(235, 12, (height, width)).clip(0, 255).astype('uint8')
+    image = Image.fromarray(page).convert('RGB')
+    draw = ImageDraw.Draw(image)
+    for line in range(40, height - 40, 38):
+        draw.line((60, line, width - 60 - int(rng.integers(0, width // 3)), line), fill=(40, 40, 40), width=6)
+    image.save(path)
+    return path
+
+
+def measure(fn, repeat=3, setup=None):
+    """fn() ko repeat dafa chalao (har dafa pehle setup()); timings ms mein."""
+    timings = []
+    result = None
+    for _ in range(repeat):
+        if setup:
+            setup()
+        start = time.perf_counter()
+        result = fn()
+        timings.append((time.perf_counter() - start) * 1000)
+    return summarize(timings), result
+
+
+def summarize(timings_ms):
+    ordered = sorted(timings_ms)
+    return {
+        'runs': len(ordered),
+        'min_ms': round(ordered[0], 3),
+        'median_ms': round(statistics.median(ordered), 3),
+        'p95_ms': round(percentile(ordered, 95), 3),
+        'max_ms': round(ordered[-1], 3),
+        'mean_ms': round(statistics.fmean(ordered), 3),
+    }
+
+
+def percentile(ordered, pct):
+    if not ordered:
+        return 0.0
+    # nearest-rank
+    index = min(len(ordered) - 1, max(0, math.ceil(pct / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, capture_output=True,
+                              text=True, timeout=10).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def write_results(suite, params, results, output=None):
+    """Results JSON likho (default: benchmarks/results/<suite>-<timestamp>.json); path return."""
+    payload = {
+        'suite': suite,
+        'created_at': datetime.now().isoformat(timespec='seconds'),
+        'git_commit': git_commit(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'params': params,
+        'results': results,
+    }
+    if output is None:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        output = os.path.join(RESULTS_DIR, f"{suite}-{datetime.now():%Y%m%d-%H%M%S}.json")
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(payload, f, indent=2, ensure_ascii=False)
+    return output
+
+
+def compare_results(baseline_path, current, threshold=0.2, metric='median_ms'):
+    """Baseline JSON se muqabla: jo benchmark threshold se zyada slow ho wo regression.
+
+    current: results dict ya JSON file ka path. Return: (rows, regressions).
+    """
+    with open(baseline_path, 'r', encoding='utf-8') as f:
+        baseline = json.load(f)['results']
+    if isinstance(current, str):
+        with open(current, 'r', encoding='utf-8') as f:
+            current = json.load(f)['results']
+    rows, regressions = [], []
+    for name in sorted(set(baseline) & set(current)):
+        old, new = baseline[name].get(metric), current[name].get(metric)
+        if not old or new is None:
+            continue
+        ratio = new / old
+        rows.append((name, old, new, ratio))
+        if ratio > 1 + threshold:
+            regressions.append(name)
+    return rows, regressions
+
+
+def print_comparison(rows, regressions, metric='median_ms'):
+    print(f"\n{'benchmark':<60} {'baseline':>12} {'current':>12} {'ratio':>7}")
+    for name, old, new, ratio in rows:
+        flag = '  << regression' if name in regressions else ''
+        print(f"{name:<60} {old:>12.2f} {new:>12.2f} {ratio:>6.2f}x{flag}")
+    print(f"\n{len(regressions)} regression(s) on {metric}")
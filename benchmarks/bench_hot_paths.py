@@ -0,0 +1,155 @@
+"""Hot-path benchmark suite: PDF build, RTL wrapping, Urdu shaping, image encoding, chapter listing.
+
+Synthetic chapters (10 se 5,000 questions, Urdu-heavy answers) aur bohat si files wale
+chapter folders ek temp workspace mein bante hain. Results JSON mein likhe jaate hain;
+--compare purane JSON se muqabla karke regressions batata hai (exit code 1).
+
+    python benchmarks/bench_hot_paths.py [--sizes 10,100,1000,5000] [--quick]
+                                         [--output results.json] [--compare baseline.json]
+"""
+import argparse
+import os
+import random
+import sys
+
+from _support import (enter_workspace, leave_workspace, make_chapter, make_page_image, measure,
+                      write_results, compare_results, print_comparison, urdu_text)
+
+FRAME_WIDTH = 595.27 - 120   # A4 width - left/right margins
+
+
+def clear_layout_caches(app):
+    app._question_blocks.clear()
+    app.split_rtl_lines.cache_clear()
+    app.urdu_shape.cache_clear()
+    app.word_width.cache_clear()
+
+
+def bench_pdf(app, sizes, results):
+    os.makedirs(os.path.join(app.CHAPTERS_DIR, 'bench'), exist_ok=True)
+    for n in sizes:
+        data = make_chapter(n)
+        repeat = 1 if n >= 1000 else 3
+        stats = {}
+        timing, _ = measure(lambda: app.create_beautiful_pdf('bench', data, stats=stats), repeat,
+                            setup=lambda: clear_layout_caches(app))
+        pdf_path = os.path.join(app.CHAPTERS_DIR, 'bench', 'bench_notes.pdf')
+        results[f"pdf.create_beautiful_pdf.cold[n={n}]"] = {
+            **timing, 'pages': stats.get('pages'), 'pdf_bytes': os.path.getsize(pdf_path)}
+        timing, _ = measure(lambda: app.create_beautiful_pdf('bench', data), repeat)
+        results[f"pdf.create_beautiful_pdf.warm[n={n}]"] = timing
+        print(f"create_beautiful_pdf n={n}: cold {results[f'pdf.create_beautiful_pdf.cold[n={n}]']['median_ms']:.0f} ms, "
+              f"warm {timing['median_ms']:.0f} ms, {stats.get('pages')} pages")
+
+
+def bench_rtl(app, sizes, results, font):
+    for n in sizes:
+        shaped = [app.urdu_shape(q['answer_ur']) for q in make_chapter(n)['questions']]
+
+        def wrap_all():
+            return [app.split_rtl_lines(text, font, 14, FRAME_WIDTH) for text in shaped]
+
+        def clear():
+            app.split_rtl_lines.cache_clear()
+            app.word_width.cache_clear()
+
+        results[f"rtl.split_rtl_lines.cold[n={n}]"], _ = measure(wrap_all, 3, setup=clear)
+        results[f"rtl.split_rtl_lines.warm[n={n}]"], _ = measure(wrap_all, 3)
+        print(f"split_rtl_lines n={n}: cold {results[f'rtl.split_rtl_lines.cold[n={n}]']['median_ms']:.1f} ms")
+
+
+def bench_shape(app, sizes, results):
+    for n in sizes:
+        answers = [q['answer_ur'] for q in make_chapter(n, seed=11)['questions']]
+        results[f"shape.urdu_shape.cold[n={n}]"], _ = measure(
+            lambda: [app.urdu_shape(text) for text in answers], 3, setup=app.urdu_shape.cache_clear)
+        results[f"shape.urdu_shape.warm[n={n}]"], _ = measure(lambda: [app.urdu_shape(text) for text in answers], 3)
+        results[f"shape.urdu_shape_batch.cold[n={n}]"], _ = measure(
+            lambda: app.urdu_shape_batch(answers, use_pool=False), 3, setup=app.urdu_shape.cache_clear)
+        print(f"urdu_shape n={n}: cold {results[f'shape.urdu_shape.cold[n={n}]']['median_ms']:.1f} ms")
+
+
+def bench_encode(app, results):
+    folder = os.path.join(app.CHAPTERS_DIR, 'encode')
+    os.makedirs(folder, exist_ok=True)
+    for label, (width, height), ext in (('phone_jpeg', (1240, 1754), 'jpg'),
+                                        ('scan_png', (2480, 3508), 'png'),
+                                        ('camera_jpeg', (4000, 3000), 'jpg')):
+        path = make_page_image(os.path.join(folder, f"{label}.{ext}"), width, height)
+        timing, encoded = measure(lambda: app.encode_image_to_base64(path), 5)
+        size = os.path.getsize(path)
+        results[f"encode.base64[{label}]"] = {
+            **timing, 'file_bytes': size, 'mb_per_s': round(size / 1e6 / (timing['median_ms'] / 1000), 1)}
+        print(f"encode_image_to_base64 {label}: {size // 1024} KiB in {timing['median_ms']:.2f} ms")
+
+
+def bench_get_chapters(app, chapter_counts, files_per_chapter, results):
+    rng = random.Random(3)
+    client = app.app.test_client()
+    created = 0
+    for count in chapter_counts:
+        # Bohat si files wale chapter folders: images + notes + manifest
+        for i in range(created, count):
+            folder = os.path.join(app.CHAPTERS_DIR, f"chapter_{i:05d}")
+            os.makedirs(folder)
+            for page in range(files_per_chapter):
+                with open(os.path.join(folder, f"page{page}.jpg"), 'wb') as f:
+                    f.write(os.urandom(64))
+            with open(os.path.join(folder, f"chapter_{i:05d}_notes.txt"), 'w', encoding='utf-8') as f:
+                f.write(urdu_text(rng, 50, 100))
+        created = count
+
+        results[f"catalog.rebuild[chapters={count}]"], _ = measure(app.rebuild_catalog, 3)
+        client.get('/get-chapters')   # lazy build / warm-up
+        timing, response = measure(lambda: client.get('/get-chapters'), 5)
+        results[f"route.get_chapters.all[chapters={count}]"] = {**timing, 'bytes': len(response.data)}
+        results[f"route.get_chapters.page[chapters={count}]"], _ = measure(
+            lambda: client.get('/get-chapters?page=2&per_page=50&sort=name&order=asc'), 5)
+        etag = response.headers.get('ETag')
+        timing, response = measure(lambda: client.get('/get-chapters', headers={'If-None-Match': etag}), 5)
+        results[f"route.get_chapters.not_modified[chapters={count}]"] = {**timing, 'status': response.status_code}
+        print(f"/get-chapters {count} chapters: full {results[f'route.get_chapters.all[chapters={count}]']['median_ms']:.1f} ms, "
+              f"304 {timing['median_ms']:.2f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', default='10,100,1000,5000', help='questions per synthetic chapter')
+    parser.add_argument('--chapters', default='10,100,1000', help='chapter folder counts for /get-chapters')
+    parser.add_argument('--files-per-chapter', type=int, default=50)
+    parser.add_argument('--quick', action='store_true', help='sirf chhote sizes (10,100) aur 10,100 chapters')
+    parser.add_argument('--output', help='results JSON path (default benchmarks/results/...)')
+    parser.add_argument('--compare', help='baseline results JSON')
+    parser.add_argument('--threshold', type=float, default=0.2, help='regression threshold (0.2 = 20%% slower)')
+    args = parser.parse_args()
+    sizes = [10, 100] if args.quick else [int(n) for n in args.sizes.split(',')]
+    chapter_counts = [10, 100] if args.quick else [int(n) for n in args.chapters.split(',')]
+
+    workspace = enter_workspace()
+    try:
+        os.environ.setdefault('PDF_RENDER_PROCESSES', '0')
+        import app
+        from reportlab.pdfbase import pdfmetrics
+
+        app.register_urdu_font_once()
+        font = app.URDU_FONT_NAME if app.URDU_FONT_NAME in pdfmetrics.getRegisteredFontNames() else 'Helvetica'
+        results = {}
+        bench_shape(app, sizes, results)
+        bench_rtl(app, sizes, results, font)
+        bench_pdf(app, sizes, results)
+        bench_encode(app, results)
+        bench_get_chapters(app, chapter_counts, args.files_per_chapter, results)
+    finally:
+        leave_workspace(workspace)
+
+    params = {'sizes': sizes, 'chapters': chapter_counts, 'files_per_chapter': args.files_per_chapter}
+    path = write_results('hot_paths', params, results, args.output)
+    print(f"\nresults: {path}")
+    if args.compare:
+        rows, regressions = compare_results(args.compare, results, args.threshold)
+        print_comparison(rows, regressions)
+        sys.exit(1 if regressions else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,67 @@
+"""Incremental PDF rebuild benchmark.
+
+Pehla build (sab kuch cold), phir ek answer badal kar rebuild (sirf wo block
+dobara banta hai), aur muqable ke liye block cache saaf karke full rebuild.
+Temp workspace mein chalta hai.
+
+    python benchmarks/bench_incremental_pdf.py [--questions 500] [--output results.json] [--compare baseline.json]
+"""
+import argparse
+import os
+import sys
+
+from _support import (enter_workspace, leave_workspace, make_chapter, measure, write_results,
+                      compare_results, print_comparison)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--questions', type=int, default=500)
+    parser.add_argument('--output', help='results JSON path (default benchmarks/results/...)')
+    parser.add_argument('--compare', help='baseline results JSON')
+    parser.add_argument('--threshold', type=float, default=0.2, help='regression threshold (0.2 = 20%% slower)')
+    args = parser.parse_args()
+
+    workspace = enter_workspace()
+    try:
+        os.environ.setdefault('PDF_RENDER_PROCESSES', '0')
+        import app
+
+        n = args.questions
+        data = make_chapter(n)
+        os.makedirs(os.path.join(app.CHAPTERS_DIR, "bench"))
+
+        def build():
+            return app.create_beautiful_pdf("bench", data)
+
+        def change_answer(word):
+            def setup():
+                data["questions"][n // 2]["answer_ur"] += f" {word}"
+            return setup
+
+        def change_answer_no_blocks():
+            change_answer("زمین")()
+            app._question_blocks.clear()
+
+        results = {}
+        results[f"incremental_pdf.cold[n={n}]"], _ = measure(build, 1)
+        results[f"incremental_pdf.one_changed[n={n}]"], _ = measure(build, 1, setup=change_answer("پانی"))
+        results[f"incremental_pdf.one_changed_no_blocks[n={n}]"], _ = measure(build, 1, setup=change_answer_no_blocks)
+    finally:
+        leave_workspace(workspace)
+
+    print(f"questions:                        {n}")
+    print(f"first build (cold):               {results[f'incremental_pdf.cold[n={n}]']['median_ms']:8.1f} ms")
+    print(f"one answer changed (incremental): {results[f'incremental_pdf.one_changed[n={n}]']['median_ms']:8.1f} ms")
+    print(f"one answer changed (no blocks):   {results[f'incremental_pdf.one_changed_no_blocks[n={n}]']['median_ms']:8.1f} ms")
+
+    path = write_results('incremental_pdf', {'questions': n}, results, args.output)
+    print(f"\nresults: {path}")
+    if args.compare:
+        rows, regressions = compare_results(args.compare, results, args.threshold)
+        print_comparison(rows, regressions)
+        sys.exit(1 if regressions else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,97 @@
+"""RTL line-breaking benchmark: 500-question Urdu chapter.
+
+Purana (quadratic, har word par poori line stringWidth) vs naya memoized
+split_rtl_lines, aur phir poora create_beautiful_pdf. Temp workspace mein chalta hai.
+
+    python benchmarks/bench_rtl_layout.py [--questions 500] [--output results.json] [--compare baseline.json]
+"""
+import argparse
+import os
+import sys
+
+from _support import (enter_workspace, leave_workspace, make_chapter, measure, write_results,
+                      compare_results, print_comparison)
+
+FRAME_WIDTH = 595.27 - 120   # A4 width - left/right margins
+
+
+def split_rtl_lines_baseline(text, font_name, font_size, max_width):
+    # Purana algorithm (reference) — growing line har dafa dobara measure hoti hai
+    from reportlab.pdfbase import pdfmetrics
+
+    words = text.split(' ')
+    lines, current = [], ""
+    for w in words:
+        test = (w if not current else current + " " + w)
+        if pdfmetrics.stringWidth(test, font_name, font_size) <= max_width:
+            current = test
+        else:
+            if current:
+                lines.append(current)
+            current = w
+    if current:
+        lines.append(current)
+    return lines
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--questions', type=int, default=500)
+    parser.add_argument('--output', help='results JSON path (default benchmarks/results/...)')
+    parser.add_argument('--compare', help='baseline results JSON')
+    parser.add_argument('--threshold', type=float, default=0.2, help='regression threshold (0.2 = 20%% slower)')
+    args = parser.parse_args()
+
+    workspace = enter_workspace()
+    try:
+        os.environ.setdefault('PDF_RENDER_PROCESSES', '0')
+        import app
+        from reportlab.pdfbase import pdfmetrics
+
+        app.register_urdu_font_once()
+        font = app.URDU_FONT_NAME if app.URDU_FONT_NAME in pdfmetrics.getRegisteredFontNames() else "Helvetica"
+        data = make_chapter(args.questions)
+        shaped = [app.urdu_shape(q["answer_ur"]) for q in data["questions"]]
+
+        def run_baseline():
+            return [split_rtl_lines_baseline(t, font, 14, FRAME_WIDTH) for t in shaped]
+
+        def run_new():
+            return [list(app.split_rtl_lines(t, font, 14, FRAME_WIDTH)) for t in shaped]
+
+        def clear():
+            app.split_rtl_lines.cache_clear()
+            app.word_width.cache_clear()
+
+        n = args.questions
+        results = {}
+        results[f"rtl_layout.baseline[n={n}]"], base_lines = measure(run_baseline, 1)
+        results[f"rtl_layout.memoized.cold[n={n}]"], new_lines = measure(run_new, 1, setup=clear)
+        results[f"rtl_layout.memoized.warm[n={n}]"], _ = measure(run_new, 1)
+        assert base_lines == new_lines, "line breaks differ from the baseline algorithm"
+
+        os.makedirs(os.path.join(app.CHAPTERS_DIR, "bench"))
+        timing, pdf_path = measure(lambda: app.create_beautiful_pdf("bench", data), 1)
+        results[f"rtl_layout.create_beautiful_pdf[n={n}]"] = {
+            **timing, 'pdf_bytes': os.path.getsize(pdf_path) if pdf_path else 0}
+    finally:
+        leave_workspace(workspace)
+
+    base, cold = results[f"rtl_layout.baseline[n={n}]"], results[f"rtl_layout.memoized.cold[n={n}]"]
+    print(f"questions:                 {n}")
+    print(f"wrap baseline (quadratic): {base['median_ms']:8.1f} ms")
+    print(f"wrap memoized (cold):      {cold['median_ms']:8.1f} ms  ({base['median_ms'] / cold['median_ms']:.1f}x)")
+    print(f"wrap memoized (warm):      {results[f'rtl_layout.memoized.warm[n={n}]']['median_ms']:8.1f} ms")
+    pdf = results[f"rtl_layout.create_beautiful_pdf[n={n}]"]
+    print(f"create_beautiful_pdf:      {pdf['median_ms']:8.1f} ms  ({pdf['pdf_bytes'] // 1024} KiB)")
+
+    path = write_results('rtl_layout', {'questions': n}, results, args.output)
+    print(f"\nresults: {path}")
+    if args.compare:
+        rows, regressions = compare_results(args.compare, results, args.threshold)
+        print_comparison(rows, regressions)
+        sys.exit(1 if regressions else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,89 @@
+"""Urdu shaping micro-benchmark.
+
+Purana per-call path (arabic_reshaper.reshape + get_display har answer aur har
+label par) vs memoized urdu_shape aur urdu_shape_batch. Temp workspace mein chalta hai.
+
+    python benchmarks/bench_urdu_shape.py [--questions 500] [--pool] [--output results.json] [--compare baseline.json]
+"""
+import argparse
+import random
+import sys
+
+from _support import (enter_workspace, leave_workspace, measure, urdu_text, write_results,
+                      compare_results, print_comparison)
+
+
+def make_answers(count, seed=11):
+    rng = random.Random(seed)
+    return [urdu_text(rng, 20, 120) for _ in range(count)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--questions', type=int, default=500)
+    parser.add_argument('--pool', action='store_true', help='batch ko process pool mein bhi time karo')
+    parser.add_argument('--output', help='results JSON path (default benchmarks/results/...)')
+    parser.add_argument('--compare', help='baseline results JSON')
+    parser.add_argument('--threshold', type=float, default=0.2, help='regression threshold (0.2 = 20%% slower)')
+    args = parser.parse_args()
+
+    workspace = enter_workspace()
+    try:
+        import app
+        import arabic_reshaper
+        from bidi.algorithm import get_display
+
+        def baseline(answers):
+            # create_beautiful_pdf ka purana pattern: har question par label + answer
+            out = []
+            for text in answers:
+                out.append(get_display(arabic_reshaper.reshape(app.URDU_ANSWER_LABEL)))
+                out.append(get_display(arabic_reshaper.reshape(text)))
+            return out
+
+        def memoized(answers):
+            out = []
+            for text in answers:
+                out.append(app.urdu_shape(app.URDU_ANSWER_LABEL))
+                out.append(app.urdu_shape(text))
+            return out
+
+        n = args.questions
+        answers = make_answers(n)
+        results = {}
+        results[f"urdu_shape.baseline[n={n}]"], base_out = measure(lambda: baseline(answers), 1)
+        results[f"urdu_shape.memoized.cold[n={n}]"], new_out = measure(lambda: memoized(answers), 1,
+                                                                       setup=app.urdu_shape.cache_clear)
+        assert base_out == new_out, "shaped output differs from the per-call path"
+        results[f"urdu_shape.memoized.warm[n={n}]"], _ = measure(lambda: memoized(answers), 1)
+        results[f"urdu_shape.batch[n={n}]"], batch = measure(lambda: app.urdu_shape_batch(answers, use_pool=False), 1,
+                                                             setup=app.urdu_shape.cache_clear)
+        assert [batch[a] for a in answers] == new_out[1::2]
+        if args.pool:
+            app.urdu_shape_batch(answers[:8], use_pool=True)   # pool warm-up
+            results[f"urdu_shape.batch_pool[n={n}]"], pooled = measure(
+                lambda: app.urdu_shape_batch(answers, use_pool=True), 1, setup=app.urdu_shape.cache_clear)
+            assert [pooled[a] for a in answers] == new_out[1::2]
+    finally:
+        leave_workspace(workspace)
+
+    base = results[f"urdu_shape.baseline[n={n}]"]['median_ms']
+    cold = results[f"urdu_shape.memoized.cold[n={n}]"]['median_ms']
+    print(f"questions:               {n}")
+    print(f"per-call baseline:       {base:8.1f} ms")
+    print(f"memoized (cold cache):   {cold:8.1f} ms  ({base / cold:.1f}x)")
+    print(f"memoized (warm cache):   {results[f'urdu_shape.memoized.warm[n={n}]']['median_ms']:8.1f} ms")
+    print(f"batch (in-process):      {results[f'urdu_shape.batch[n={n}]']['median_ms']:8.1f} ms")
+    if args.pool:
+        print(f"batch (process pool):    {results[f'urdu_shape.batch_pool[n={n}]']['median_ms']:8.1f} ms")
+
+    path = write_results('urdu_shape', {'questions': n, 'pool': args.pool}, results, args.output)
+    print(f"\nresults: {path}")
+    if args.compare:
+        rows, regressions = compare_results(args.compare, results, args.threshold)
+        print_comparison(rows, regressions)
+        sys.exit(1 if regressions else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,26 @@
+"""Do benchmark result files ka muqabla (bench_hot_paths.py ya load_test.py ka JSON).
+
+    python benchmarks/compare.py baseline.json current.json [--threshold 0.2] [--metric median_ms]
+
+Koi benchmark threshold se zyada slow ho to exit code 1 (CI mein regression gate).
+"""
+import argparse
+import sys
+
+from _support import compare_results, print_comparison
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('baseline')
+    parser.add_argument('current')
+    parser.add_argument('--threshold', type=float, default=0.2, help='0.2 = 20%% slower is a regression')
+    parser.add_argument('--metric', default='median_ms', help='median_ms, p95_ms, p99_ms, ...')
+    args = parser.parse_args()
+    rows, regressions = compare_results(args.baseline, args.current, args.threshold, args.metric)
+    print_comparison(rows, regressions, args.metric)
+    sys.exit(1 if regressions else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,287 @@
+"""End-to-end load test: asli Flask routes + werkzeug threaded server, stubbed OpenAI backend.
+
+Upload workers multipart chapters bhejte hain aur /jobs/<id>/events (SSE) se pehla question
+aur 'done' tak ka waqt naapte hain; reader threads saath saath /get-chapters, /search,
+/chapters/<n>/questions aur /download-notes hit karte hain. Model ki jagah StubBackend hai
+(configurable latency, streaming, Urdu answers) — koi network/API key nahi chahiye.
+
+    python benchmarks/load_test.py [--chapters 12] [--concurrency 4] [--pages 4] [--readers 4]
+                                   [--model-latency 0.3] [--output results.json] [--compare baseline.json]
+"""
+import argparse
+import json
+import logging
+import os
+import random
+import sys
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+import uuid
+from collections import defaultdict
+from types import SimpleNamespace
+
+from _support import (enter_workspace, leave_workspace, make_page_image, summarize, percentile, urdu_text,
+                      ENGLISH_WORDS, write_results, compare_results, print_comparison)
+
+
+class StubBackend:
+    """OpenAI client ki jagah: chat.completions.create(...) — har image ke liye N questions."""
+
+    def __init__(self, latency=0.3, questions_per_image=3, chunk_delay=0.005, seed=5):
+        self.latency = latency
+        self.questions_per_image = questions_per_image
+        self.chunk_delay = chunk_delay
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+        self.calls = 0
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+
+    def _answer(self, request_id, image_count):
+        with self.lock:
+            self.calls += 1
+            rng = random.Random(self.rng.random())
+        questions = [{
+            "image": image,
+            "question": f"Q{request_id}-{image}-{k}: define {rng.choice(ENGLISH_WORDS)} and give its unit?",
+            "answer_en": " ".join(rng.choice(ENGLISH_WORDS) for _ in range(rng.randint(10, 30))),
+            "answer_ur": urdu_text(rng, 20, 80),
+        } for image in range(1, image_count + 1) for k in range(self.questions_per_image)]
+        return json.dumps(questions, ensure_ascii=False)
+
+    def create(self, messages, stream=False, **kwargs):
+        images = sum(1 for part in messages[-1]['content'] if part.get('type') == 'image_url')
+        text = self._answer(uuid.uuid4().hex[:6], images)
+        usage = SimpleNamespace(prompt_tokens=800 * images, completion_tokens=len(text) // 3)
+        time.sleep(self.latency / 2 if stream else self.latency)   # time to first token
+        if not stream:
+            return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=text))], usage=usage)
+        return self._stream(text, usage)
+
+    def _stream(self, text, usage):
+        step = max(1, len(text) // 40)
+        for start in range(0, len(text), step):
+            time.sleep(self.chunk_delay)
+            yield SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=text[start:start + step]))],
+                                  usage=None)
+        time.sleep(self.latency / 2)
+        yield SimpleNamespace(choices=[], usage=usage)
+
+
+class Recorder:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.timings = defaultdict(list)
+        self.errors = defaultdict(int)
+
+    def add(self, name, ms, ok=True):
+        with self.lock:
+            if ok:
+                self.timings[name].append(ms)
+            else:
+                self.errors[name] += 1
+
+    def timed_get(self, name, url):
+        start = time.perf_counter()
+        try:
+            with urllib.request.urlopen(url, timeout=60) as response:
+                body = response.read()
+            self.add(name, (time.perf_counter() - start) * 1000)
+            return body
+        except (urllib.error.URLError, OSError):
+            self.add(name, 0, ok=False)
+            return None
+
+
+def multipart_upload(base_url, chapter_name, image_paths):
+    """Frontend jaisa body: pehle chaptersData, phir image_<id> files."""
+    boundary = uuid.uuid4().hex
+    images = [{"id": str(i), "name": os.path.basename(path), "size": os.path.getsize(path)}
+              for i, path in enumerate(image_paths)]
+    chapters_data = json.dumps({"chapters": [{"id": chapter_name, "name": chapter_name, "images": images,
+                                              "imageCount": len(images)}]})
+    parts = [f'--{boundary}\r\nContent-Disposition: form-data; name="chaptersData"\r\n\r\n'.encode()
+             + chapters_data.encode('utf-8') + b'\r\n']
+    for image, path in zip(images, image_paths):
+        with open(path, 'rb') as f:
+            parts.append(f'--{boundary}\r\nContent-Disposition: form-data; name="image_{image["id"]}"; '
+                         f'filename="{image["name"]}"\r\nContent-Type: image/jpeg\r\n\r\n'.encode() + f.read() + b'\r\n')
+    parts.append(f'--{boundary}--\r\n'.encode())
+    body = b''.join(parts)
+    request = urllib.request.Request(f"{base_url}/process-chapter", data=body, method='POST',
+                                     headers={'Content-Type': f'multipart/form-data; boundary={boundary}'})
+    with urllib.request.urlopen(request, timeout=120) as response:
+        return json.loads(response.read())['job_ids'][0]
+
+
+def follow_events(base_url, job_id, timeout=600):
+    """SSE stream padho; (first_question_ms, done_ms, final_type) relative to call time."""
+    start = time.perf_counter()
+    first_question = None
+    with urllib.request.urlopen(f"{base_url}/jobs/{job_id}/events", timeout=timeout) as response:
+        kind = None
+        for raw in response:
+            line = raw.decode('utf-8').rstrip('\n')
+            if line.startswith('event: '):
+                kind = line[len('event: '):]
+            elif line.startswith('data: '):
+                if kind == 'question' and first_question is None:
+                    first_question = (time.perf_counter() - start) * 1000
+                if kind in ('done', 'failed'):
+                    return first_question, (time.perf_counter() - start) * 1000, kind
+    return first_question, (time.perf_counter() - start) * 1000, 'disconnected'
+
+
+def upload_worker(base_url, queue, chapter_images, recorder, finished):
+    while True:
+        try:
+            chapter_name = queue.pop()
+        except IndexError:
+            return
+        start = time.perf_counter()
+        try:
+            job_id = multipart_upload(base_url, chapter_name, chapter_images[chapter_name])
+        except (urllib.error.URLError, OSError, KeyError, ValueError):
+            recorder.add('POST /process-chapter', 0, ok=False)
+            continue
+        upload_ms = (time.perf_counter() - start) * 1000
+        recorder.add('POST /process-chapter', upload_ms)
+        try:
+            first_question, done_ms, final = follow_events(base_url, job_id)
+        except (urllib.error.URLError, OSError):
+            recorder.add('job.end_to_end', 0, ok=False)
+            continue
+        if final != 'done':
+            recorder.add('job.end_to_end', 0, ok=False)
+            continue
+        if first_question is not None:
+            recorder.add('job.first_question', upload_ms + first_question)
+        recorder.add('job.end_to_end', upload_ms + done_ms)
+        finished.append(chapter_name)
+
+
+def reader_worker(base_url, finished, recorder, stop, seed):
+    rng = random.Random(seed)
+    while not stop.is_set():
+        recorder.timed_get('GET /get-chapters', f"{base_url}/get-chapters")
+        query = urllib.parse.quote(rng.choice(ENGLISH_WORDS))
+        recorder.timed_get('GET /search', f"{base_url}/search?q={query}")
+        if finished:
+            chapter = rng.choice(finished)
+            recorder.timed_get('GET /chapters/<n>/questions', f"{base_url}/chapters/{chapter}/questions?limit=20")
+            recorder.timed_get('GET /download-notes', f"{base_url}/download-notes/{chapter}")
+        time.sleep(rng.uniform(0.01, 0.05))
+
+
+def stage_breakdown(metrics_text):
+    """/metrics se notes_stage_seconds ka per-stage average (ms); worker label wali series jama hoti hain."""
+    sums, counts = {}, {}
+    for line in metrics_text.splitlines():
+        for suffix, target in (('_sum', sums), ('_count', counts)):
+            prefix = f"notes_stage_seconds{suffix}{{"
+            if line.startswith(prefix):
+                labels, value = line[len(prefix):].rsplit('} ', 1)
+                stage = labels.split('stage="', 1)[1].split('"', 1)[0]
+                target[stage] = target.get(stage, 0.0) + float(value)
+    return {stage: round(sums[stage] / counts[stage] * 1000, 2) for stage in sums if counts.get(stage)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--chapters', type=int, default=12, help='kitne chapters upload hon')
+    parser.add_argument('--concurrency', type=int, default=4, help='parallel upload workers')
+    parser.add_argument('--pages', type=int, default=4, help='images per chapter')
+    parser.add_argument('--readers', type=int, default=4, help='parallel read-route workers')
+    parser.add_argument('--model-latency', type=float, default=0.3, help='stub model latency per call (s)')
+    parser.add_argument('--questions-per-image', type=int, default=3)
+    parser.add_argument('--quick', action='store_true', help='4 chapters, 2 workers, 2 readers')
+    parser.add_argument('--output', help='results JSON path (default benchmarks/results/...)')
+    parser.add_argument('--compare', help='baseline results JSON')
+    parser.add_argument('--threshold', type=float, default=0.2, help='regression threshold (0.2 = 20%% slower)')
+    args = parser.parse_args()
+    if args.quick:
+        args.chapters, args.concurrency, args.readers = 4, 2, 2
+
+    workspace = enter_workspace()
+    try:
+        # Stub ke saath rate limit ka koi matlab nahi — throughput app ki apni hadd tak jaye
+        os.environ.setdefault('VISION_RATE_PER_MIN', '100000')
+        import app
+        from werkzeug.serving import make_server
+
+        logging.getLogger('werkzeug').setLevel(logging.WARNING)
+        backend = StubBackend(args.model_latency, args.questions_per_image)
+        app.model_gateway = app.ModelGateway(backend=backend)
+        app.warm_pdf_render_pool()
+        server = make_server('127.0.0.1', 0, app.app, threaded=True)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        base_url = f"http://127.0.0.1:{server.server_port}"
+
+        # Har chapter ki apni images — warna vision cache/coalescing model calls hi bacha leti hai
+        pages_dir = os.path.join(workspace, 'pages')
+        os.makedirs(pages_dir)
+        chapter_images = {f"load_chapter_{c:03d}": [
+            make_page_image(os.path.join(pages_dir, f"c{c}_page{i}.jpg"), seed=c * args.pages + i)
+            for i in range(args.pages)] for c in range(args.chapters)}
+        recorder = Recorder()
+        queue = sorted(chapter_images, reverse=True)
+        finished = []
+        stop = threading.Event()
+        readers = [threading.Thread(target=reader_worker, args=(base_url, finished, recorder, stop, i), daemon=True)
+                   for i in range(args.readers)]
+        uploaders = [threading.Thread(target=upload_worker, args=(base_url, queue, chapter_images, recorder, finished))
+                     for _ in range(args.concurrency)]
+        start = time.perf_counter()
+        for thread in readers + uploaders:
+            thread.start()
+        for thread in uploaders:
+            thread.join()
+        stop.set()
+        for thread in readers:
+            thread.join(timeout=30)
+        wall_s = time.perf_counter() - start
+
+        stages = stage_breakdown(recorder.timed_get('GET /metrics', f"{base_url}/metrics").decode('utf-8'))
+        model = app.model_gateway.metrics()
+        render = app.render_metrics()
+        server.shutdown()
+    finally:
+        leave_workspace(workspace)
+
+    results = {}
+    for name in sorted(set(recorder.timings) | set(recorder.errors)):
+        timings = recorder.timings.get(name, [])
+        entry = summarize(timings) if timings else {'runs': 0}
+        entry.update(p99_ms=round(percentile(sorted(timings), 99), 3), errors=recorder.errors.get(name, 0),
+                     rps=round(len(timings) / wall_s, 2))
+        results[name] = entry
+    results['throughput'] = {'chapters_done': len(finished), 'wall_s': round(wall_s, 2),
+                             'chapters_per_min': round(len(finished) / wall_s * 60, 2),
+                             'model_calls': backend.calls, 'model_retries': model['retries'],
+                             'pdf_renders': render['completed'], 'pdf_render_avg_ms': render['avg_ms']}
+    results['stages_avg_ms'] = stages
+
+    print(f"\n{'route':<32} {'n':>6} {'p50':>9} {'p95':>9} {'p99':>9} {'rps':>7} {'err':>5}")
+    for name, entry in results.items():
+        if 'median_ms' in entry:
+            print(f"{name:<32} {entry['runs']:>6} {entry['median_ms']:>9.1f} {entry['p95_ms']:>9.1f} "
+                  f"{entry['p99_ms']:>9.1f} {entry['rps']:>7.2f} {entry['errors']:>5}")
+        elif 'errors' in entry:
+            print(f"{name:<32} {0:>6} {'-':>9} {'-':>9} {'-':>9} {0:>7.2f} {entry['errors']:>5}")
+    print(f"\n{len(finished)}/{args.chapters} chapters in {wall_s:.1f}s, {backend.calls} model calls; stages (avg ms): {stages}")
+
+    params = {key: value for key, value in vars(args).items() if key not in ('output', 'compare')}
+    path = write_results('load', params, results, args.output)
+    print(f"results: {path}")
+    failed = len(finished) < args.chapters
+    if args.compare:
+        rows, regressions = compare_results(args.compare, results, args.threshold)
+        print_comparison(rows, regressions)
+        failed = failed or bool(regressions)
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,8 @@
+# Gunicorn settings — Dockerfile `gunicorn -c gunicorn.conf.py app:app` se load hoti hain.
+
+
+def post_worker_init(worker):
+    # Har worker apna PDF render pool garam kare aur adhoore jobs resume kare (job lock se
+    # ek job sirf ek worker chalata hai). Master mein ya import par ye kabhi start nahi hote.
+    import app
+    app.start_background_services()
@@ -98,46 +98,55 @@ class NotesManager {
             formData.append('chaptersData', JSON.stringify(chapterData));
             this.currentImages.forEach(img=>formData.append(`image_${img.id}`, img.file));
 
-            await this.simulateProcessing();
-
+            this.resetProgress();
             const resp = await fetch('/process-chapter', { method:'POST', body: formData });
             const result = await resp.json();
-            modal.classList.add('hidden');
             if(resp.ok){
+                for(const jobId of (result.job_ids || [])){
+                    const job = await this.waitForJob(jobId);
+                    if(job.status!=='done'){ throw new Error(job.error || 'Failed to process chapter'); }
+                }
+                modal.classList.add('hidden');
                 await this.loadSavedChapters();
                 this.clearCurrentChapter();
                 this.updateUI();
                 this.showSuccessModal();
                 this.showNotification(`Chapter "${chapterName}" processed successfully!`,'success');
             }else{
+                modal.classList.add('hidden');
                 this.showNotification(result.error || 'Failed to process chapter','error');
             }
         }catch(err){
             modal.classList.add('hidden');
             console.error(err);
-            this.showNotification('Failed to process chapter. Please try again.','error');
+            this.showNotification(err.message || 'Failed to process chapter. Please try again.','error');
         }
     }
 
-    async regenerateNotes(chapterName){
-        if(!confirm(`Regenerate notes for "${chapterName}"?`)) return;
+    // refresh=true => cached answers ignore karke har page model se dobara parhwao
+    async regenerateNotes(chapterName, refresh=false){
+        const question = refresh ? `Re-read every page of "${chapterName}" with the AI, ignoring cached answers?` : `Regenerate notes for "${chapterName}"?`;
+        if(!confirm(question)) return;
         const modal = document.getElementById('processModal'); modal.classList.remove('hidden'); this.currentChapterName = chapterName;
         try{
-            await this.simulateProcessing();
-            const resp = await fetch('/regenerate-notes',{method:'POST', headers:{'Content-Type':'application/json'}, body: JSON.stringify({chapter_name: chapterName})});
+            this.resetProgress();
+            const resp = await fetch('/regenerate-notes',{method:'POST', headers:{'Content-Type':'application/json'}, body: JSON.stringify({chapter_name: chapterName, refresh})});
             const result = await resp.json();
-            modal.classList.add('hidden');
             if(resp.ok){
+                const job = await this.waitForJob(result.job_id);
+                if(job.status!=='done'){ throw new Error(job.error || 'Failed to regenerate notes'); }
+                modal.classList.add('hidden');
                 this.showSuccessModal();
                 this.showNotification(`Notes regenerated for "${chapterName}"!`,'success');
                 await this.loadSavedChapters();
             }else{
+                modal.classList.add('hidden');
                 this.showNotification(result.error || 'Failed to regenerate notes','error');
             }
         }catch(err){
             modal.classList.add('hidden');
             console.error(err);
-            this.showNotification('Failed to regenerate notes. Please try again.','error');
+            this.showNotification(err.message || 'Failed to regenerate notes. Please try again.','error');
         }
     }
 
@@ -249,6 +258,9 @@ class NotesManager {
                     <button class="btn btn-regenerate" onclick="notesManager.regenerateNotes('${ch.name}')" title="Regenerate notes">
                         <i class="fas fa-redo"></i> Regenerate Notes
                     </button>
+                    <button class="btn btn-regenerate" onclick="notesManager.regenerateNotes('${ch.name}', true)" title="Ignore cached answers and re-read every page">
+                        <i class="fas fa-sync-alt"></i> Fresh
+                    </button>
                     ${ch.has_pdf ? `
                         <button class="btn btn-download" onclick="notesManager.downloadNotesFile('${ch.name}')" title="Download notes">
                             <i class="fas fa-download"></i> Download
@@ -264,31 +276,103 @@ class NotesManager {
         `).join('');
     }
 
-    async simulateProcessing(){
-        const steps = [
-            { id:'step1', text:'Analyzing Images...', duration:900 },
-            { id:'step2', text:'Processing Questions...', duration:1200 },
-            { id:'step3', text:'Generating Notes...', duration:1500 },
-            { id:'step4', text:'Finalizing...', duration:700 }
-        ];
+    // Backend job stages -> modal steps
+    static JOB_STEPS = {
+        queued:               { step:0, text:'Waiting in queue...' },
+        analyzing_images:     { step:1, text:'Analyzing Images...' },
+        processing_questions: { step:2, text:'Processing Questions...' },
+        generating_notes:     { step:3, text:'Generating Notes...' },
+        finalizing:           { step:4, text:'Finalizing...' },
+        done:                 { step:5, text:'Processing completed successfully!' }
+    };
+
+    resetProgress(){
+        document.getElementById('progressFill').style.width='0%';
+        document.getElementById('progressPercent').textContent='0%';
+        document.getElementById('processStatus').textContent='Uploading...';
+        document.querySelectorAll('.step').forEach(s=>{ s.classList.remove('active','completed'); s.querySelector('i').className='fas fa-circle'; });
+        document.getElementById('liveQuestions').innerHTML='';
+    }
+
+    addLiveQuestion(q){
+        const list = document.getElementById('liveQuestions');
+        const li = document.createElement('li');
+        const page = document.createElement('span');
+        page.textContent = q.page ? `p.${q.page}` : '•';
+        if(q.page){ li.dataset.page = q.page; }
+        li.appendChild(page);
+        li.appendChild(document.createTextNode(q.question));
+        list.appendChild(li);
+        list.scrollTop = list.scrollHeight;
+    }
+
+    showJobProgress(job){
+        const info = NotesManager.JOB_STEPS[job.stage];
+        if(!info) return;
+        document.getElementById('processStatus').textContent = info.text;
+        for(let i=1;i<=4;i++){
+            const stepEl = document.getElementById(`step${i}`);
+            stepEl.classList.remove('active','completed');
+            if(i<info.step){ stepEl.classList.add('completed'); stepEl.querySelector('i').className='fas fa-check-circle'; }
+            else if(i===info.step){ stepEl.classList.add('active'); stepEl.querySelector('i').className='fas fa-spinner fa-spin'; }
+            else{ stepEl.querySelector('i').className='fas fa-circle'; }
+        }
+    }
+
+    // Server-Sent Events: questions aate hi dikhao; EventSource na ho to polling
+    waitForJob(jobId){
+        if(!window.EventSource){ return this.pollJob(jobId); }
+        const progressFill = document.getElementById('progressFill');
+        const progressPercent = document.getElementById('progressPercent');
+        const status = document.getElementById('processStatus');
+        return new Promise((resolve, reject)=>{
+            const source = new EventSource(`/jobs/${encodeURIComponent(jobId)}/events`);
+            let questions = 0;
+            const finish = async ()=>{
+                source.close();
+                try{
+                    const resp = await fetch(`/jobs/${encodeURIComponent(jobId)}`);
+                    const job = await resp.json();
+                    if(!resp.ok){ throw new Error(job.error || 'Job not found'); }
+                    this.showJobProgress(job);
+                    await this.animateProgress(progressFill, progressPercent, job.progress || 0);
+                    resolve(job);
+                }catch(err){ reject(err); }
+            };
+            const on = (type, handler)=> source.addEventListener(type, e=> handler(JSON.parse(e.data)));
+            on('uploaded', d=>{ status.textContent = `Uploaded ${d.images} image(s)`; });
+            on('stage', d=>{ this.showJobProgress(d); this.animateProgress(progressFill, progressPercent, d.progress || 0); });
+            on('images_ready', d=>{ status.textContent = `Prepared ${d.prepared} image(s), ${d.cached} from cache`; });
+            on('encoded', d=>{ status.textContent = `Reading page(s) ${d.pages.join(', ')}...`; });
+            on('tokens', d=>{ status.textContent = `Receiving answers... ${d.tokens} tokens (${questions} questions so far)`; });
+            on('question', d=>{ questions++; this.addLiveQuestion(d); });
+            on('pages_reset', d=>{
+                // Kata hua jawab dobara maanga gaya — in pages ke purane live questions hatao
+                d.pages.forEach(p=> document.querySelectorAll(`#liveQuestions li[data-page="${p}"]`).forEach(li=>{ li.remove(); questions--; }));
+            });
+            on('questions_saved', d=>{ status.textContent = `${d.count} questions saved`; });
+            on('pdf_page', d=>{ status.textContent = `Rendering PDF page ${d.page}...`; });
+            on('done', finish);
+            on('failed', finish);
+            source.onerror = ()=>{
+                // Browser khud reconnect karta hai; band ho jaye to polling par aa jao
+                if(source.readyState===EventSource.CLOSED){ this.pollJob(jobId).then(resolve, reject); }
+            };
+        });
+    }
+
+    async pollJob(jobId, intervalMs=1500){
         const progressFill = document.getElementById('progressFill');
         const progressPercent = document.getElementById('progressPercent');
-        const statusText = document.getElementById('processStatus');
-
-        for(let i=0;i<steps.length;i++){
-            const step = steps[i];
-            const stepEl = document.getElementById(step.id);
-            statusText.textContent = step.text;
-            stepEl.classList.add('active');
-            stepEl.querySelector('i').className = 'fas fa-spinner fa-spin';
-            const target = ((i+1)/steps.length)*100;
-            await this.animateProgress(progressFill, progressPercent, target);
-            await new Promise(r=>setTimeout(r, step.duration));
-            stepEl.classList.remove('active');
-            stepEl.classList.add('completed');
-            stepEl.querySelector('i').className = 'fas fa-check-circle';
+        while(true){
+            const resp = await fetch(`/jobs/${encodeURIComponent(jobId)}`);
+            const job = await resp.json();
+            if(!resp.ok){ throw new Error(job.error || 'Job not found'); }
+            this.showJobProgress(job);
+            await this.animateProgress(progressFill, progressPercent, job.progress || 0);
+            if(job.status==='done' || job.status==='failed'){ return job; }
+            await new Promise(r=>setTimeout(r, intervalMs));
         }
-        statusText.textContent = 'Processing completed successfully!';
     }
 
     async animateProgress(el, textEl, target){
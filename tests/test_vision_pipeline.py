@@ -0,0 +1,243 @@
+"""Vision pipeline tests with a local fake model backend: chunk fan-out, page-order merge,
+concurrency limits, the tolerant question parser and the vision-cache write rules.
+
+    python -m pytest -q tests
+"""
+import base64
+import io
+import json
+import os
+import random
+import sys
+import threading
+import time
+from types import SimpleNamespace as NS
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+@pytest.fixture(scope='module')
+def app(tmp_path_factory):
+    workspace = tmp_path_factory.mktemp('workspace')
+    for name in ('fonts', 'templates', 'static'):
+        os.symlink(os.path.join(ROOT, name), workspace / name)
+    os.environ.pop('NOTES_DATA_DIR', None)
+    os.environ.update(OPENAI_API_KEY='test-not-used', PDF_RENDER_PROCESSES='0', PREPROCESS_ENABLED='0',
+                      VISION_CHUNK_SIZE='4', VISION_MAX_CONCURRENCY='2', VISION_RATE_PER_MIN='600000',
+                      LOG_LEVEL='WARNING')
+    cwd = os.getcwd()
+    os.chdir(workspace)
+    sys.path.insert(0, ROOT)
+    try:
+        import app as app_module
+        yield app_module
+    finally:
+        os.chdir(cwd)
+
+
+@pytest.fixture(autouse=True)
+def empty_vision_cache(app):
+    with app._vision_cache_conn() as conn:
+        conn.execute("DELETE FROM vision_cache")
+
+
+class FakeBackend:
+    """OpenAI-compatible fake: har image ke pixel se page number parhta hai aur us page ke
+    questions lautata hai. answer(pages) override karke jawab badla ja sakta hai."""
+
+    def __init__(self, questions_per_page=2, delay=0.0, answer=None, finish_reason='stop'):
+        self.questions_per_page = questions_per_page
+        self.delay = delay
+        self.answer = answer or self.default_answer
+        self.finish_reason = finish_reason
+        self.calls = []
+        self.active = self.max_active = 0
+        self.lock = threading.Lock()
+        self.chat = NS(completions=NS(create=self.create))
+
+    def default_answer(self, pages):
+        return {"questions": [{"image": position, "question": f"page {page} question {k}",
+                               "answer_en": "en", "answer_ur": "ur"}
+                              for position, page in enumerate(pages, 1) for k in range(self.questions_per_page)]}
+
+    def create(self, messages, stream=False, **kwargs):
+        from PIL import Image
+
+        with self.lock:
+            self.active += 1
+            self.max_active = max(self.max_active, self.active)
+        try:
+            pages = []
+            for part in messages[-1]['content']:
+                if part.get('type') == 'image_url':
+                    data = base64.b64decode(part['image_url']['url'].split(',', 1)[1])
+                    pages.append(Image.open(io.BytesIO(data)).convert('RGB').getpixel((0, 0))[0] // 10)
+            with self.lock:
+                self.calls.append(pages)
+            time.sleep(self.delay * random.random())
+            content = json.dumps(self.answer(pages))
+            return NS(choices=[NS(message=NS(content=content), finish_reason=self.finish_reason)], usage=None)
+        finally:
+            with self.lock:
+                self.active -= 1
+
+
+def make_chapter(app, name, pages, offset=0):
+    from PIL import Image
+
+    folder = os.path.join(app.CHAPTERS_DIR, name)
+    os.makedirs(folder, exist_ok=True)
+    for page in range(1, pages + 1):
+        # Pixel ka red channel = page number * 10 (offset se alag chapters ki alag bytes)
+        Image.new('RGB', (8, 8), ((page * 10) % 256, offset, 0)).save(os.path.join(folder, f"page{page}.png"))
+    return folder
+
+
+def merged_questions(output):
+    return [qa['question'] for qa in json.loads(output)['questions']]
+
+
+def cached_count(app):
+    with app._vision_cache_conn() as conn:
+        return conn.execute("SELECT COUNT(*) FROM vision_cache").fetchone()[0]
+
+
+# ---- Fan-out + merge ----
+
+def test_chunks_fan_out_and_merge_in_page_order(app):
+    folder = make_chapter(app, 'fanout', 10)
+    backend = FakeBackend(delay=0.05)
+    stats = {}
+    output = app.process_folder_images_batch(folder, vision_client=backend, stats=stats)
+
+    assert sorted(len(pages) for pages in backend.calls) == [2, 4, 4]
+    assert sorted(page for pages in backend.calls for page in pages) == list(range(1, 11))
+    assert merged_questions(output) == [f"page {page} question {k}" for page in range(1, 11) for k in range(2)]
+    assert stats['cache_misses'] == 10 and stats['cache_hits'] == 0
+
+
+def test_concurrency_never_exceeds_the_limit(app):
+    folder = make_chapter(app, 'limit', 16)
+    backend = FakeBackend(delay=0.1)
+    app.process_folder_images_batch(folder, vision_client=backend)
+    assert len(backend.calls) == 4
+    assert backend.max_active <= app.VISION_MAX_CONCURRENCY
+
+
+def test_shared_limits_are_global_across_instances(app, tmp_path):
+    # Do instances ek hi file par = do gunicorn workers
+    path = str(tmp_path / 'limits.sqlite3')
+    workers = [app.SharedVisionLimits(path, 2, 1000.0), app.SharedVisionLimits(path, 2, 1000.0)]
+    active, peak, lock = [0], [0], threading.Lock()
+
+    def call(limits):
+        with limits.slot():
+            limits.acquire_token()
+            with lock:
+                active[0] += 1
+                peak[0] = max(peak[0], active[0])
+            time.sleep(0.02)
+            with lock:
+                active[0] -= 1
+
+    threads = [threading.Thread(target=call, args=(workers[i % 2],)) for i in range(12)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert peak[0] == 2
+
+
+def test_model_errors_fail_the_chapter(app):
+    folder = make_chapter(app, 'failing', 2)
+
+    def broken(**kwargs):
+        raise ValueError("backend exploded")
+
+    backend = NS(chat=NS(completions=NS(create=broken)))
+    with pytest.raises(app.ModelGatewayError):
+        app.process_folder_images_batch(folder, vision_client=backend)
+
+
+# ---- QuestionStreamParser ----
+
+@pytest.mark.parametrize('raw, expected', [
+    ('{"questions": [{"question": "a"}, {"question": "b"}]}', ['a', 'b']),
+    ('[{"question": "a"}]', ['a']),
+    ('```json\n[{"question": "a"}, {"question": "b \\" [c"}]\n```', ['a', 'b " [c']),
+    ('{"items": [{"question": "a"}, {"question": "b"}]}', ['a', 'b']),
+    ('{"data": [{"question": "nested"}], "meta": [{"x": 1}]}', ['nested']),
+    ('{"note": "see [1]", "items": [{"question": "z"}]}', ['z']),
+    ('{"question": "Name [two] gases", "answer_en": "O2 and [N2]"}', ['Name [two] gases']),
+    ('{"question": "q", "parts": [{"x": 1}]}', ['q']),
+    ('{"questions": [{"question": "a"}, {"question": "b', ['a']),   # max_tokens par kata hua
+    ('not json at all', []),
+])
+def test_parser_cases(app, raw, expected):
+    assert [qa.get('question') for qa in app.parse_question_dicts(raw)] == expected
+
+
+def test_parser_streams_objects_as_they_complete(app):
+    parser = app.QuestionStreamParser()
+    text = '{"questions": [{"question": "a"}, {"question": "b"}]}'
+    seen = []
+    for position, char in enumerate(text):
+        for qa in parser.feed(char):
+            seen.append((qa['question'], position))
+    assert [question for question, _ in seen] == ['a', 'b']
+    assert seen[0][1] < text.index('"b"')   # pehla object stream khatam hone se pehle mila
+    assert parser.close() == []
+
+
+# ---- Vision cache write rules ----
+
+def test_attributed_chunk_is_cached_per_page(app):
+    folder = make_chapter(app, 'cached', 4, offset=1)
+    app.process_folder_images_batch(folder, vision_client=FakeBackend())
+    assert cached_count(app) == 4
+
+    backend = FakeBackend()
+    stats = {}
+    output = app.process_folder_images_batch(folder, vision_client=backend, stats=stats)
+    assert backend.calls == []
+    assert stats['cache_hits'] == 4
+    assert merged_questions(output) == [f"page {page} question {k}" for page in range(1, 5) for k in range(2)]
+
+
+def test_chunk_without_image_indexes_is_not_cached(app):
+    folder = make_chapter(app, 'unattributed', 4, offset=2)
+
+    def no_image(pages):
+        return {"questions": [{"question": f"page {page}"} for page in pages]}
+
+    output = app.process_folder_images_batch(folder, vision_client=FakeBackend(answer=no_image))
+    assert merged_questions(output) == [f"page {page}" for page in range(1, 5)]   # job ka output theek
+    assert cached_count(app) == 0
+
+
+def test_empty_page_from_multi_image_chunk_is_not_cached(app):
+    folder = make_chapter(app, 'empty_page', 4, offset=3)
+
+    def skip_second(pages):
+        return {"questions": [{"image": position, "question": f"page {page}"}
+                              for position, page in enumerate(pages, 1) if position != 2]}
+
+    app.process_folder_images_batch(folder, vision_client=FakeBackend(answer=skip_second))
+    assert cached_count(app) == 3
+
+
+def test_truncated_single_page_is_not_cached(app):
+    folder = make_chapter(app, 'truncated', 1, offset=4)
+    with pytest.raises(app.ModelGatewayError):
+        app.process_folder_images_batch(folder, vision_client=FakeBackend(finish_reason='length'))
+    assert cached_count(app) == 0
+
+
+def test_cache_key_changes_with_preprocess_settings(app, monkeypatch):
+    key = app.vision_cache_key('abc')
+    monkeypatch.setattr(app, 'PREPROCESS_ENABLED', True)
+    enabled_key = app.vision_cache_key('abc')
+    monkeypatch.setattr(app, 'PREPROCESS_QUALITY', app.PREPROCESS_QUALITY + 5)
+    assert len({key, enabled_key, app.vision_cache_key('abc')}) == 3